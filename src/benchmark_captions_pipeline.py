@@ -0,0 +1,147 @@
+import argparse
+import logging
+import os
+import random
+import time
+
+from utils.datasets import preprocess_caption, preprocess_captions
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Words with the casing, punctuation and whitespace of real captions
+synthetic_words = [
+    "A",
+    "man",
+    "riding",
+    "a",
+    "wave",
+    "on",
+    "top",
+    "of",
+    "surfboard.",
+    "Two",
+    "dogs",
+    "play",
+    "in",
+    "the",
+    "snow,",
+    "while",
+    "child's",
+    "kite",
+    "flies",
+    "!",
+    "3",
+    "café",
+    "(blue)",
+    "  ",
+    "\t",
+]
+
+
+def write_synthetic_captions(texts_path: str, num_captions: int, seed: int) -> None:
+    # A Flickr style token file, one image#index<TAB>caption line per caption
+    random.seed(seed)
+    with open(texts_path, "w") as file:
+        for index in range(num_captions):
+            caption = " ".join(
+                random.choice(synthetic_words) for _ in range(random.randint(5, 20))
+            )
+            file.write(f"{index // 5}.jpg#{index % 5}\t{caption}\n")
+
+
+def benchmark(
+    texts_path: str, num_captions: int, num_workers: int, chunk_size: int, seed: int
+) -> None:
+    """Compares the pre-processing of a large synthetic captions file one caption at
+    a time with preprocess_captions, in this process and in a pool of workers, and
+    checks that all the results are identical.
+
+    Args:
+        texts_path: Where to write the synthetic captions, reused if it exists.
+        num_captions: How many captions to generate.
+        num_workers: The number of worker processes.
+        chunk_size: How many captions a worker pre-processes at once.
+        seed: The random seed.
+
+    Returns:
+        None
+
+    """
+    if not os.path.isfile(texts_path):
+        write_synthetic_captions(texts_path, num_captions, seed)
+    with open(texts_path) as file:
+        captions = [line.split("\t")[1] for line in file]
+    logger.info(f"Pre-processing {len(captions)} captions...")
+
+    start = time.perf_counter()
+    expected = [preprocess_caption(caption) for caption in captions]
+    baseline = time.perf_counter() - start
+    logger.info(f"One caption at a time: {baseline:.2f} s")
+
+    for workers in sorted({1, num_workers}):
+        start = time.perf_counter()
+        processed = preprocess_captions(captions, workers, chunk_size)
+        elapsed = time.perf_counter() - start
+        if processed != expected:
+            raise ValueError("Wrong pre-processing, the captions differ!")
+        logger.info(
+            f"preprocess_captions with {workers} workers: {elapsed:.2f} s "
+            f"({baseline / elapsed:.1f}x)"
+        )
+
+
+def main():
+    # Without the main sentinel, the code would be executed even if the script were
+    # imported as a module.
+    args = parse_args()
+    benchmark(
+        args.texts_path,
+        args.num_captions,
+        args.num_workers,
+        args.chunk_size,
+        args.seed,
+    )
+
+
+def parse_args():
+    """Parse command line arguments.
+
+    Returns:
+        Arguments
+
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the batch caption pre-processing."
+    )
+    parser.add_argument(
+        "--texts_path",
+        type=str,
+        default="data/synthetic_captions.txt",
+        help="Where to write the synthetic captions.",
+    )
+    parser.add_argument(
+        "--num_captions",
+        type=int,
+        default=1000000,
+        help="How many synthetic captions to generate.",
+    )
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=os.cpu_count(),
+        help="The number of worker processes.",
+    )
+    parser.add_argument(
+        "--chunk_size",
+        type=int,
+        default=10000,
+        help="How many captions a worker pre-processes at once.",
+    )
+    parser.add_argument("--seed", type=int, default=42, help="The random seed.")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
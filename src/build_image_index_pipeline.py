@@ -0,0 +1,159 @@
+import tensorflow as tf
+import argparse
+import logging
+from tqdm import tqdm
+import os
+import absl.logging
+
+from multi_hop_attention.hyperparameters import YParams
+from multi_hop_attention.loaders import ImageLoader
+from multi_hop_attention.models import ImageTower
+from retrieval.image_index import ImageIndex
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"
+tf.logging.set_verbosity(tf.logging.ERROR)
+
+# https://github.com/abseil/abseil-py/issues/99
+absl.logging.set_verbosity("info")
+absl.logging.set_stderrthreshold("info")
+
+
+def build(
+    hparams_path: str,
+    images_dir: str,
+    index_dir: str,
+    batch_size: int,
+    prefetch_size: int,
+    checkpoint_path: str,
+    image_encoder: str,
+) -> None:
+    """Embeds the images of a directory and appends them to an image index. Images
+    which are already in the index are not embedded again.
+
+    Args:
+        hparams_path: The path to the hyperparameters yaml file.
+        images_dir: The directory with the images, searched recursively.
+        index_dir: The directory of the index.
+        batch_size: The batch size to be used.
+        prefetch_size: How many batches to prefetch.
+        checkpoint_path: Path to a valid model checkpoint.
+        image_encoder: The CNN used to encode the images.
+
+    Returns:
+        None
+
+    """
+    hparams = YParams(hparams_path)
+    index = ImageIndex(index_dir, hparams.joint_space * hparams.attn_hops)
+    pending = index.get_pending(ImageIndex.list_images(images_dir))
+    if len(pending) == 0:
+        logger.info("The index is up to date...")
+        return
+
+    # Resetting the default graph and setting the random seed
+    tf.reset_default_graph()
+    tf.set_random_seed(hparams.seed)
+
+    loader = ImageLoader(
+        [fingerprint.path for fingerprint in pending], batch_size, prefetch_size
+    )
+    images = loader.get_next()
+    logger.info("Loader created...")
+
+    tower = ImageTower(
+        images,
+        hparams.joint_space,
+        hparams.attn_size,
+        hparams.attn_hops,
+        image_encoder,
+    )
+    logger.info("Image tower created...")
+    logger.info("Indexing is starting...")
+
+    with tf.Session() as sess:
+
+        # Initializers
+        tower.init(sess, checkpoint_path)
+        begin = 0
+        try:
+            with tqdm(total=len(pending)) as pbar:
+                while True:
+                    embedded_images = sess.run(tower.attended_images)
+                    end = begin + embedded_images.shape[0]
+                    index.append(pending[begin:end], embedded_images)
+                    begin = end
+                    pbar.update(embedded_images.shape[0])
+        except tf.errors.OutOfRangeError:
+            pass
+
+    logger.info(f"The index has {len(index.path_to_entry)} images")
+
+
+def main():
+    # Without the main sentinel, the code would be executed even if the script were
+    # imported as a module.
+    args = parse_args()
+    build(
+        args.hparams_path,
+        args.images_dir,
+        args.index_dir,
+        args.batch_size,
+        args.prefetch_size,
+        args.checkpoint_path,
+        args.image_encoder,
+    )
+
+
+def parse_args():
+    """Parse command line arguments.
+
+    Returns:
+        Arguments
+
+    """
+    parser = argparse.ArgumentParser(
+        description="Builds or updates an index with the embeddings of the images in "
+        "a directory."
+    )
+    parser.add_argument(
+        "--hparams_path",
+        type=str,
+        default="hyperparameters/default_hparams.yaml",
+        help="Path to an hyperparameters yaml file.",
+    )
+    parser.add_argument(
+        "--images_dir",
+        type=str,
+        default="data/Flickr8k_dataset/Flickr8k_Dataset",
+        help="The directory with the images, searched recursively.",
+    )
+    parser.add_argument(
+        "--index_dir",
+        type=str,
+        default="models/image_index",
+        help="The directory of the index.",
+    )
+    parser.add_argument(
+        "--checkpoint_path", type=str, default=None, help="Path to a model checkpoint."
+    )
+    parser.add_argument(
+        "--batch_size", type=int, default=64, help="The size of the batch."
+    )
+    parser.add_argument(
+        "--prefetch_size", type=int, default=5, help="The size of prefetch on gpu."
+    )
+    parser.add_argument(
+        "--image_encoder",
+        type=str,
+        default="resnet152",
+        choices=["resnet152", "resnet50", "mobilenet"],
+        help="The CNN used to encode the images.",
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
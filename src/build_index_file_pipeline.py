@@ -0,0 +1,137 @@
+import argparse
+import logging
+import os
+import numpy as np
+
+from retrieval.categories import CategoryIndex, get_category_index_path
+from retrieval.index_file import IndexFile
+from retrieval.quantizers import BaseQuantizer
+from utils.embeddings import EmbeddingStore
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def build(
+    store_dir: str, index_path: str, model_id: str, quantizer_path: str, append: bool
+) -> None:
+    """Writes the image embeddings of an embedding store to a memory mapped index
+    file, or appends the images that the index file does not have yet. If the store
+    has categories, the posting lists of the categories are written next to the
+    index file.
+
+    Args:
+        store_dir: The embedding store exported with export_embeddings_pipeline.py.
+        index_path: The index file.
+        model_id: Identifies the model that embedded the images.
+        quantizer_path: An index built with build_quantized_index_pipeline.py, whose
+        quantizer encodes the embeddings. If None the embeddings are not quantized.
+        append: Whether to append to an existing index file.
+
+    Returns:
+        None
+
+    """
+    store = EmbeddingStore(store_dir)
+    image_paths, first_rows, _ = store.get_unique_images()
+    embeddings = np.asarray(store.embedded_images[first_rows], dtype=np.float32)
+    categories = (
+        [store.categories[row] for row in first_rows]
+        if store.categories is not None
+        else None
+    )
+    category_index_path = get_category_index_path(index_path)
+    if append and os.path.exists(index_path):
+        index = IndexFile(index_path)
+        known_paths = set(index.get_paths())
+        new_rows = [
+            row for row, path in enumerate(image_paths) if path not in known_paths
+        ]
+        if index.quantizer_name:
+            embeddings = index.get_quantizer().encode(embeddings[new_rows])
+        else:
+            embeddings = embeddings[new_rows]
+        first_id = int(index.ids.max()) + 1 if index.count > 0 else 0
+        IndexFile.append(
+            index_path,
+            embeddings,
+            np.arange(first_id, first_id + len(new_rows)),
+            [image_paths[row] for row in new_rows],
+            model_id,
+        )
+        if categories is not None:
+            CategoryIndex.load(category_index_path).append(
+                [categories[row] for row in new_rows]
+            ).save(category_index_path)
+    else:
+        quantizer = None
+        if quantizer_path is not None:
+            quantizer = BaseQuantizer.load(quantizer_path)
+            embeddings = quantizer.encode(embeddings)
+        IndexFile.write(
+            index_path,
+            embeddings,
+            np.arange(len(image_paths)),
+            image_paths,
+            model_id,
+            quantizer,
+        )
+        if categories is not None:
+            CategoryIndex.from_categories(categories).save(category_index_path)
+    logger.info(f"The index has {IndexFile(index_path).count} images")
+
+
+def main():
+    # Without the main sentinel, the code would be executed even if the script were
+    # imported as a module.
+    args = parse_args()
+    build(
+        args.store_dir, args.index_path, args.model_id, args.quantizer_path, args.append
+    )
+
+
+def parse_args():
+    """Parse command line arguments.
+
+    Returns:
+        Arguments
+
+    """
+    parser = argparse.ArgumentParser(
+        description="Writes exported image embeddings to a memory mapped index file."
+    )
+    parser.add_argument(
+        "--store_dir",
+        type=str,
+        default="models/embeddings/test",
+        help="Where the exported embeddings are.",
+    )
+    parser.add_argument(
+        "--index_path",
+        type=str,
+        default="models/image_index.bin",
+        help="Where the index file is.",
+    )
+    parser.add_argument(
+        "--model_id",
+        type=str,
+        default="",
+        help="Identifies the model that embedded the images, e.g. its checkpoint.",
+    )
+    parser.add_argument(
+        "--quantizer_path",
+        type=str,
+        default=None,
+        help="A quantized index whose quantizer encodes the embeddings.",
+    )
+    parser.add_argument(
+        "--append",
+        action="store_true",
+        help="Append the new images to an existing index file.",
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
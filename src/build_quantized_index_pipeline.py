@@ -0,0 +1,148 @@
+import argparse
+import logging
+import numpy as np
+
+from retrieval.quantizers import BaseQuantizer, ProductQuantizer, ScalarQuantizer
+from utils.constants import inference_for_recall_at
+from utils.datasets import get_image_offsets
+from utils.embeddings import EmbeddingStore
+from utils.evaluators import Evaluator
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def build(
+    store_dir: str,
+    index_path: str,
+    quantizer_name: str,
+    num_subspaces: int,
+    num_iters: int,
+    train_size: int,
+    seed: int,
+) -> None:
+    """Builds a quantized index of the image embeddings of an embedding store and
+    reports how much the text to image recall at K drops compared to the exact
+    ranking of the Evaluator.
+
+    Args:
+        store_dir: The embedding store exported with export_embeddings_pipeline.py.
+        index_path: Where to save the index.
+        quantizer_name: Either scalar or product.
+        num_subspaces: The number of subspaces of the product quantizer.
+        num_iters: The number of k-means iterations of the product quantizer.
+        train_size: How many image embeddings to train the quantizer on.
+        seed: The random seed.
+
+    Returns:
+        None
+
+    """
+    store = EmbeddingStore(store_dir)
+    _, first_rows, groups = store.get_unique_images()
+    gallery = np.asarray(store.embedded_images[first_rows])
+    logger.info(f"Indexing {gallery.shape[0]} images...")
+
+    if quantizer_name == "scalar":
+        quantizer: BaseQuantizer = ScalarQuantizer()
+    elif quantizer_name == "product":
+        quantizer = ProductQuantizer(num_subspaces, num_iters=num_iters, seed=seed)
+    else:
+        raise ValueError("Wrong quantizer name!")
+    random_state = np.random.RandomState(seed)
+    train_rows = random_state.choice(
+        gallery.shape[0], min(train_size, gallery.shape[0]), replace=False
+    )
+    quantizer.fit(gallery[train_rows])
+    quantizer.add(gallery)
+    quantizer.save(index_path)
+    logger.info(
+        f"Index saved to {index_path}: {quantizer.codes.nbytes} bytes instead of "
+        f"{gallery.astype(np.float32).nbytes}"
+    )
+
+    evaluator = Evaluator(
+        len(store.image_paths), store.dim, get_image_offsets(store.image_paths)
+    )
+    evaluator.update_embeddings(store.embedded_images, store.embedded_captions)
+    retrieved, _ = quantizer.search(
+        np.asarray(store.embedded_captions), max(inference_for_recall_at)
+    )
+    for recall_at in inference_for_recall_at:
+        exact = evaluator.text2image_recall_at_k(recall_at)
+        quantized = evaluator.recall_at_k_from_retrieved(retrieved, groups, recall_at)
+        logger.info(
+            f"The text2image recall at {recall_at} is: {quantized} quantized vs "
+            f"{exact} exact (loss: {exact - quantized})"
+        )
+
+
+def main():
+    # Without the main sentinel, the code would be executed even if the script were
+    # imported as a module.
+    args = parse_args()
+    build(
+        args.store_dir,
+        args.index_path,
+        args.quantizer_name,
+        args.num_subspaces,
+        args.num_iters,
+        args.train_size,
+        args.seed,
+    )
+
+
+def parse_args():
+    """Parse command line arguments.
+
+    Returns:
+        Arguments
+
+    """
+    parser = argparse.ArgumentParser(
+        description="Builds a quantized index of exported image embeddings."
+    )
+    parser.add_argument(
+        "--store_dir",
+        type=str,
+        default="models/embeddings/test",
+        help="Where the exported embeddings are.",
+    )
+    parser.add_argument(
+        "--index_path",
+        type=str,
+        default="models/quantized_index.npz",
+        help="Where to save the index.",
+    )
+    parser.add_argument(
+        "--quantizer_name",
+        type=str,
+        default="product",
+        choices=["scalar", "product"],
+        help="How to quantize the embeddings.",
+    )
+    parser.add_argument(
+        "--num_subspaces",
+        type=int,
+        default=64,
+        help="The number of subspaces (bytes per image) of the product quantizer.",
+    )
+    parser.add_argument(
+        "--num_iters",
+        type=int,
+        default=20,
+        help="The number of k-means iterations of the product quantizer.",
+    )
+    parser.add_argument(
+        "--train_size",
+        type=int,
+        default=100000,
+        help="How many image embeddings to train the quantizer on.",
+    )
+    parser.add_argument("--seed", type=int, default=42, help="The random seed.")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import argparse
+import logging
+from typing import List
+
+from utils.datasets import FlickrDataset, PascalSentencesDataset
+from utils.word_vectors import WordVectors
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def get_captions(dataset_name: str, texts_path: str) -> List[str]:
+    """Returns all pre-processed captions of the dataset.
+
+    Args:
+        dataset_name: Either flickr or pascal.
+        texts_path: Path to the captions of the dataset.
+
+    Returns:
+        The captions.
+
+    """
+    if dataset_name == "flickr":
+        img_path_caption = FlickrDataset.parse_captions_filenames(texts_path)
+        return [
+            caption for captions in img_path_caption.values() for caption in captions
+        ]
+    elif dataset_name == "pascal":
+        category_image_path_captions = PascalSentencesDataset.parse_captions_filenames(
+            texts_path, ""
+        )
+        return [
+            caption
+            for image_path_captions in category_image_path_captions.values()
+            for captions in image_path_captions.values()
+            for caption in captions
+        ]
+    else:
+        raise ValueError("Wrong dataset name!")
+
+
+def build(
+    dataset_name: str,
+    texts_path: str,
+    glove_path: str,
+    word_vectors_dir: str,
+    min_count: int,
+) -> None:
+    """Builds the vocabulary of a dataset and the memory mapped word vectors used by
+    the word_vectors text encoder.
+
+    Args:
+        dataset_name: Either flickr or pascal.
+        texts_path: Path to the captions of the dataset.
+        glove_path: Path to word vectors in the GloVe text format.
+        word_vectors_dir: Where to write the word vectors.
+        min_count: The minimum times a word has to appear to be in the vocabulary.
+
+    Returns:
+        None
+
+    """
+    captions = get_captions(dataset_name, texts_path)
+    logger.info(f"Building the vocabulary from {len(captions)} captions...")
+    WordVectors.build(glove_path, captions, word_vectors_dir, min_count)
+    logger.info(f"Word vectors written to {word_vectors_dir}")
+
+
+def main():
+    # Without the main sentinel, the code would be executed even if the script were
+    # imported as a module.
+    args = parse_args()
+    build(
+        args.dataset_name,
+        args.texts_path,
+        args.glove_path,
+        args.word_vectors_dir,
+        args.min_count,
+    )
+
+
+def parse_args():
+    """Parse command line arguments.
+
+    Returns:
+        Arguments
+
+    """
+    parser = argparse.ArgumentParser(
+        description="Builds memory mapped word vectors for the captions vocabulary."
+    )
+    parser.add_argument(
+        "--dataset_name",
+        type=str,
+        default="flickr",
+        choices=["flickr", "pascal"],
+        help="The dataset whose captions build the vocabulary.",
+    )
+    parser.add_argument(
+        "--texts_path",
+        type=str,
+        default="data/Flickr8k_dataset/Flickr8k_text/Flickr8k.token.txt",
+        help="Path to the captions of the dataset.",
+    )
+    parser.add_argument(
+        "--glove_path",
+        type=str,
+        default="data/glove.840B.300d.txt",
+        help="Path to word vectors in the GloVe text format.",
+    )
+    parser.add_argument(
+        "--word_vectors_dir",
+        type=str,
+        default="models/word_vectors",
+        help="Where to write the word vectors.",
+    )
+    parser.add_argument(
+        "--min_count",
+        type=int,
+        default=1,
+        help="The minimum times a word has to appear to be in the vocabulary.",
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
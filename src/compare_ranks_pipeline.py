@@ -0,0 +1,105 @@
+import argparse
+import logging
+
+from utils.constants import (
+    bootstrap_confidence,
+    bootstrap_num_resamples,
+    inference_for_recall_at,
+)
+from utils.evaluators import Evaluator
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def compare(
+    ranks_path_a: str, ranks_path_b: str, num_resamples: int, confidence: float
+) -> None:
+    """Compares the recalls of two models from the ranks saved by the inference
+    pipelines on the same test set, with bootstrap confidence intervals and a paired
+    bootstrap test.
+
+    Args:
+        ranks_path_a: The ranks of the first model.
+        ranks_path_b: The ranks of the second model.
+        num_resamples: The number of bootstrap resamples.
+        confidence: The confidence level of the intervals.
+
+    Returns:
+        None
+
+    """
+    ranks_a = Evaluator.load_ranks(ranks_path_a)
+    ranks_b = Evaluator.load_ranks(ranks_path_b)
+    for direction in ["image2text", "text2image"]:
+        if len(ranks_a[direction]) != len(ranks_b[direction]):
+            raise ValueError("Wrong ranks, the models were tested on different sets!")
+        for recall_at in inference_for_recall_at:
+            for name, ranks in [("first", ranks_a), ("second", ranks_b)]:
+                recall, low, high = Evaluator.bootstrap_recall_at_k(
+                    ranks[direction], recall_at, num_resamples, confidence
+                )
+                logger.info(
+                    f"The {direction} recall at {recall_at} of the {name} model is: "
+                    f"{recall} [{low}, {high}]"
+                )
+            difference, low, high, p_value = Evaluator.paired_bootstrap_test(
+                ranks_a[direction],
+                ranks_b[direction],
+                recall_at,
+                num_resamples,
+                confidence,
+            )
+            logger.info(
+                f"The {direction} recall at {recall_at} difference is: {difference} "
+                f"[{low}, {high}], p-value: {p_value}"
+            )
+
+
+def main():
+    # Without the main sentinel, the code would be executed even if the script were
+    # imported as a module.
+    args = parse_args()
+    compare(args.ranks_path_a, args.ranks_path_b, args.num_resamples, args.confidence)
+
+
+def parse_args():
+    """Parse command line arguments.
+
+    Returns:
+        Arguments
+
+    """
+    parser = argparse.ArgumentParser(
+        description="Compares the recalls of two models on the same test set."
+    )
+    parser.add_argument(
+        "--ranks_path_a",
+        type=str,
+        default="models/ranks_a.npz",
+        help="The ranks of the first model, saved by an inference pipeline.",
+    )
+    parser.add_argument(
+        "--ranks_path_b",
+        type=str,
+        default="models/ranks_b.npz",
+        help="The ranks of the second model, saved by an inference pipeline.",
+    )
+    parser.add_argument(
+        "--num_resamples",
+        type=int,
+        default=bootstrap_num_resamples,
+        help="The number of bootstrap resamples.",
+    )
+    parser.add_argument(
+        "--confidence",
+        type=float,
+        default=bootstrap_confidence,
+        help="The confidence level of the intervals.",
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,423 @@
+import tensorflow as tf
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import absl.logging
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from utils.datasets import PascalSentencesDataset, get_image_offsets
+from multi_hop_attention.hyperparameters import YParams
+from multi_hop_attention.loaders import CachedFeaturesLoader, ImageLoader
+from multi_hop_attention.models import FeatureExtractor, MultiHopAttentionModel
+from utils.constants import HEIGHT, SMALLEST_SIDE, WIDTH, inference_for_recall_at
+from utils.evaluators import Evaluator
+from utils.word_vectors import WordVectors
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"
+tf.logging.set_verbosity(tf.logging.ERROR)
+
+# https://github.com/abseil/abseil-py/issues/99
+absl.logging.set_verbosity("info")
+absl.logging.set_stderrthreshold("info")
+
+
+def cache_features(
+    image_paths: List[str],
+    features_path: str,
+    image_encoder: str,
+    batch_size: int,
+    prefetch_size: int,
+) -> np.ndarray:
+    """Computes the feature maps of the frozen image encoder once and keeps them in a
+    .npy file, together with a .json file of the encoder, the pre-processing and the
+    image paths they belong to. The features are reused as long as all of these are
+    the same.
+
+    Args:
+        image_paths: The unique image paths.
+        features_path: Where to cache the features (.npy).
+        image_encoder: The frozen CNN used to encode the images.
+        batch_size: The batch size.
+        prefetch_size: How many batches to prefetch.
+
+    Returns:
+        The memory mapped features with shape [num_images, H, W, C].
+
+    """
+    metadata_path = features_path + ".json"
+    metadata = {
+        "image_encoder": image_encoder,
+        # The center crop of ImageLoader after BaseLoader.decode_image
+        "smallest_side": SMALLEST_SIDE,
+        "crop": [WIDTH, HEIGHT],
+        "image_paths": image_paths,
+    }
+    if os.path.isfile(features_path) and os.path.isfile(metadata_path):
+        with open(metadata_path) as file:
+            if json.load(file) == metadata:
+                logger.info(f"Reusing the features cached in {features_path}")
+                return np.load(features_path, mmap_mode="r")
+        os.remove(metadata_path)
+
+    tf.reset_default_graph()
+    loader = ImageLoader(image_paths, batch_size, prefetch_size)
+    extractor = FeatureExtractor(loader.get_next(), image_encoder)
+    # Written under temporary names, so interrupted features are never reused
+    features = open_memmap(
+        features_path + ".tmp.npy",
+        "w+",
+        np.float16,
+        (len(image_paths), *extractor.features.shape[1:].as_list()),
+    )
+    with tf.Session() as sess:
+        extractor.init(sess)
+        num_done = 0
+        try:
+            while True:
+                batch = sess.run(extractor.features)
+                features[num_done : num_done + batch.shape[0]] = batch
+                num_done += batch.shape[0]
+                logger.info(f"{num_done}/{len(image_paths)} images encoded...")
+        except tf.errors.OutOfRangeError:
+            pass
+    features.flush()
+    del features
+    os.replace(features_path + ".tmp.npy", features_path)
+    with open(metadata_path + ".tmp", "w") as file:
+        json.dump(metadata, file)
+    os.replace(metadata_path + ".tmp", metadata_path)
+    logger.info(f"Features cached in {features_path}")
+
+    return np.load(features_path, mmap_mode="r")
+
+
+def get_rows(
+    image_captions: List[List[str]], image_indices: np.ndarray
+) -> Tuple[List[int], List[str]]:
+    # The image index and the caption of every caption of the images
+    rows = [
+        (image_index, caption)
+        for image_index in image_indices
+        for caption in image_captions[image_index]
+    ]
+
+    return [image_index for image_index, _ in rows], [caption for _, caption in rows]
+
+
+def train_fold(task: Dict[str, Any]) -> Dict[str, Dict[int, float]]:
+    """Trains a model on the training images of a fold for a fixed number of epochs
+    and evaluates it on the held out images, in a worker process with its own share
+    of the CPU budget. The held out images are only seen after the last epoch, so
+    that they do not select the model they evaluate.
+
+    Args:
+        task: The fold, its data and the training options, see cross_validate.
+
+    Returns:
+        The image2text and text2image recalls at K on the held out images, after the
+        last epoch.
+
+    """
+    hparams = YParams(task["hparams_path"])
+    np.random.seed(hparams.seed + task["fold"])
+    features = np.load(task["features_path"], mmap_mode="r")
+    train_indices, train_captions = task["train_rows"]
+    val_indices, val_captions = task["val_rows"]
+    evaluator_val = Evaluator(
+        len(val_indices),
+        hparams.joint_space * hparams.attn_hops,
+        get_image_offsets(val_indices),
+    )
+
+    tf.reset_default_graph()
+    tf.set_random_seed(hparams.seed)
+    loader = CachedFeaturesLoader(
+        features,
+        train_indices,
+        train_captions,
+        val_indices,
+        val_captions,
+        task["batch_size"],
+        task["prefetch_size"],
+    )
+    images, captions, captions_lengths = loader.get_next()
+    decay_steps = task["decay_rate_epochs"] * len(train_indices) / task["batch_size"]
+    word_vectors = (
+        WordVectors(task["word_vectors_dir"])
+        if task["text_encoder"] == "word_vectors"
+        else None
+    )
+    model = MultiHopAttentionModel(
+        images,
+        captions,
+        captions_lengths,
+        hparams.margin,
+        hparams.joint_space,
+        hparams.num_layers,
+        hparams.attn_size,
+        hparams.attn_hops,
+        hparams.learning_rate,
+        hparams.gradient_clip_val,
+        decay_steps,
+        task["batch_hard"],
+        image_encoder="cached",
+        text_encoder=task["text_encoder"],
+        word_vectors=word_vectors,
+    )
+    config = tf.ConfigProto(
+        intra_op_parallelism_threads=task["num_threads"],
+        inter_op_parallelism_threads=task["num_threads"],
+    )
+    with tf.Session(config=config) as sess:
+        model.init(sess)
+        for e in range(task["epochs"]):
+            sess.run(loader.train_init)
+            try:
+                while True:
+                    sess.run(
+                        model.optimize,
+                        feed_dict={
+                            model.frob_norm_pen: hparams.frob_norm_pen,
+                            model.keep_prob: hparams.keep_prob,
+                            model.weight_decay: hparams.weight_decay,
+                        },
+                    )
+            except tf.errors.OutOfRangeError:
+                pass
+            logger.info(f"Fold {task['fold']}, epoch {e + 1} done...")
+
+        sess.run(loader.val_init)
+        try:
+            while True:
+                loss, embedded_images, embedded_captions = sess.run(
+                    [model.loss, model.attended_images, model.attended_captions]
+                )
+                evaluator_val.update_metrics(loss)
+                evaluator_val.update_embeddings(embedded_images, embedded_captions)
+        except tf.errors.OutOfRangeError:
+            pass
+
+    return {
+        "image2text": {
+            recall_at: evaluator_val.image2text_recall_at_k(recall_at)
+            for recall_at in inference_for_recall_at
+        },
+        "text2image": {
+            recall_at: evaluator_val.text2image_recall_at_k(recall_at)
+            for recall_at in inference_for_recall_at
+        },
+    }
+
+
+def cross_validate(
+    hparams_path: str,
+    images_path: str,
+    texts_path: str,
+    features_path: str,
+    num_folds: int,
+    epochs: int,
+    batch_size: int,
+    prefetch_size: int,
+    decay_rate_epochs: int,
+    batch_hard: bool,
+    image_encoder: str,
+    text_encoder: str,
+    word_vectors_dir: str,
+    cpu_budget: int,
+    threads_per_fold: int,
+) -> None:
+    """K-fold cross-validation on the Pascal sentences dataset. The dataset is
+    parsed once and the feature maps of the frozen image encoder are computed once
+    and shared by all the folds, which train concurrently within a CPU budget.
+
+    Args:
+        hparams_path: The path to the hyperparameters yaml file.
+        images_path: A path where all the images are located.
+        texts_path: Path where the text doc with the descriptions is.
+        features_path: Where to cache the feature maps of the images.
+        num_folds: The number of folds.
+        epochs: The number of epochs to train every fold, fixed so that the held out
+        images are not used to select the epoch.
+        batch_size: The batch size to be used.
+        prefetch_size: How many batches to prefetch.
+        decay_rate_epochs: When to decay the learning rate.
+        batch_hard: Whether to train only on the hardest negatives.
+        image_encoder: The frozen CNN used to encode the images.
+        text_encoder: How the words are embedded before the Bi-GRU.
+        word_vectors_dir: Where the word vectors for the word_vectors encoder are.
+        cpu_budget: How many CPU threads all the folds may use together.
+        threads_per_fold: How many CPU threads every fold uses.
+
+    Returns:
+        None
+
+    """
+    dataset = PascalSentencesDataset(images_path, texts_path)
+    logger.info("Dataset created...")
+    cache_features(
+        dataset.image_paths, features_path, image_encoder, batch_size, prefetch_size
+    )
+    tasks = []
+    for fold in range(num_folds):
+        train_indices, val_indices = dataset.get_fold_indices(num_folds, fold)
+        tasks.append(
+            {
+                "fold": fold,
+                "hparams_path": hparams_path,
+                "features_path": features_path,
+                "train_rows": get_rows(dataset.image_captions, train_indices),
+                "val_rows": get_rows(dataset.image_captions, val_indices),
+                "epochs": epochs,
+                "batch_size": batch_size,
+                "prefetch_size": prefetch_size,
+                "decay_rate_epochs": decay_rate_epochs,
+                "batch_hard": batch_hard,
+                "text_encoder": text_encoder,
+                "word_vectors_dir": word_vectors_dir,
+                "num_threads": threads_per_fold,
+            }
+        )
+    num_parallel = max(1, min(num_folds, cpu_budget // threads_per_fold))
+    logger.info(f"Training {num_folds} folds, {num_parallel} at a time...")
+    # A fresh process per fold, so that every fold starts from an empty graph
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(num_parallel, maxtasksperchild=1) as pool:
+        folds_recalls = pool.map(train_fold, tasks, chunksize=1)
+
+    for direction in ["image2text", "text2image"]:
+        for recall_at_k in inference_for_recall_at:
+            recalls = [
+                fold_recalls[direction][recall_at_k] for fold_recalls in folds_recalls
+            ]
+            logger.info(
+                f"The {direction} recall at {recall_at_k} is: {np.mean(recalls)} "
+                f"(std {np.std(recalls)}, folds {recalls})"
+            )
+
+
+def main():
+    # Without the main sentinel, the code would be executed even if the script were
+    # imported as a module.
+    args = parse_args()
+    cross_validate(
+        args.hparams_path,
+        args.images_path,
+        args.texts_path,
+        args.features_path,
+        args.num_folds,
+        args.epochs,
+        args.batch_size,
+        args.prefetch_size,
+        args.decay_rate_epochs,
+        args.batch_hard,
+        args.image_encoder,
+        args.text_encoder,
+        args.word_vectors_dir,
+        args.cpu_budget,
+        args.threads_per_fold,
+    )
+
+
+def parse_args():
+    """Parse command line arguments.
+
+    Returns:
+        Arguments
+
+    """
+    parser = argparse.ArgumentParser(
+        description="K-fold cross-validation on the Pascal sentences dataset."
+    )
+    parser.add_argument(
+        "--hparams_path",
+        type=str,
+        default="hyperparameters/default_hparams.yaml",
+        help="Path to a hyperparameters yaml file.",
+    )
+    parser.add_argument(
+        "--images_path",
+        type=str,
+        default="data/Pascal_sentences_dataset/dataset",
+        help="Path where all images are.",
+    )
+    parser.add_argument(
+        "--texts_path",
+        type=str,
+        default="data/Pascal_sentences_dataset/sentence",
+        help="Path to the file where the image to caption mappings are.",
+    )
+    parser.add_argument(
+        "--features_path",
+        type=str,
+        default="models/pascal_features.npy",
+        help="Where to cache the feature maps of the images.",
+    )
+    parser.add_argument("--num_folds", type=int, default=5, help="The number of folds.")
+    parser.add_argument(
+        "--epochs",
+        type=int,
+        default=5,
+        help="The number of epochs to train every fold.",
+    )
+    parser.add_argument(
+        "--batch_size", type=int, default=64, help="The size of the batch."
+    )
+    parser.add_argument(
+        "--prefetch_size", type=int, default=5, help="The size of prefetch on gpu."
+    )
+    parser.add_argument(
+        "--decay_rate_epochs",
+        type=int,
+        default=4,
+        help="When to decay the learning rate.",
+    )
+    parser.add_argument(
+        "--batch_hard",
+        action="store_true",
+        help="Whether to train only on the hardest negatives.",
+    )
+    parser.add_argument(
+        "--image_encoder",
+        type=str,
+        default="resnet152",
+        choices=["resnet152", "resnet50"],
+        help="The frozen CNN used to encode the images.",
+    )
+    parser.add_argument(
+        "--text_encoder",
+        type=str,
+        default="elmo",
+        choices=["elmo", "gru", "word_vectors"],
+        help="How the words are embedded before the Bi-GRU.",
+    )
+    parser.add_argument(
+        "--word_vectors_dir",
+        type=str,
+        default="models/word_vectors",
+        help="Where the word vectors for the word_vectors text encoder are.",
+    )
+    parser.add_argument(
+        "--cpu_budget",
+        type=int,
+        default=os.cpu_count(),
+        help="How many CPU threads all the folds may use together.",
+    )
+    parser.add_argument(
+        "--threads_per_fold",
+        type=int,
+        default=4,
+        help="How many CPU threads every fold uses.",
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
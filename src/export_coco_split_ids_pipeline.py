@@ -0,0 +1,77 @@
+import argparse
+import json
+import logging
+import os
+from typing import List
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def export(karpathy_json_path: str, output_dir: str, splits: List[str]) -> None:
+    """Writes the image ids of the Karpathy COCO splits, one file per split with one
+    id per line, for the --val_ids_path and --test_ids_path of the COCO pipelines.
+    The val and test splits are 5000 images each of captions_val2014.json.
+
+    Args:
+        karpathy_json_path: The dataset_coco.json file of the Karpathy splits.
+        output_dir: Where to write the split_ids.txt files.
+        splits: Which splits to write.
+
+    Returns:
+        None
+
+    """
+    with open(karpathy_json_path) as file:
+        images = json.load(file)["images"]
+    os.makedirs(output_dir, exist_ok=True)
+    for split in splits:
+        image_ids = [image["cocoid"] for image in images if image["split"] == split]
+        ids_path = os.path.join(output_dir, f"{split}_ids.txt")
+        with open(ids_path, "w") as file:
+            file.write("".join(f"{image_id}\n" for image_id in image_ids))
+        logger.info(f"{len(image_ids)} {split} image ids written to {ids_path}")
+
+
+def main():
+    # Without the main sentinel, the code would be executed even if the script were
+    # imported as a module.
+    args = parse_args()
+    export(args.karpathy_json_path, args.output_dir, args.splits)
+
+
+def parse_args():
+    """Parse command line arguments.
+
+    Returns:
+        Arguments
+
+    """
+    parser = argparse.ArgumentParser(
+        description="Writes the image ids of the Karpathy COCO splits."
+    )
+    parser.add_argument(
+        "--karpathy_json_path",
+        type=str,
+        default="data/coco/dataset_coco.json",
+        help="The dataset_coco.json file of the Karpathy splits.",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        default="data/coco/splits",
+        help="Where to write the image ids.",
+    )
+    parser.add_argument(
+        "--splits",
+        type=str,
+        nargs="+",
+        default=["val", "test"],
+        help="Which splits to write.",
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+import tensorflow as tf
+import argparse
+import logging
+from tqdm import tqdm
+import os
+import absl.logging
+
+from utils.datasets import FlickrDataset, PascalSentencesDataset
+from multi_hop_attention.hyperparameters import YParams
+from multi_hop_attention.loaders import InferenceLoader
+from multi_hop_attention.models import MultiHopAttentionModel
+from utils.embeddings import EmbeddingStore
+from utils.evaluators import Evaluator
+from utils.word_vectors import WordVectors
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"
+tf.logging.set_verbosity(tf.logging.ERROR)
+
+# https://github.com/abseil/abseil-py/issues/99
+absl.logging.set_verbosity("info")
+absl.logging.set_stderrthreshold("info")
+
+
+def export(
+    hparams_path: str,
+    dataset_name: str,
+    images_path: str,
+    texts_path: str,
+    imgs_file_path: str,
+    data_type: str,
+    batch_size: int,
+    prefetch_size: int,
+    checkpoint_path: str,
+    image_encoder: str,
+    text_encoder: str,
+    word_vectors_dir: str,
+    store_dir: str,
+    shard_index: int = 0,
+    num_shards: int = 1,
+) -> None:
+    """Embeds the images and captions of a dataset split with a trained model and
+    writes them in an embedding store, together with the Pascal categories.
+
+    Args:
+        hparams_path: The path to the hyperparameters yaml file.
+        dataset_name: Either flickr or pascal.
+        images_path: A path where all the images are located.
+        texts_path: Path where the captions are.
+        imgs_file_path: Path to a file with the image names of the Flickr split.
+        data_type: The Pascal sentences split (train, val or test).
+        batch_size: The batch size to be used.
+        prefetch_size: How many batches to prefetch.
+        checkpoint_path: Path to a valid model checkpoint.
+        image_encoder: The CNN used to encode the images.
+        text_encoder: How the words are embedded before the Bi-GRU.
+        word_vectors_dir: Where the word vectors for the word_vectors encoder are.
+        store_dir: Where to write the embedding store.
+        shard_index: Which shard of the images to embed, with one process per shard.
+        num_shards: The number of shards, see check_shard in utils.datasets.
+
+    Returns:
+        None
+
+    """
+    hparams = YParams(hparams_path)
+    categories = None
+    if dataset_name == "flickr":
+        dataset = FlickrDataset(
+            images_path, texts_path, shard_index=shard_index, num_shards=num_shards
+        )
+        image_paths, captions = dataset.get_data(imgs_file_path)
+    elif dataset_name == "pascal":
+        dataset = PascalSentencesDataset(
+            images_path, texts_path, shard_index=shard_index, num_shards=num_shards
+        )
+        image_indices = dataset.split_indices[data_type]
+        image_paths, captions = dataset.get_data_from_indices(image_indices)
+        categories = dataset.get_categories_from_indices(image_indices)
+    else:
+        raise ValueError("Wrong dataset name!")
+    logger.info("Dataset created...")
+    evaluator = Evaluator(len(image_paths), hparams.joint_space * hparams.attn_hops)
+
+    # Resetting the default graph and setting the random seed
+    tf.reset_default_graph()
+    tf.set_random_seed(hparams.seed)
+
+    loader = InferenceLoader(image_paths, captions, batch_size, prefetch_size)
+    images, captions_words, captions_lengths = loader.get_next()
+    logger.info("Loader created...")
+
+    word_vectors = (
+        WordVectors(word_vectors_dir) if text_encoder == "word_vectors" else None
+    )
+    model = MultiHopAttentionModel(
+        images,
+        captions_words,
+        captions_lengths,
+        hparams.margin,
+        hparams.joint_space,
+        hparams.num_layers,
+        hparams.attn_size,
+        hparams.attn_hops,
+        image_encoder=image_encoder,
+        text_encoder=text_encoder,
+        word_vectors=word_vectors,
+    )
+    logger.info("Model created...")
+    logger.info("Export is starting...")
+
+    with tf.Session() as sess:
+
+        # Initializers
+        model.init(sess, checkpoint_path)
+        try:
+            with tqdm(total=len(image_paths)) as pbar:
+                while True:
+                    lengths, embedded_images, embedded_captions = sess.run(
+                        [
+                            model.captions_len,
+                            model.attended_images,
+                            model.attended_captions,
+                        ]
+                    )
+                    evaluator.update_embeddings(embedded_images, embedded_captions)
+                    pbar.update(len(lengths))
+        except tf.errors.OutOfRangeError:
+            pass
+
+    EmbeddingStore.save(
+        store_dir,
+        image_paths,
+        captions,
+        evaluator.embedded_images,
+        evaluator.embedded_captions,
+        categories,
+    )
+    logger.info(f"Embeddings written to {store_dir}")
+
+
+def main():
+    # Without the main sentinel, the code would be executed even if the script were
+    # imported as a module.
+    args = parse_args()
+    export(
+        args.hparams_path,
+        args.dataset_name,
+        args.images_path,
+        args.texts_path,
+        args.imgs_file_path,
+        args.data_type,
+        args.batch_size,
+        args.prefetch_size,
+        args.checkpoint_path,
+        args.image_encoder,
+        args.text_encoder,
+        args.word_vectors_dir,
+        args.store_dir,
+        args.shard_index,
+        args.num_shards,
+    )
+
+
+def parse_args():
+    """Parse command line arguments.
+
+    Returns:
+        Arguments
+
+    """
+    parser = argparse.ArgumentParser(
+        description="Exports the embeddings of a trained model for a dataset split."
+    )
+    parser.add_argument(
+        "--hparams_path",
+        type=str,
+        default="hyperparameters/default_hparams.yaml",
+        help="Path to an hyperparameters yaml file.",
+    )
+    parser.add_argument(
+        "--dataset_name",
+        type=str,
+        default="flickr",
+        choices=["flickr", "pascal"],
+        help="The dataset to embed.",
+    )
+    parser.add_argument(
+        "--images_path",
+        type=str,
+        default="data/Flickr8k_dataset/Flickr8k_Dataset",
+        help="Path where all images are.",
+    )
+    parser.add_argument(
+        "--texts_path",
+        type=str,
+        default="data/Flickr8k_dataset/Flickr8k_text/Flickr8k.token.txt",
+        help="Path where the captions are.",
+    )
+    parser.add_argument(
+        "--imgs_file_path",
+        type=str,
+        default="data/Flickr8k_dataset/Flickr8k_text/Flickr_8k.trainImages.txt",
+        help="Path to the file with the image names of the Flickr split.",
+    )
+    parser.add_argument(
+        "--data_type",
+        type=str,
+        default="train",
+        choices=["train", "val", "test"],
+        help="The Pascal sentences split.",
+    )
+    parser.add_argument(
+        "--checkpoint_path", type=str, default=None, help="Path to a model checkpoint."
+    )
+    parser.add_argument(
+        "--batch_size", type=int, default=64, help="The size of the batch."
+    )
+    parser.add_argument(
+        "--prefetch_size", type=int, default=5, help="The size of prefetch on gpu."
+    )
+    parser.add_argument(
+        "--image_encoder",
+        type=str,
+        default="resnet152",
+        choices=["resnet152", "resnet50", "mobilenet"],
+        help="The CNN used to encode the images.",
+    )
+    parser.add_argument(
+        "--text_encoder",
+        type=str,
+        default="elmo",
+        choices=["elmo", "gru", "word_vectors"],
+        help="How the words are embedded before the Bi-GRU.",
+    )
+    parser.add_argument(
+        "--word_vectors_dir",
+        type=str,
+        default="models/word_vectors",
+        help="Where the word vectors for the word_vectors text encoder are.",
+    )
+    parser.add_argument(
+        "--store_dir",
+        type=str,
+        default="models/embeddings/train",
+        help="Where to write the embeddings.",
+    )
+    parser.add_argument(
+        "--shard_index",
+        type=int,
+        default=0,
+        help="Which shard of the images to embed.",
+    )
+    parser.add_argument(
+        "--num_shards",
+        type=int,
+        default=1,
+        help="The number of shards, each embedded by its own process.",
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,7 @@ def optimize(
     num_iters: int,
     hparams_path: str,
     trials_path: str,
+    cache_path: str,
 ) -> None:
     """Searches for the best hyperparameters based on the validation recall at K score
     and dumps them as a yaml file.
@@ -35,6 +36,7 @@ def optimize(
         num_iters: How many times to do random sampling.
         hparams_path: Where to dump the hparams.
         trials_path: Read/write the trials object.
+        cache_path: Where to cache the parsed dataset, if anywhere.
 
     Returns:
         None
@@ -49,6 +51,7 @@ def optimize(
         prefetch_size,
         epochs,
         recall_at,
+        cache_path,
     )
     hparams_finder.find_best(num_iters, hparams_path, trials_path)
 
@@ -69,6 +72,7 @@ def main():
         args.num_iters,
         args.hparams_path,
         args.trials_path,
+        args.cache_path,
     )
 
 
@@ -139,6 +143,12 @@ def parse_args():
         default="trials/experiment.pkl",
         help="From where to read or where to dump the trials object.",
     )
+    parser.add_argument(
+        "--cache_path",
+        type=str,
+        default=None,
+        help="Where to cache the parsed captions and splits.",
+    )
     return parser.parse_args()
 
 
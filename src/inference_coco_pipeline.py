@@ -0,0 +1,296 @@
+import tensorflow as tf
+import argparse
+import logging
+from tqdm import tqdm
+import os
+import absl.logging
+import numpy as np
+
+from utils.datasets import ValCocoDataset, get_image_offsets
+from multi_hop_attention.hyperparameters import YParams
+from multi_hop_attention.loaders import InferenceLoader
+from multi_hop_attention.models import MultiHopAttentionModel
+from utils.evaluators import Evaluator
+from utils.word_vectors import WordVectors
+from utils.constants import (
+    bootstrap_confidence,
+    bootstrap_num_resamples,
+    coco_fold_size,
+    inference_for_recall_at,
+    two_stage_num_candidates,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"
+tf.logging.set_verbosity(tf.logging.ERROR)
+
+# https://github.com/abseil/abseil-py/issues/99
+absl.logging.set_verbosity("info")
+absl.logging.set_stderrthreshold("info")
+
+
+def inference(
+    hparams_path: str,
+    images_path: str,
+    json_path: str,
+    test_size: int,
+    batch_size: int,
+    prefetch_size: int,
+    checkpoint_path: str,
+    image_encoder: str,
+    text_encoder: str,
+    word_vectors_dir: str,
+    two_stage: bool,
+    ranks_path: str,
+    test_ids_path: str = None,
+) -> None:
+    """Performs inference on the Microsoft COCO test set, and reports the recalls
+    on the whole set (5K) and averaged over its folds of 1000 images (1K).
+
+    Args:
+        hparams_path: The path to the hyperparameters yaml file.
+        images_path: A path where all the images are located.
+        json_path: Path to the json file with the captions.
+        test_size: How many images of the json file to test on.
+        batch_size: The batch size to be used.
+        prefetch_size: How many batches to prefetch.
+        checkpoint_path: Path to a valid model checkpoint.
+        image_encoder: The CNN used to encode the images.
+        text_encoder: How the words are embedded before the Bi-GRU.
+        word_vectors_dir: Where the word vectors for the word_vectors encoder are.
+        two_stage: Whether to also report the recall and latency of two-stage
+        retrieval.
+        ranks_path: Where to save the ranks of the test queries, to compare models
+        with compare_ranks_pipeline.py.
+        test_ids_path: The ids of the test images, e.g. the Karpathy 5K test split.
+        Without them the first test_size images of the json file are tested on.
+
+    Returns:
+        None
+
+    """
+    hparams = YParams(hparams_path)
+    test_image_paths, test_captions = ValCocoDataset(
+        images_path, json_path, test_size, image_ids_path=test_ids_path
+    ).get_data()
+    logger.info("Test dataset created...")
+    evaluator_test = Evaluator(
+        len(test_image_paths),
+        hparams.joint_space * hparams.attn_hops,
+        get_image_offsets(test_image_paths),
+    )
+
+    logger.info("Test evaluator created...")
+
+    # Resetting the default graph and setting the random seed
+    tf.reset_default_graph()
+    tf.set_random_seed(hparams.seed)
+
+    loader = InferenceLoader(test_image_paths, test_captions, batch_size, prefetch_size)
+    images, captions, captions_lengths = loader.get_next()
+    logger.info("Loader created...")
+
+    word_vectors = (
+        WordVectors(word_vectors_dir) if text_encoder == "word_vectors" else None
+    )
+    model = MultiHopAttentionModel(
+        images,
+        captions,
+        captions_lengths,
+        hparams.margin,
+        hparams.joint_space,
+        hparams.num_layers,
+        hparams.attn_size,
+        hparams.attn_hops,
+        image_encoder=image_encoder,
+        text_encoder=text_encoder,
+        word_vectors=word_vectors,
+    )
+    logger.info("Model created...")
+    logger.info("Inference is starting...")
+
+    with tf.Session() as sess:
+
+        # Initializers
+        model.init(sess, checkpoint_path)
+        try:
+            with tqdm(total=len(test_image_paths)) as pbar:
+                while True:
+                    loss, lengths, embedded_images, embedded_captions = sess.run(
+                        [
+                            model.loss,
+                            model.captions_len,
+                            model.attended_images,
+                            model.attended_captions,
+                        ]
+                    )
+                    evaluator_test.update_metrics(loss)
+                    evaluator_test.update_embeddings(embedded_images, embedded_captions)
+                    pbar.update(len(lengths))
+        except tf.errors.OutOfRangeError:
+            pass
+
+        # The 5K recalls and the 1K recalls come from the same embeddings
+        folds_recalls = evaluator_test.folds_recall_at_k(
+            inference_for_recall_at, coco_fold_size
+        )
+        for recall_at in inference_for_recall_at:
+            logger.info(
+                f"The image2text recall at {recall_at} is: "
+                f"{evaluator_test.image2text_recall_at_k(recall_at)} (5K), "
+                f"{np.mean(folds_recalls['image2text'][recall_at])} (1K)"
+            )
+
+        for recall_at in inference_for_recall_at:
+            logger.info(
+                f"The text2image recall at {recall_at} is: "
+                f"{evaluator_test.text2image_recall_at_k(recall_at)} (5K), "
+                f"{np.mean(folds_recalls['text2image'][recall_at])} (1K)"
+            )
+
+        for direction in ["image2text", "text2image"]:
+            for recall_at in inference_for_recall_at:
+                _, low, high = Evaluator.bootstrap_recall_at_k(
+                    evaluator_test.get_ranks(direction),
+                    recall_at,
+                    bootstrap_num_resamples,
+                    bootstrap_confidence,
+                )
+                logger.info(
+                    f"The {bootstrap_confidence} confidence interval of the "
+                    f"{direction} recall at {recall_at} is: [{low}, {high}]"
+                )
+        if ranks_path is not None:
+            evaluator_test.save_ranks(ranks_path)
+            logger.info(f"Ranks saved to {ranks_path}")
+
+        if two_stage:
+            for num_candidates in two_stage_num_candidates:
+                for recall_at in inference_for_recall_at:
+                    recall, latency = evaluator_test.image2text_two_stage_recall_at_k(
+                        recall_at, num_candidates, hparams.attn_hops
+                    )
+                    logger.info(
+                        f"The two-stage image2text recall at {recall_at} with "
+                        f"{num_candidates} candidates is: {recall} ({latency:.3f} ms "
+                        f"per query)"
+                    )
+                for recall_at in inference_for_recall_at:
+                    recall, latency = evaluator_test.text2image_two_stage_recall_at_k(
+                        recall_at, num_candidates, hparams.attn_hops
+                    )
+                    logger.info(
+                        f"The two-stage text2image recall at {recall_at} with "
+                        f"{num_candidates} candidates is: {recall} ({latency:.3f} ms "
+                        f"per query)"
+                    )
+
+
+def main():
+    # Without the main sentinel, the code would be executed even if the script were
+    # imported as a module.
+    args = parse_args()
+    inference(
+        args.hparams_path,
+        args.images_path,
+        args.json_path,
+        args.test_size,
+        args.batch_size,
+        args.prefetch_size,
+        args.checkpoint_path,
+        args.image_encoder,
+        args.text_encoder,
+        args.word_vectors_dir,
+        args.two_stage,
+        args.ranks_path,
+        args.test_ids_path,
+    )
+
+
+def parse_args():
+    """Parse command line arguments.
+
+    Returns:
+        Arguments
+
+    """
+    parser = argparse.ArgumentParser(
+        "Performs inference on the Microsoft COCO dataset."
+    )
+    parser.add_argument(
+        "--hparams_path",
+        type=str,
+        default="hyperparameters/default_hparams.yaml",
+        help="Path to an hyperparameters yaml file.",
+    )
+    parser.add_argument(
+        "--images_path",
+        type=str,
+        default="data/coco/val2014",
+        help="Path where all images are.",
+    )
+    parser.add_argument(
+        "--json_path",
+        type=str,
+        default="data/coco/annotations/captions_val2014.json",
+        help="Path to the json file with the captions.",
+    )
+    parser.add_argument(
+        "--test_size",
+        type=int,
+        default=5000,
+        help="How many images to test on.",
+    )
+    parser.add_argument(
+        "--test_ids_path",
+        type=str,
+        default=None,
+        help="The test image ids, see export_coco_split_ids_pipeline.py.",
+    )
+    parser.add_argument(
+        "--checkpoint_path", type=str, default=None, help="Path to a model checkpoint."
+    )
+    parser.add_argument(
+        "--batch_size", type=int, default=64, help="The size of the batch."
+    )
+    parser.add_argument(
+        "--prefetch_size", type=int, default=5, help="The size of prefetch on gpu."
+    )
+    parser.add_argument(
+        "--image_encoder",
+        type=str,
+        default="resnet152",
+        choices=["resnet152", "resnet50", "mobilenet"],
+        help="The CNN used to encode the images.",
+    )
+    parser.add_argument(
+        "--text_encoder",
+        type=str,
+        default="elmo",
+        choices=["elmo", "gru", "word_vectors"],
+        help="How the words are embedded before the Bi-GRU.",
+    )
+    parser.add_argument(
+        "--word_vectors_dir",
+        type=str,
+        default="models/word_vectors",
+        help="Where the word vectors for the word_vectors text encoder are.",
+    )
+    parser.add_argument(
+        "--two_stage",
+        action="store_true",
+        help="Also report the recall and latency of two-stage retrieval.",
+    )
+    parser.add_argument(
+        "--ranks_path",
+        type=str,
+        default=None,
+        help="Where to save the ranks of the test queries.",
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
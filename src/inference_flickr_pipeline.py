@@ -5,12 +5,18 @@ from tqdm import tqdm
 import os
 import absl.logging
 
-from utils.datasets import FlickrDataset
+from utils.datasets import FlickrDataset, get_image_offsets
 from multi_hop_attention.hyperparameters import YParams
 from multi_hop_attention.loaders import InferenceLoader
 from multi_hop_attention.models import MultiHopAttentionModel
 from utils.evaluators import Evaluator
-from utils.constants import inference_for_recall_at
+from utils.word_vectors import WordVectors
+from utils.constants import (
+    bootstrap_confidence,
+    bootstrap_num_resamples,
+    inference_for_recall_at,
+    two_stage_num_candidates,
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -30,6 +36,12 @@ def inference(
     batch_size: int,
     prefetch_size: int,
     checkpoint_path: str,
+    image_encoder: str,
+    text_encoder: str,
+    word_vectors_dir: str,
+    two_stage: bool,
+    ranks_path: str,
+    cache_path: str,
 ) -> None:
     """Performs inference on the Flickr8k test set.
 
@@ -41,18 +53,28 @@ def inference(
         batch_size: The batch size to be used.
         prefetch_size: How many batches to prefetch.
         checkpoint_path: Path to a valid model checkpoint.
+        image_encoder: The CNN used to encode the images.
+        text_encoder: How the words are embedded before the Bi-GRU.
+        word_vectors_dir: Where the word vectors for the word_vectors encoder are.
+        two_stage: Whether to also report the recall and latency of two-stage
+        retrieval.
+        ranks_path: Where to save the ranks of the test queries, to compare models
+        with compare_ranks_pipeline.py.
+        cache_path: Where to cache the parsed dataset, if anywhere.
 
     Returns:
         None
 
     """
     hparams = YParams(hparams_path)
-    dataset = FlickrDataset(images_path, texts_path)
+    dataset = FlickrDataset(images_path, texts_path, cache_path)
     # Getting the vocabulary size of the train dataset
     test_image_paths, test_captions = dataset.get_data(test_imgs_file_path)
     logger.info("Test dataset created...")
     evaluator_test = Evaluator(
-        len(test_image_paths), hparams.joint_space * hparams.attn_hops
+        len(test_image_paths),
+        hparams.joint_space * hparams.attn_hops,
+        get_image_offsets(test_image_paths),
     )
 
     logger.info("Test evaluator created...")
@@ -65,6 +87,9 @@ def inference(
     images, captions, captions_lengths = loader.get_next()
     logger.info("Loader created...")
 
+    word_vectors = (
+        WordVectors(word_vectors_dir) if text_encoder == "word_vectors" else None
+    )
     model = MultiHopAttentionModel(
         images,
         captions,
@@ -74,6 +99,9 @@ def inference(
         hparams.num_layers,
         hparams.attn_size,
         hparams.attn_hops,
+        image_encoder=image_encoder,
+        text_encoder=text_encoder,
+        word_vectors=word_vectors,
     )
     logger.info("Model created...")
     logger.info("Inference is starting...")
@@ -111,6 +139,43 @@ def inference(
                 f"{evaluator_test.text2image_recall_at_k(recall_at)}"
             )
 
+        for direction in ["image2text", "text2image"]:
+            for recall_at in inference_for_recall_at:
+                _, low, high = Evaluator.bootstrap_recall_at_k(
+                    evaluator_test.get_ranks(direction),
+                    recall_at,
+                    bootstrap_num_resamples,
+                    bootstrap_confidence,
+                )
+                logger.info(
+                    f"The {bootstrap_confidence} confidence interval of the "
+                    f"{direction} recall at {recall_at} is: [{low}, {high}]"
+                )
+        if ranks_path is not None:
+            evaluator_test.save_ranks(ranks_path)
+            logger.info(f"Ranks saved to {ranks_path}")
+
+        if two_stage:
+            for num_candidates in two_stage_num_candidates:
+                for recall_at in inference_for_recall_at:
+                    recall, latency = evaluator_test.image2text_two_stage_recall_at_k(
+                        recall_at, num_candidates, hparams.attn_hops
+                    )
+                    logger.info(
+                        f"The two-stage image2text recall at {recall_at} with "
+                        f"{num_candidates} candidates is: {recall} ({latency:.3f} ms "
+                        f"per query)"
+                    )
+                for recall_at in inference_for_recall_at:
+                    recall, latency = evaluator_test.text2image_two_stage_recall_at_k(
+                        recall_at, num_candidates, hparams.attn_hops
+                    )
+                    logger.info(
+                        f"The two-stage text2image recall at {recall_at} with "
+                        f"{num_candidates} candidates is: {recall} ({latency:.3f} ms "
+                        f"per query)"
+                    )
+
 
 def main():
     # Without the main sentinel, the code would be executed even if the script were
@@ -124,6 +189,12 @@ def main():
         args.batch_size,
         args.prefetch_size,
         args.checkpoint_path,
+        args.image_encoder,
+        args.text_encoder,
+        args.word_vectors_dir,
+        args.two_stage,
+        args.ranks_path,
+        args.cache_path,
     )
 
 
@@ -171,6 +242,43 @@ def parse_args():
     parser.add_argument(
         "--prefetch_size", type=int, default=5, help="The size of prefetch on gpu."
     )
+    parser.add_argument(
+        "--image_encoder",
+        type=str,
+        default="resnet152",
+        choices=["resnet152", "resnet50", "mobilenet"],
+        help="The CNN used to encode the images.",
+    )
+    parser.add_argument(
+        "--text_encoder",
+        type=str,
+        default="elmo",
+        choices=["elmo", "gru", "word_vectors"],
+        help="How the words are embedded before the Bi-GRU.",
+    )
+    parser.add_argument(
+        "--word_vectors_dir",
+        type=str,
+        default="models/word_vectors",
+        help="Where the word vectors for the word_vectors text encoder are.",
+    )
+    parser.add_argument(
+        "--two_stage",
+        action="store_true",
+        help="Also report the recall and latency of two-stage retrieval.",
+    )
+    parser.add_argument(
+        "--ranks_path",
+        type=str,
+        default=None,
+        help="Where to save the ranks of the test queries.",
+    )
+    parser.add_argument(
+        "--cache_path",
+        type=str,
+        default=None,
+        help="Where to cache the parsed captions and splits.",
+    )
 
     return parser.parse_args()
 
@@ -0,0 +1,121 @@
+import argparse
+import json
+import logging
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import Request, urlopen
+
+import numpy as np
+
+from utils.datasets import FlickrDataset
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def send_query(url: str, caption: str, k: int) -> float:
+    """Sends a text to image query and returns its latency in milliseconds."""
+    request = Request(
+        url + "/text2image",
+        data=json.dumps({"caption": caption, "k": k}).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    start = time.perf_counter()
+    with urlopen(request) as response:
+        response.read()
+
+    return (time.perf_counter() - start) * 1000
+
+
+def load_test(
+    url: str, texts_path: str, num_requests: int, concurrency: int, k: int, seed: int
+) -> None:
+    """Sends text to image queries from concurrent clients to a retrieval server and
+    reports the throughput and the latency percentiles.
+
+    Args:
+        url: The url of the server.
+        texts_path: Path to the Flickr captions used as queries.
+        num_requests: How many queries to send.
+        concurrency: How many clients send queries at the same time.
+        k: How many results to ask for.
+        seed: The random seed used to sample the captions.
+
+    Returns:
+        None
+
+    """
+    img_path_caption = FlickrDataset.parse_captions_filenames(texts_path)
+    captions = [
+        caption for captions in img_path_caption.values() for caption in captions
+    ]
+    random.seed(seed)
+    queries = [random.choice(captions) for _ in range(num_requests)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = np.array(
+            list(executor.map(lambda caption: send_query(url, caption, k), queries))
+        )
+    elapsed = time.perf_counter() - start
+    logger.info(f"Sent {num_requests} queries with {concurrency} clients")
+    logger.info(f"Throughput: {num_requests / elapsed:.1f} queries per second")
+    logger.info(
+        f"Latency: p50 {np.percentile(latencies, 50):.1f} ms, "
+        f"p99 {np.percentile(latencies, 99):.1f} ms, "
+        f"mean {latencies.mean():.1f} ms"
+    )
+    with urlopen(url + "/stats") as response:
+        logger.info(f"Server stats: {json.loads(response.read().decode('utf-8'))}")
+
+
+def main():
+    # Without the main sentinel, the code would be executed even if the script were
+    # imported as a module.
+    args = parse_args()
+    load_test(
+        args.url,
+        args.texts_path,
+        args.num_requests,
+        args.concurrency,
+        args.k,
+        args.seed,
+    )
+
+
+def parse_args():
+    """Parse command line arguments.
+
+    Returns:
+        Arguments
+
+    """
+    parser = argparse.ArgumentParser(
+        description="Generates load for a retrieval server and reports the latency."
+    )
+    parser.add_argument(
+        "--url", type=str, default="http://127.0.0.1:8000", help="The server url."
+    )
+    parser.add_argument(
+        "--texts_path",
+        type=str,
+        default="data/Flickr8k_dataset/Flickr8k_text/Flickr8k.token.txt",
+        help="Path to the Flickr captions used as queries.",
+    )
+    parser.add_argument(
+        "--num_requests", type=int, default=1000, help="How many queries to send."
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=16,
+        help="How many clients send queries at the same time.",
+    )
+    parser.add_argument("--k", type=int, default=10, help="How many results to get.")
+    parser.add_argument("--seed", type=int, default=42, help="The random seed.")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
@@ -152,9 +152,10 @@ class FlickrHparamsFinder(BaseHparamsFinder):
         prefetch_size: int,
         epochs: int,
         recall_at: int,
+        cache_path: str = None,
     ):
         """Creates a finder that will find the best hyperparameters for the Flickr
-        datasets.
+        datasets. The dataset is parsed once and shared by all the trials.
 
         Args:
             images_path: The path to all Flickr8k images.
@@ -165,12 +166,14 @@ class FlickrHparamsFinder(BaseHparamsFinder):
             prefetch_size: The prefetching size when running on GPU.
             epochs: The number of epochs per experiment.
             recall_at: The recall at K.
+            cache_path: Where to cache the parsed dataset, if anywhere.
         """
         super().__init__(batch_size, prefetch_size, epochs, recall_at)
-        self.images_path = images_path
-        self.texts_path = texts_path
-        self.train_imgs_file_path = train_imgs_file_path
-        self.val_imgs_file_path = val_imgs_file_path
+        dataset = FlickrDataset(images_path, texts_path, cache_path)
+        self.train_image_paths, self.train_captions = dataset.get_data(
+            train_imgs_file_path
+        )
+        self.val_image_paths, self.val_captions = dataset.get_data(val_imgs_file_path)
 
     def objective(self, args: Dict[str, Any]):
         joint_space = args["joint_space"]
@@ -184,20 +187,17 @@ class FlickrHparamsFinder(BaseHparamsFinder):
         keep_prob = args["keep_prob"]
         weight_decay = args["weight_decay"]
 
-        dataset = FlickrDataset(self.images_path, self.texts_path)
-        train_image_paths, train_captions = dataset.get_data(self.train_imgs_file_path)
-        val_image_paths, val_captions = dataset.get_data(self.val_imgs_file_path)
-        evaluator_val = Evaluator(len(val_image_paths), attn_hops * joint_space)
+        evaluator_val = Evaluator(len(self.val_image_paths), attn_hops * joint_space)
 
         # Resetting the default graph and setting the random seed
         tf.reset_default_graph()
         tf.set_random_seed(self.seed)
 
         loader = TrainValLoader(
-            train_image_paths,
-            train_captions,
-            val_image_paths,
-            val_captions,
+            self.train_image_paths,
+            self.train_captions,
+            self.val_image_paths,
+            self.val_captions,
             self.batch_size,
             self.prefetch_size,
         )
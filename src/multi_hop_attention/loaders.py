@@ -1,10 +1,12 @@
 import tensorflow as tf
+import numpy as np
 from typing import List, Tuple, Generator
 import logging
 from abc import ABC, abstractmethod
 
-from utils.constants import WIDTH, HEIGHT, NUM_CHANNELS
-
+from utils.archives import member_pattern, read_image_bytes
+from utils.constants import WIDTH, HEIGHT, NUM_CHANNELS, SMALLEST_SIDE
+from utils.embeddings import EmbeddingStore
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -19,11 +21,38 @@ class BaseLoader(ABC):
     def parse_data(
         image_path: str, caption: List[str]
     ) -> Tuple[tf.Tensor, tf.Tensor, tf.Tensor]:
+        image = BaseLoader.parse_image(image_path)
+        caption_words = tf.string_split([caption]).values
+        caption_len = tf.shape(caption_words)[0]
+
+        return image, caption_words, caption_len
+
+    @staticmethod
+    def parse_image(image_path: str) -> tf.Tensor:
+        # An image inside an archive is read in place with a ranged read
+        image_string = tf.cond(
+            tf.strings.regex_full_match(image_path, member_pattern),
+            lambda: BaseLoader.read_archive_member(image_path),
+            lambda: tf.read_file(image_path),
+        )
+
+        return BaseLoader.decode_image(image_string)
+
+    @staticmethod
+    def read_archive_member(image_path: str) -> tf.Tensor:
+        image_string = tf.py_func(
+            read_image_bytes, [image_path], tf.string, stateful=False
+        )
+        image_string.set_shape([])
+
+        return image_string
+
+    @staticmethod
+    def decode_image(image_string: tf.Tensor) -> tf.Tensor:
         # Adapted: https://gist.github.com/omoindrot/dedc857cdc0e680dfb1be99762990c9c
-        image_string = tf.read_file(image_path)
         image = tf.image.decode_jpeg(image_string, channels=NUM_CHANNELS)
         image = tf.image.convert_image_dtype(image, tf.float32)
-        smallest_side = 256.0
+        smallest_side = float(SMALLEST_SIDE)
         height, width = tf.shape(image)[0], tf.shape(image)[1]
         height = tf.cast(height, tf.float32)
         width = tf.cast(width, tf.float32)
@@ -37,10 +66,7 @@ class BaseLoader(ABC):
         new_width = tf.cast(width * scale, tf.float32)
         image = tf.image.resize_images(image, [new_height, new_width])
 
-        caption_words = tf.string_split([caption]).values
-        caption_len = tf.shape(caption_words)[0]
-
-        return image, caption_words, caption_len
+        return image
 
     @staticmethod
     def parse_data_train(
@@ -142,6 +168,104 @@ class TrainValLoader(BaseLoader):
         return images, captions, captions_lengths
 
 
+class CachedFeaturesLoader(BaseLoader):
+    def __init__(
+        self,
+        features: np.ndarray,
+        train_image_indices: List[int],
+        train_captions: List[str],
+        val_image_indices: List[int],
+        val_captions: List[str],
+        batch_size: int,
+        prefetch_size: int,
+    ):
+        """Creates a loader like TrainValLoader, which instead of decoding the images
+        yields their feature maps computed beforehand by a FeatureExtractor. The
+        features are computed on the center crop of the images, so the training
+        images are not augmented.
+
+        Args:
+            features: The feature maps of the images with shape [N, H, W, C],
+            possibly memory mapped.
+            train_image_indices: The image of every train caption, as an index in
+            features.
+            train_captions: The train captions.
+            val_image_indices: The image of every validation caption.
+            val_captions: The validation captions.
+            batch_size: The batch size.
+            prefetch_size: How many batches to prefetch.
+        """
+        super().__init__(batch_size, prefetch_size)
+        self.features = features
+        self.train_image_indices = train_image_indices
+        self.train_captions = train_captions
+        self.val_image_indices = val_image_indices
+        self.val_captions = val_captions
+        feature_shape = list(features.shape[1:])
+
+        self.train_dataset = tf.data.Dataset.from_generator(
+            generator=self.train_data_generator,
+            output_types=(tf.float32, tf.string),
+            output_shapes=(feature_shape, None),
+        )
+        self.train_dataset = self.train_dataset.map(
+            self.parse_features, num_parallel_calls=tf.data.experimental.AUTOTUNE
+        )
+        self.train_dataset = self.train_dataset.padded_batch(
+            self.batch_size, padded_shapes=(feature_shape, [None], [])
+        )
+        self.train_dataset = self.train_dataset.prefetch(self.prefetch_size)
+        logger.info("Training dataset created...")
+
+        self.val_dataset = tf.data.Dataset.from_generator(
+            generator=self.val_data_generator,
+            output_types=(tf.float32, tf.string),
+            output_shapes=(feature_shape, None),
+        )
+        self.val_dataset = self.val_dataset.map(
+            self.parse_features, num_parallel_calls=tf.data.experimental.AUTOTUNE
+        )
+        self.val_dataset = self.val_dataset.padded_batch(
+            self.batch_size, padded_shapes=(feature_shape, [None], [])
+        )
+        self.val_dataset = self.val_dataset.prefetch(self.prefetch_size)
+        logger.info("Validation dataset created...")
+
+        self.iterator = tf.data.Iterator.from_structure(
+            self.train_dataset.output_types, self.train_dataset.output_shapes
+        )
+        self.train_init = self.iterator.make_initializer(self.train_dataset)
+        self.val_init = self.iterator.make_initializer(self.val_dataset)
+        logger.info("Iterator created...")
+
+    @staticmethod
+    def parse_features(
+        features: tf.Tensor, caption: tf.Tensor
+    ) -> Tuple[tf.Tensor, tf.Tensor, tf.Tensor]:
+        caption_words = tf.string_split([caption]).values
+        caption_len = tf.shape(caption_words)[0]
+
+        return features, caption_words, caption_len
+
+    def train_data_generator(self) -> Generator[tf.Tensor, None, None]:
+        # Shuffling the rows here instead of with a shuffle buffer, which would hold
+        # the feature maps of the whole training set
+        for row in np.random.permutation(len(self.train_captions)):
+            yield (
+                self.features[self.train_image_indices[row]].astype(np.float32),
+                self.train_captions[row],
+            )
+
+    def val_data_generator(self) -> Generator[tf.Tensor, None, None]:
+        for image_index, caption in zip(self.val_image_indices, self.val_captions):
+            yield self.features[image_index].astype(np.float32), caption
+
+    def get_next(self) -> Tuple[tf.Tensor, tf.Tensor, tf.Tensor]:
+        features, captions, captions_lengths = self.iterator.get_next()
+
+        return features, captions, captions_lengths
+
+
 class InferenceLoader(BaseLoader):
     def __init__(
         self,
@@ -182,3 +306,208 @@ class InferenceLoader(BaseLoader):
         images, captions, captions_lengths = self.iterator.get_next()
 
         return images, captions, captions_lengths
+
+
+class ImageLoader(BaseLoader):
+    def __init__(self, image_paths: List[str], batch_size: int, prefetch_size: int):
+        """Creates a loader of images only, used to embed images without captions.
+
+        Args:
+            image_paths: The image paths.
+            batch_size: The batch size.
+            prefetch_size: How many batches to prefetch.
+        """
+        super().__init__(batch_size, prefetch_size)
+        self.image_paths = image_paths
+        self.dataset = tf.data.Dataset.from_generator(
+            generator=self.data_generator, output_types=tf.string, output_shapes=None
+        )
+        self.dataset = self.dataset.map(
+            self.parse_image, num_parallel_calls=tf.data.experimental.AUTOTUNE
+        )
+        self.dataset = self.dataset.map(
+            self.parse_image_val_test, num_parallel_calls=tf.data.experimental.AUTOTUNE
+        )
+        self.dataset = self.dataset.padded_batch(
+            self.batch_size, padded_shapes=[WIDTH, HEIGHT, NUM_CHANNELS]
+        )
+        self.dataset = self.dataset.prefetch(self.prefetch_size)
+        logger.info("Image dataset created...")
+
+        self.iterator = self.dataset.make_one_shot_iterator()
+        logger.info("Iterator created...")
+
+    @staticmethod
+    def parse_image_val_test(image: tf.Tensor) -> tf.Tensor:
+        return tf.image.resize_image_with_crop_or_pad(image, WIDTH, HEIGHT)
+
+    def data_generator(self) -> Generator[tf.Tensor, None, None]:
+        for image_path in self.image_paths:
+            yield image_path
+
+    def get_next(self) -> tf.Tensor:
+        return self.iterator.get_next()
+
+
+class DistillationLoader(BaseLoader):
+    def __init__(
+        self,
+        train_image_paths: List[str],
+        train_captions: List[str],
+        train_teacher: EmbeddingStore,
+        val_image_paths: List[str],
+        val_captions: List[str],
+        val_teacher: EmbeddingStore,
+        batch_size: int,
+        prefetch_size: int,
+    ):
+        """Creates a loader which besides the images and captions yields the
+        embeddings that the teacher model produced for them.
+
+        Args:
+            train_image_paths: The train image paths.
+            train_captions: The train captions.
+            train_teacher: The teacher embeddings of the train data.
+            val_image_paths: The validation image paths.
+            val_captions: The validation captions.
+            val_teacher: The teacher embeddings of the validation data.
+            batch_size: The batch size.
+            prefetch_size: How many batches to prefetch.
+        """
+        super().__init__(batch_size, prefetch_size)
+        assert train_teacher.image_paths == train_image_paths
+        assert train_teacher.captions == train_captions
+        assert val_teacher.image_paths == val_image_paths
+        assert val_teacher.captions == val_captions
+        self.teacher_dim = train_teacher.dim
+        padded_shapes = (
+            [WIDTH, HEIGHT, NUM_CHANNELS],
+            [None],
+            [],
+            [self.teacher_dim],
+            [self.teacher_dim],
+        )
+        # Build distillation train dataset
+        self.train_image_paths = train_image_paths
+        self.train_captions = train_captions
+        self.train_teacher = train_teacher
+        self.train_dataset = tf.data.Dataset.from_generator(
+            generator=self.train_data_generator,
+            output_types=(tf.string, tf.string, tf.float32, tf.float32),
+            output_shapes=(None, None, [self.teacher_dim], [self.teacher_dim]),
+        )
+        self.train_dataset = self.train_dataset.map(
+            self.parse_data_teacher, num_parallel_calls=tf.data.experimental.AUTOTUNE
+        )
+        self.train_dataset = self.train_dataset.map(
+            self.parse_data_train_teacher,
+            num_parallel_calls=tf.data.experimental.AUTOTUNE,
+        )
+        self.train_dataset = self.train_dataset.padded_batch(
+            self.batch_size, padded_shapes=padded_shapes
+        )
+        self.train_dataset = self.train_dataset.prefetch(self.prefetch_size)
+        logger.info("Training dataset created...")
+
+        # Build validation dataset
+        self.val_image_paths = val_image_paths
+        self.val_captions = val_captions
+        self.val_teacher = val_teacher
+        self.val_dataset = tf.data.Dataset.from_generator(
+            generator=self.val_data_generator,
+            output_types=(tf.string, tf.string, tf.float32, tf.float32),
+            output_shapes=(None, None, [self.teacher_dim], [self.teacher_dim]),
+        )
+        self.val_dataset = self.val_dataset.map(
+            self.parse_data_teacher, num_parallel_calls=tf.data.experimental.AUTOTUNE
+        )
+        self.val_dataset = self.val_dataset.map(
+            self.parse_data_val_test_teacher,
+            num_parallel_calls=tf.data.experimental.AUTOTUNE,
+        )
+        self.val_dataset = self.val_dataset.padded_batch(
+            self.batch_size, padded_shapes=padded_shapes
+        )
+        self.val_dataset = self.val_dataset.prefetch(self.prefetch_size)
+        logger.info("Validation dataset created...")
+
+        self.iterator = tf.data.Iterator.from_structure(
+            self.train_dataset.output_types, self.train_dataset.output_shapes
+        )
+
+        # Initialize with required datasets
+        self.train_init = self.iterator.make_initializer(self.train_dataset)
+        self.val_init = self.iterator.make_initializer(self.val_dataset)
+        # Created once so that the student and teacher tensors come from the same batch
+        self.next_element = self.iterator.get_next()
+
+        logger.info("Iterator created...")
+
+    def parse_data_teacher(
+        self,
+        image_path: str,
+        caption: List[str],
+        teacher_image: tf.Tensor,
+        teacher_caption: tf.Tensor,
+    ):
+        image, caption_words, caption_len = self.parse_data(image_path, caption)
+
+        return image, caption_words, caption_len, teacher_image, teacher_caption
+
+    def parse_data_train_teacher(
+        self,
+        image: tf.Tensor,
+        caption: tf.Tensor,
+        caption_len: tf.Tensor,
+        teacher_image: tf.Tensor,
+        teacher_caption: tf.Tensor,
+    ):
+        image, caption, caption_len = self.parse_data_train(image, caption, caption_len)
+
+        return image, caption, caption_len, teacher_image, teacher_caption
+
+    def parse_data_val_test_teacher(
+        self,
+        image: tf.Tensor,
+        caption: tf.Tensor,
+        caption_len: tf.Tensor,
+        teacher_image: tf.Tensor,
+        teacher_caption: tf.Tensor,
+    ):
+        image, caption, caption_len = self.parse_data_val_test(
+            image, caption, caption_len
+        )
+
+        return image, caption, caption_len, teacher_image, teacher_caption
+
+    def train_data_generator(self) -> Generator[tf.Tensor, None, None]:
+        # Shuffling the rows here instead of with a shuffle buffer, which would hold
+        # the teacher embeddings of the whole training set
+        for row in np.random.permutation(len(self.train_captions)):
+            yield (
+                self.train_image_paths[row],
+                self.train_captions[row],
+                self.train_teacher.embedded_images[row],
+                self.train_teacher.embedded_captions[row],
+            )
+
+    def val_data_generator(self) -> Generator[tf.Tensor, None, None]:
+        for index, (image_path, caption) in enumerate(
+            zip(self.val_image_paths, self.val_captions)
+        ):
+            yield (
+                image_path,
+                caption,
+                self.val_teacher.embedded_images[index],
+                self.val_teacher.embedded_captions[index],
+            )
+
+    def get_next(self) -> Tuple[tf.Tensor, tf.Tensor, tf.Tensor]:
+        images, captions, captions_lengths, _, _ = self.next_element
+
+        return images, captions, captions_lengths
+
+    def get_next_teacher(self) -> Tuple[tf.Tensor, tf.Tensor]:
+        _, _, _, teacher_images, teacher_captions = self.next_element
+
+        return teacher_images, teacher_captions
@@ -4,9 +4,24 @@ from typing import Tuple
 import tensorflow_hub as hub
 import sys
 
+from utils.constants import num_hash_buckets, word_embedding_size
+from utils.word_vectors import WordVectors
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Image encoders loaded from tensorflow hub: module url and the feature map to use
+hub_image_encoders = {
+    "resnet152": (
+        "https://tfhub.dev/google/imagenet/resnet_v2_152/feature_vector/3",
+        "resnet_v2_152/block4",
+    ),
+    "resnet50": (
+        "https://tfhub.dev/google/imagenet/resnet_v2_50/feature_vector/3",
+        "resnet_v2_50/block4",
+    ),
+}
+
 
 class MultiHopAttentionModel:
     def __init__(
@@ -25,6 +40,9 @@ class MultiHopAttentionModel:
         batch_hard: bool = False,
         log_dir: str = "",
         name: str = "",
+        image_encoder: str = "resnet152",
+        text_encoder: str = "elmo",
+        word_vectors: WordVectors = None,
     ):
         # Name of the model
         self.name = name
@@ -50,10 +68,18 @@ class MultiHopAttentionModel:
         self.keep_prob = tf.placeholder_with_default(1.0, None, name="keep_prob")
         self.weight_decay = tf.placeholder_with_default(0.0, None, name="weight_decay")
         # Build model
-        self.image_encoded = self.image_encoder_graph(self.images, joint_space)
+        self.image_encoded = self.image_encoder_graph(
+            self.images, joint_space, image_encoder
+        )
         logger.info("Image encoder graph created...")
         self.text_encoded = self.text_encoder_graph(
-            self.captions, self.captions_len, joint_space, num_layers, self.keep_prob
+            self.captions,
+            self.captions_len,
+            joint_space,
+            num_layers,
+            self.keep_prob,
+            text_encoder,
+            word_vectors,
         )
         logger.info("Text encoder graph created...")
         self.attended_images, self.image_alphas = self.attention_graph(
@@ -64,6 +90,11 @@ class MultiHopAttentionModel:
             attn_size, attn_hops, self.text_encoded, "siamese_attention"
         )
         logger.info("Attention graph created...")
+        # Compact embeddings for the first stage of two-stage retrieval
+        self.compact_images = self.hop_pooling_graph(self.attended_images, attn_hops)
+        self.compact_captions = self.hop_pooling_graph(
+            self.attended_captions, attn_hops
+        )
         self.loss = self.compute_loss(margin, attn_hops, batch_hard)
         self.optimize = self.apply_gradients_op(
             self.loss, learning_rate, clip_value, decay_steps
@@ -72,26 +103,30 @@ class MultiHopAttentionModel:
         logger.info("Graph creation finished...")
 
     @staticmethod
-    def image_encoder_graph(images: tf.Tensor, joint_space: int) -> tf.Tensor:
-        """Extract higher level features from the image using a resnet152 pretrained on
-        ImageNet.
+    def image_encoder_graph(
+        images: tf.Tensor, joint_space: int, encoder: str = "resnet152"
+    ) -> tf.Tensor:
+        """Extract higher level features from the image using a CNN. By default a
+        resnet152 pretrained on ImageNet is used, while the lighter encoders are meant
+        for CPU deployments.
 
         Args:
             images: The input images.
             joint_space: The space where the encoded images and text are going to be
             projected to.
+            encoder: Which CNN to use: resnet152, resnet50 or mobilenet, or cached when
+            the images are feature maps computed beforehand, see FeatureExtractor.
 
         Returns:
             The encoded image.
 
         """
         with tf.variable_scope("image_encoder"):
-            resnet = hub.Module(
-                "https://tfhub.dev/google/imagenet/resnet_v2_152/feature_vector/3"
-            )
-            features = resnet(images, signature="image_feature_vector", as_dict=True)[
-                "resnet_v2_152/block4"
-            ]
+            if encoder == "cached":
+                # The images are already the feature maps of a frozen encoder
+                features = images
+            else:
+                features = MultiHopAttentionModel.image_features_graph(images, encoder)
             flatten = tf.reshape(features, (-1, features.shape[3]))
             project_layer = tf.layers.dense(
                 flatten, joint_space, kernel_initializer=tf.glorot_uniform_initializer()
@@ -101,6 +136,79 @@ class MultiHopAttentionModel:
                 project_layer, (-1, features.shape[1] * features.shape[2], joint_space)
             )
 
+    @staticmethod
+    def image_features_graph(images: tf.Tensor, encoder: str) -> tf.Tensor:
+        """Computes the feature map of the images with a CNN.
+
+        Args:
+            images: The input images.
+            encoder: Which CNN to use: resnet152, resnet50 or mobilenet.
+
+        Returns:
+            The feature map of the images.
+
+        """
+        if encoder in hub_image_encoders:
+            module_url, feature_map = hub_image_encoders[encoder]
+            resnet = hub.Module(module_url)
+            return resnet(images, signature="image_feature_vector", as_dict=True)[
+                feature_map
+            ]
+        elif encoder == "mobilenet":
+            return MultiHopAttentionModel.mobilenet_graph(images)
+        else:
+            raise ValueError(f"Unknown image encoder: {encoder}")
+
+    @staticmethod
+    def mobilenet_graph(images: tf.Tensor) -> tf.Tensor:
+        """Builds a MobileNet-like CNN made of depthwise separable convolutions.
+
+        As per: https://arxiv.org/abs/1704.04861
+
+        The network is trained from scratch together with the rest of the model and
+        reduces the image to a 7x7 feature map, the same grid as the resnets.
+
+        Args:
+            images: The input images.
+
+        Returns:
+            The feature map of the images.
+
+        """
+        with tf.variable_scope("mobilenet"):
+            features = tf.layers.conv2d(
+                images,
+                32,
+                3,
+                strides=2,
+                padding="same",
+                activation=tf.nn.relu6,
+                kernel_initializer=tf.glorot_uniform_initializer(),
+            )
+            for filters, strides in [
+                (64, 1),
+                (128, 2),
+                (128, 1),
+                (256, 2),
+                (256, 1),
+                (512, 2),
+                (512, 1),
+                (1024, 2),
+                (1024, 1),
+            ]:
+                features = tf.layers.separable_conv2d(
+                    features,
+                    filters,
+                    3,
+                    strides=strides,
+                    padding="same",
+                    activation=tf.nn.relu6,
+                    depthwise_initializer=tf.glorot_uniform_initializer(),
+                    pointwise_initializer=tf.glorot_uniform_initializer(),
+                )
+
+            return features
+
     @staticmethod
     def text_encoder_graph(
         captions: tf.Tensor,
@@ -108,9 +216,15 @@ class MultiHopAttentionModel:
         joint_space: int,
         num_layers: int,
         keep_prob: float,
+        encoder: str = "elmo",
+        word_vectors: WordVectors = None,
     ):
         """Encodes the text it gets as input using a bidirectional rnn.
 
+        The words are embedded either with ELMo, with trainable word embeddings where
+        the words are hashed into buckets or with frozen pretrained word vectors read
+        from a memory mapped matrix. The last two are much cheaper on CPU.
+
         Args:
             captions: The inputs.
             captions_len: The length of the inputs.
@@ -118,51 +232,103 @@ class MultiHopAttentionModel:
             projected to.
             num_layers: The number of layers in the Bi-RNN.
             keep_prob: The inverse dropout probability.
+            encoder: How to embed the words: elmo, gru or word_vectors.
+            word_vectors: The pretrained word vectors, used by word_vectors.
 
         Returns:
             The encoded text.
 
         """
         with tf.variable_scope(name_or_scope="text_encoder"):
-            elmo = hub.Module("https://tfhub.dev/google/elmo/2", trainable=True)
-            embeddings = elmo(
-                inputs={"tokens": captions, "sequence_len": captions_len},
-                signature="tokens",
-                as_dict=True,
-            )["elmo"]
-            cell_fw = tf.nn.rnn_cell.MultiRNNCell(
-                [
-                    tf.nn.rnn_cell.DropoutWrapper(
-                        tf.nn.rnn_cell.GRUCell(joint_space),
-                        state_keep_prob=keep_prob,
-                        input_size=(tf.shape(embeddings)[0], joint_space),
-                        variational_recurrent=True,
-                        dtype=tf.float32,
-                    )
-                    for _ in range(num_layers)
-                ]
-            )
-            cell_bw = tf.nn.rnn_cell.MultiRNNCell(
-                [
-                    tf.nn.rnn_cell.DropoutWrapper(
-                        tf.nn.rnn_cell.GRUCell(joint_space),
-                        state_keep_prob=keep_prob,
-                        input_size=(tf.shape(embeddings)[0], joint_space),
-                        variational_recurrent=True,
-                        dtype=tf.float32,
-                    )
-                    for _ in range(num_layers)
-                ]
-            )
-            (output_fw, output_bw), _ = tf.nn.bidirectional_dynamic_rnn(
-                cell_fw,
-                cell_bw,
-                embeddings,
-                sequence_length=captions_len,
-                dtype=tf.float32,
+            if encoder == "elmo":
+                elmo = hub.Module("https://tfhub.dev/google/elmo/2", trainable=True)
+                embeddings = elmo(
+                    inputs={"tokens": captions, "sequence_len": captions_len},
+                    signature="tokens",
+                    as_dict=True,
+                )["elmo"]
+            elif encoder == "gru":
+                word_ids = tf.string_to_hash_bucket_fast(captions, num_hash_buckets)
+                word_embeddings = tf.get_variable(
+                    name="word_embeddings",
+                    shape=[num_hash_buckets, word_embedding_size],
+                    initializer=tf.glorot_uniform_initializer(),
+                )
+                embeddings = tf.nn.embedding_lookup(word_embeddings, word_ids)
+            elif encoder == "word_vectors":
+                if word_vectors is None:
+                    raise ValueError("The word_vectors encoder requires word vectors")
+                # Unknown words and padding are mapped to the first (zero) vector
+                vocabulary = tf.contrib.lookup.index_table_from_file(
+                    word_vectors.vocabulary_path, default_value=0
+                )
+                # The vectors are gathered from the memory mapped matrix in numpy so
+                # the matrix is neither copied in the graph nor loaded in memory
+                embeddings = tf.py_func(
+                    word_vectors.lookup,
+                    [vocabulary.lookup(captions)],
+                    tf.float32,
+                    stateful=False,
+                )
+                embeddings.set_shape([None, None, word_vectors.dim])
+            else:
+                raise ValueError(f"Unknown text encoder: {encoder}")
+
+            return MultiHopAttentionModel.bigru_graph(
+                embeddings, captions_len, joint_space, num_layers, keep_prob
             )
 
-            return tf.add(output_fw, output_bw) / 2
+    @staticmethod
+    def bigru_graph(
+        embeddings: tf.Tensor,
+        captions_len: tf.Tensor,
+        joint_space: int,
+        num_layers: int,
+        keep_prob: float,
+    ) -> tf.Tensor:
+        """Runs a bidirectional GRU over the embedded words.
+
+        Args:
+            embeddings: The embedded words.
+            captions_len: The length of the inputs.
+            joint_space: The space where the encoded images and text are going to be
+            projected to.
+            num_layers: The number of layers in the Bi-RNN.
+            keep_prob: The inverse dropout probability.
+
+        Returns:
+            The average of the forward and backward outputs.
+
+        """
+        cell_fw = tf.nn.rnn_cell.MultiRNNCell(
+            [
+                tf.nn.rnn_cell.DropoutWrapper(
+                    tf.nn.rnn_cell.GRUCell(joint_space),
+                    state_keep_prob=keep_prob,
+                    input_size=(tf.shape(embeddings)[0], joint_space),
+                    variational_recurrent=True,
+                    dtype=tf.float32,
+                )
+                for _ in range(num_layers)
+            ]
+        )
+        cell_bw = tf.nn.rnn_cell.MultiRNNCell(
+            [
+                tf.nn.rnn_cell.DropoutWrapper(
+                    tf.nn.rnn_cell.GRUCell(joint_space),
+                    state_keep_prob=keep_prob,
+                    input_size=(tf.shape(embeddings)[0], joint_space),
+                    variational_recurrent=True,
+                    dtype=tf.float32,
+                )
+                for _ in range(num_layers)
+            ]
+        )
+        (output_fw, output_bw), _ = tf.nn.bidirectional_dynamic_rnn(
+            cell_fw, cell_bw, embeddings, sequence_length=captions_len, dtype=tf.float32
+        )
+
+        return tf.add(output_fw, output_bw) / 2
 
     @staticmethod
     def attention_graph(
@@ -227,6 +393,26 @@ class MultiHopAttentionModel:
 
             return output, alphas
 
+    @staticmethod
+    def hop_pooling_graph(attended_input: tf.Tensor, attn_hops: int) -> tf.Tensor:
+        """Averages the attention hops of the attended input into a compact embedding
+        that is attn_hops times smaller. It is used to retrieve candidates cheaply,
+        which are then re-ranked with the full attended input.
+
+        Args:
+            attended_input: The attended input, can be both the image and the text.
+            attn_hops: How many hops of attention were applied.
+
+        Returns:
+            The compact L2 normalized embedding.
+
+        """
+        hidden_size = attended_input.get_shape()[1].value // attn_hops
+        # [B, A_hops, H]
+        hops = tf.reshape(attended_input, [-1, attn_hops, hidden_size])
+
+        return tf.math.l2_normalize(tf.reduce_mean(hops, axis=1), axis=1)
+
     @staticmethod
     def compute_frob_norm(attention_weights: tf.Tensor, attn_hops: int) -> tf.Tensor:
         """Computes the Frobenius norm of the attention weights tensor.
@@ -428,3 +614,290 @@ class MultiHopAttentionModel:
 
         """
         self.saver_loader.save(sess, save_path + self.name)
+
+
+class DistilledMultiHopAttentionModel(MultiHopAttentionModel):
+    def __init__(
+        self,
+        images: tf.Tensor,
+        captions: tf.Tensor,
+        captions_len: tf.Tensor,
+        teacher_images: tf.Tensor,
+        teacher_captions: tf.Tensor,
+        margin: float,
+        joint_space: int,
+        num_layers: int,
+        attn_size: int,
+        attn_hops: int,
+        learning_rate: float = 0.0,
+        clip_value: int = 0,
+        decay_steps: float = sys.maxsize,
+        batch_hard: bool = False,
+        log_dir: str = "",
+        name: str = "",
+        image_encoder: str = "mobilenet",
+        text_encoder: str = "gru",
+        word_vectors: WordVectors = None,
+        distillation_weight: float = 1.0,
+    ):
+        """A compact student model trained to mimic the embeddings of a trained
+        teacher model, besides minimizing its own triplet loss.
+
+        As per: https://arxiv.org/abs/1503.02531
+
+        Args:
+            teacher_images: The teacher embeddings of the images.
+            teacher_captions: The teacher embeddings of the captions.
+            distillation_weight: How much the distillation loss contributes.
+
+        The rest of the arguments are the same as in MultiHopAttentionModel.
+        """
+        self.teacher_images = teacher_images
+        self.teacher_captions = teacher_captions
+        self.distillation_weight = distillation_weight
+        super().__init__(
+            images,
+            captions,
+            captions_len,
+            margin,
+            joint_space,
+            num_layers,
+            attn_size,
+            attn_hops,
+            learning_rate,
+            clip_value,
+            decay_steps,
+            batch_hard,
+            log_dir,
+            name,
+            image_encoder,
+            text_encoder,
+            word_vectors,
+        )
+
+    @staticmethod
+    def distillation_loss(
+        student_images: tf.Tensor,
+        student_captions: tf.Tensor,
+        teacher_images: tf.Tensor,
+        teacher_captions: tf.Tensor,
+    ) -> tf.Tensor:
+        """Computes how far the student is from the teacher.
+
+        1. The student embeddings are projected to the teacher space with a projection
+        shared between the images and captions and compared with the cosine distance.
+        2. The image-caption similarity matrix of the student is compared with the one
+        of the teacher, which preserves the ranking structure of the teacher even
+        though the embeddings have different dimensions.
+
+        Args:
+            student_images: The student embeddings of the images.
+            student_captions: The student embeddings of the captions.
+            teacher_images: The teacher embeddings of the images.
+            teacher_captions: The teacher embeddings of the captions.
+
+        Returns:
+            The distillation loss.
+
+        """
+        with tf.variable_scope(name_or_scope="distillation", reuse=tf.AUTO_REUSE):
+            teacher_dim = teacher_images.get_shape()[1].value
+            projected_images = tf.math.l2_normalize(
+                tf.layers.dense(
+                    student_images,
+                    teacher_dim,
+                    kernel_initializer=tf.glorot_uniform_initializer(),
+                    name="projection",
+                ),
+                axis=1,
+            )
+            projected_captions = tf.math.l2_normalize(
+                tf.layers.dense(
+                    student_captions,
+                    teacher_dim,
+                    kernel_initializer=tf.glorot_uniform_initializer(),
+                    name="projection",
+                ),
+                axis=1,
+            )
+            embedding_loss = tf.reduce_sum(
+                1.0 - tf.reduce_sum(projected_images * teacher_images, axis=1)
+            ) + tf.reduce_sum(
+                1.0 - tf.reduce_sum(projected_captions * teacher_captions, axis=1)
+            )
+            student_scores = tf.matmul(
+                student_images, student_captions, transpose_b=True
+            )
+            teacher_scores = tf.matmul(
+                teacher_images, teacher_captions, transpose_b=True
+            )
+            similarity_loss = tf.reduce_sum(
+                tf.reduce_mean(tf.square(student_scores - teacher_scores), axis=1)
+            )
+
+            return embedding_loss + similarity_loss
+
+    def compute_loss(
+        self, margin: float, attn_hops: int, batch_hard: bool
+    ) -> tf.Tensor:
+        """Computes the loss of the student, which is the loss of the model plus the
+        weighted distillation loss.
+
+        Args:
+            margin: The contrastive margin.
+            attn_hops: The number of attention heads.
+            batch_hard: Whether to train on the hard negatives.
+
+        Returns:
+            The final loss to be optimized.
+
+        """
+        loss = super().compute_loss(margin, attn_hops, batch_hard)
+        distillation_loss = self.distillation_loss(
+            self.attended_images,
+            self.attended_captions,
+            self.teacher_images,
+            self.teacher_captions,
+        )
+
+        return loss + distillation_loss * self.distillation_weight
+
+
+class FeatureExtractor:
+    def __init__(self, images: tf.Tensor, image_encoder: str = "resnet152"):
+        """Builds the frozen CNN of a MultiHopAttentionModel, so that the feature maps
+        of the images can be computed once and fed to models with the cached image
+        encoder.
+
+        Args:
+            images: The input images.
+            image_encoder: The CNN used to encode the images, one of the pretrained
+            encoders, which are not trained with the model.
+        """
+        if image_encoder not in hub_image_encoders:
+            raise ValueError(f"The {image_encoder} image encoder is not frozen!")
+        self.images = images
+        with tf.variable_scope("image_encoder"):
+            self.features = MultiHopAttentionModel.image_features_graph(
+                images, image_encoder
+            )
+        logger.info("Feature extractor created...")
+
+    @staticmethod
+    def init(sess: tf.Session) -> None:
+        sess.run([tf.global_variables_initializer(), tf.tables_initializer()])
+
+
+class ImageTower:
+    def __init__(
+        self,
+        images: tf.Tensor,
+        joint_space: int,
+        attn_size: int,
+        attn_hops: int,
+        image_encoder: str = "resnet152",
+    ):
+        """Builds only the image side of a MultiHopAttentionModel, so that images can
+        be embedded without captions. The variables have the same names as in the
+        model, so a checkpoint of the model can be restored.
+
+        Args:
+            images: The input images.
+            joint_space: The space where the encoded images and text are going to be
+            projected to.
+            attn_size: The size of the attention.
+            attn_hops: How many hops of attention to apply.
+            image_encoder: The CNN used to encode the images.
+        """
+        self.images = images
+        self.image_encoded = MultiHopAttentionModel.image_encoder_graph(
+            images, joint_space, image_encoder
+        )
+        self.attended_images, self.image_alphas = (
+            MultiHopAttentionModel.attention_graph(
+                attn_size, attn_hops, self.image_encoded, "siamese_attention"
+            )
+        )
+        self.compact_images = MultiHopAttentionModel.hop_pooling_graph(
+            self.attended_images, attn_hops
+        )
+        self.saver_loader = tf.train.Saver()
+        logger.info("Image tower created...")
+
+    def init(self, sess: tf.Session, checkpoint_path: str) -> None:
+        """Initializes the tower from a checkpoint of the model.
+
+        Args:
+            sess: The active session.
+            checkpoint_path: Path to a valid checkpoint.
+
+        Returns:
+            None
+
+        """
+        sess.run([tf.global_variables_initializer(), tf.tables_initializer()])
+        self.saver_loader.restore(sess, checkpoint_path)
+
+
+class TextTower:
+    def __init__(
+        self,
+        captions: tf.Tensor,
+        captions_len: tf.Tensor,
+        joint_space: int,
+        num_layers: int,
+        attn_size: int,
+        attn_hops: int,
+        text_encoder: str = "elmo",
+        word_vectors: WordVectors = None,
+    ):
+        """Builds only the text side of a MultiHopAttentionModel, so that captions can
+        be embedded without images. The variables have the same names as in the
+        model, so a checkpoint of the model can be restored.
+
+        Args:
+            captions: The input captions.
+            captions_len: The length of the captions.
+            joint_space: The space where the encoded images and text are going to be
+            projected to.
+            num_layers: The number of layers in the Bi-RNN.
+            attn_size: The size of the attention.
+            attn_hops: How many hops of attention to apply.
+            text_encoder: How the words are embedded before the Bi-GRU.
+            word_vectors: The pretrained word vectors, used by word_vectors.
+        """
+        self.captions = captions
+        self.captions_len = captions_len
+        self.text_encoded = MultiHopAttentionModel.text_encoder_graph(
+            captions,
+            captions_len,
+            joint_space,
+            num_layers,
+            1.0,
+            text_encoder,
+            word_vectors,
+        )
+        self.attended_captions, self.text_alphas = (
+            MultiHopAttentionModel.attention_graph(
+                attn_size, attn_hops, self.text_encoded, "siamese_attention"
+            )
+        )
+        self.compact_captions = MultiHopAttentionModel.hop_pooling_graph(
+            self.attended_captions, attn_hops
+        )
+        self.saver_loader = tf.train.Saver()
+        logger.info("Text tower created...")
+
+    def init(self, sess: tf.Session, checkpoint_path: str) -> None:
+        """Initializes the tower from a checkpoint of the model.
+
+        Args:
+            sess: The active session.
+            checkpoint_path: Path to a valid checkpoint.
+
+        Returns:
+            None
+
+        """
+        sess.run([tf.global_variables_initializer(), tf.tables_initializer()])
+        self.saver_loader.restore(sess, checkpoint_path)
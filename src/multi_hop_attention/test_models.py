@@ -4,6 +4,7 @@ import pytest
 
 
 from multi_hop_attention.models import MultiHopAttentionModel
+from utils.word_vectors import WordVectors
 
 
 @pytest.fixture
@@ -127,6 +128,22 @@ def test_image_encoder_batch_size_invariance(input_images_image_encoder, joint_s
         np.testing.assert_almost_equal(output_50[:5], output_5, decimal=3)
 
 
+def test_mobilenet_image_encoder(input_images, joint_space):
+    tf.reset_default_graph()
+    image_inputs_layer = tf.placeholder(dtype=tf.float32, shape=[None, 224, 224, 3])
+    image_encoded = MultiHopAttentionModel.image_encoder_graph(
+        image_inputs_layer, joint_space, "mobilenet"
+    )
+    with tf.Session() as sess:
+        sess.run([tf.global_variables_initializer(), tf.tables_initializer()])
+        output_shape = sess.run(
+            image_encoded, feed_dict={image_inputs_layer: input_images}
+        ).shape
+    assert output_shape[0] == 3
+    assert output_shape[1] == 49
+    assert output_shape[2] == joint_space
+
+
 def test_text_encoder(captions, captions_len, joint_space, num_layers, keep_prob):
     tf.reset_default_graph()
     text_encoded = MultiHopAttentionModel.text_encoder_graph(
@@ -184,3 +201,49 @@ def test_attended_image_text_shape(
     )
     assert model.attended_images.shape[0] == model.attended_captions.shape[0]
     assert model.attended_images.shape[1] == model.attended_captions.shape[1]
+
+
+def test_gru_text_encoder(captions, captions_len, joint_space, num_layers, keep_prob):
+    tf.reset_default_graph()
+    text_encoded = MultiHopAttentionModel.text_encoder_graph(
+        captions, captions_len, joint_space, num_layers, keep_prob, "gru"
+    )
+    with tf.Session() as sess:
+        sess.run([tf.global_variables_initializer(), tf.tables_initializer()])
+        outputs = sess.run(text_encoded).shape
+    assert outputs[0] == 3
+    assert outputs[1] == 5
+    assert outputs[2] == joint_space
+
+
+def test_unknown_encoder_raises(input_images, joint_space):
+    tf.reset_default_graph()
+    with pytest.raises(ValueError):
+        MultiHopAttentionModel.image_encoder_graph(input_images, joint_space, "vgg")
+
+
+def test_word_vectors_text_encoder(
+    captions, captions_len, joint_space, num_layers, keep_prob, tmp_path
+):
+    glove_path = tmp_path / "glove.txt"
+    glove_path.write_text("goes 1.0 2.0\nshop 3.0 4.0\n")
+    word_vectors_dir = str(tmp_path / "word_vectors")
+    WordVectors.build(
+        str(glove_path), [" ".join(caption) for caption in captions], word_vectors_dir
+    )
+    tf.reset_default_graph()
+    text_encoded = MultiHopAttentionModel.text_encoder_graph(
+        captions,
+        captions_len,
+        joint_space,
+        num_layers,
+        keep_prob,
+        "word_vectors",
+        WordVectors(word_vectors_dir),
+    )
+    with tf.Session() as sess:
+        sess.run([tf.global_variables_initializer(), tf.tables_initializer()])
+        outputs = sess.run(text_encoded).shape
+    assert outputs[0] == 3
+    assert outputs[1] == 5
+    assert outputs[2] == joint_space
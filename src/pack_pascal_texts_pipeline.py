@@ -0,0 +1,67 @@
+import argparse
+import logging
+
+from utils.datasets import PascalSentencesDataset
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def pack(texts_path: str, packed_path: str, num_threads: int) -> None:
+    """Packs the Pascal sentences text tree into a single file, which can be used as
+    the texts path of the Pascal pipelines.
+
+    Args:
+        texts_path: Path where the image captions are.
+        packed_path: Where to write the packed file.
+        num_threads: How many caption files to read at the same time.
+
+    Returns:
+        None
+
+    """
+    PascalSentencesDataset.pack_texts(texts_path, packed_path, num_threads)
+    logger.info(f"{texts_path} packed into {packed_path}")
+
+
+def main():
+    # Without the main sentinel, the code would be executed even if the script were
+    # imported as a module.
+    args = parse_args()
+    pack(args.texts_path, args.packed_path, args.num_threads)
+
+
+def parse_args():
+    """Parse command line arguments.
+
+    Returns:
+        Arguments
+
+    """
+    parser = argparse.ArgumentParser(
+        description="Packs the Pascal sentences captions into a single file."
+    )
+    parser.add_argument(
+        "--texts_path",
+        type=str,
+        default="data/Pascal_sentences_dataset/sentence",
+        help="Path where the image captions are.",
+    )
+    parser.add_argument(
+        "--packed_path",
+        type=str,
+        default="data/Pascal_sentences_dataset/sentence.json",
+        help="Where to write the packed file.",
+    )
+    parser.add_argument(
+        "--num_threads",
+        type=int,
+        default=16,
+        help="How many caption files to read at the same time.",
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
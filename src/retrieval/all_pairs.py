@@ -0,0 +1,160 @@
+import os
+import logging
+import multiprocessing
+from typing import Dict, Tuple
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from retrieval.top_k import exact_top_k
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# The arrays every worker process memory maps once
+worker_arrays: Dict[str, np.ndarray] = {}
+
+
+class SparseTopK:
+    # The top K of every query on disk, as a CSR sparse matrix
+    def __init__(self, matrix_dir: str):
+        """Memory maps a matrix written by all_pairs_top_k. The results of the i-th
+        query are the columns indices[indptr[i] : indptr[i + 1]], sorted by
+        decreasing score.
+
+        Args:
+            matrix_dir: The directory of the matrix.
+        """
+        self.indptr = np.load(os.path.join(matrix_dir, "indptr.npy"), mmap_mode="r")
+        self.indices = np.load(os.path.join(matrix_dir, "indices.npy"), mmap_mode="r")
+        self.scores = np.load(os.path.join(matrix_dir, "scores.npy"), mmap_mode="r")
+        self.num_rows = self.indptr.shape[0] - 1
+
+    def get_row(self, row: int) -> Tuple[np.ndarray, np.ndarray]:
+        begin, end = self.indptr[row], self.indptr[row + 1]
+        return self.indices[begin:end], self.scores[begin:end]
+
+    @staticmethod
+    def create(matrix_dir: str, num_rows: int, k: int) -> None:
+        """Allocates a matrix with K results per query on disk.
+
+        Args:
+            matrix_dir: Where to create the matrix.
+            num_rows: The number of queries.
+            k: The number of results per query.
+
+        Returns:
+            None
+
+        """
+        os.makedirs(matrix_dir, exist_ok=True)
+        np.save(
+            os.path.join(matrix_dir, "indptr.npy"),
+            np.arange(num_rows + 1, dtype=np.int64) * k,
+        )
+        open_memmap(
+            os.path.join(matrix_dir, "indices.npy"), "w+", np.int64, (num_rows * k,)
+        ).flush()
+        open_memmap(
+            os.path.join(matrix_dir, "scores.npy"), "w+", np.float32, (num_rows * k,)
+        ).flush()
+
+
+def write_rows(
+    embeddings: np.ndarray, rows: np.ndarray, array_path: str, block_size: int
+) -> None:
+    """Copies some rows of memory mapped embeddings to a new .npy file, one block at a
+    time.
+
+    Args:
+        embeddings: The embeddings.
+        rows: The rows to copy.
+        array_path: Where to write them.
+        block_size: How many rows to copy at once.
+
+    Returns:
+        None
+
+    """
+    array = open_memmap(array_path, "w+", np.float32, (len(rows), embeddings.shape[1]))
+    for begin in range(0, len(rows), block_size):
+        array[begin : begin + block_size] = embeddings[rows[begin : begin + block_size]]
+    array.flush()
+
+
+def open_worker_arrays(queries_path: str, gallery_path: str, matrix_dir: str) -> None:
+    worker_arrays["queries"] = np.load(queries_path, mmap_mode="r")
+    worker_arrays["gallery"] = np.load(gallery_path, mmap_mode="r")
+    worker_arrays["indices"] = np.load(
+        os.path.join(matrix_dir, "indices.npy"), mmap_mode="r+"
+    )
+    worker_arrays["scores"] = np.load(
+        os.path.join(matrix_dir, "scores.npy"), mmap_mode="r+"
+    )
+
+
+def score_block(task: Tuple[int, int, int, int]) -> int:
+    """Computes the top K of a block of queries and writes it to the matrix.
+
+    Args:
+        task: The first and the last query of the block, K and how many gallery
+        embeddings to score at once.
+
+    Returns:
+        The number of queries of the block.
+
+    """
+    begin, end, k, gallery_block_size = task
+    queries = np.asarray(worker_arrays["queries"][begin:end])
+    top_ids, top_scores = exact_top_k(
+        queries, worker_arrays["gallery"], k, gallery_block_size
+    )
+    worker_arrays["indices"][begin * k : end * k] = top_ids.ravel()
+    worker_arrays["scores"][begin * k : end * k] = top_scores.ravel()
+
+    return end - begin
+
+
+def all_pairs_top_k(
+    queries_path: str,
+    gallery_path: str,
+    matrix_dir: str,
+    k: int,
+    query_block_size: int,
+    gallery_block_size: int,
+    num_workers: int,
+) -> None:
+    """Finds the top K gallery embeddings of every query and writes them as a CSR
+    sparse matrix. Worker processes take blocks of queries and write their results
+    straight to the memory mapped matrix, so every worker only holds a block of
+    queries by a block of the gallery and its running top K.
+
+    Args:
+        queries_path: The queries (.npy).
+        gallery_path: The gallery (.npy).
+        matrix_dir: Where to write the matrix.
+        k: How many results to keep per query.
+        query_block_size: How many queries a worker scores at once.
+        gallery_block_size: How many gallery embeddings a worker scores at once.
+        num_workers: The number of worker processes.
+
+    Returns:
+        None
+
+    """
+    num_queries = np.load(queries_path, mmap_mode="r").shape[0]
+    k = min(k, np.load(gallery_path, mmap_mode="r").shape[0])
+    SparseTopK.create(matrix_dir, num_queries, k)
+    tasks = [
+        (begin, min(begin + query_block_size, num_queries), k, gallery_block_size)
+        for begin in range(0, num_queries, query_block_size)
+    ]
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(
+        num_workers, open_worker_arrays, (queries_path, gallery_path, matrix_dir)
+    ) as pool:
+        num_done = 0
+        for num_scored in pool.imap_unordered(score_block, tasks):
+            num_done += num_scored
+            logger.info(f"{num_done}/{num_queries} queries scored...")
+    logger.info(f"Top {k} of {num_queries} queries written to {matrix_dir}")
@@ -0,0 +1,94 @@
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, List, Tuple
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    # Coalesces concurrent requests into batches processed by a single worker thread
+    def __init__(
+        self,
+        process_batch: Callable[[List[Any]], List[Any]],
+        max_batch_size: int,
+        max_wait_ms: float,
+    ):
+        """Starts the worker thread.
+
+        The worker waits for a request, then keeps collecting requests until the
+        batch is full or max_wait_ms passed since the first request, and processes
+        them with a single call of process_batch. If the call fails, every request
+        of the batch is processed alone, so only the failing requests get the
+        exception.
+
+        Args:
+            process_batch: Maps a list of requests to the list of their results.
+            max_batch_size: The maximum number of requests in a batch.
+            max_wait_ms: How long to wait for more requests after the first one.
+        """
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.requests: queue.Queue = queue.Queue()
+        self.num_batches = 0
+        self.num_requests = 0
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    def submit(self, request: Any) -> Future:
+        """Queues a request.
+
+        Args:
+            request: The request.
+
+        Returns:
+            A future with the result of the request.
+
+        """
+        future: Future = Future()
+        self.requests.put((request, future))
+
+        return future
+
+    def __call__(self, request: Any) -> Any:
+        return self.submit(request).result()
+
+    def collect_batch(self) -> List[Any]:
+        batch = [self.requests.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=timeout))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def process(self, batch: List[Tuple[Any, Future]]) -> None:
+        try:
+            results = self.process_batch([request for request, _ in batch])
+        except Exception as exception:
+            if len(batch) > 1:
+                # A bad request must not fail the others, so they are retried alone
+                logger.warning("Processing the batch failed, retrying one by one...")
+                for request_future in batch:
+                    self.process([request_future])
+                return
+            logger.exception("Processing the request failed...")
+            batch[0][1].set_exception(exception)
+            return
+        self.num_batches += 1
+        self.num_requests += len(batch)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def run(self) -> None:
+        while True:
+            self.process(self.collect_batch())
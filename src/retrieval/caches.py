@@ -0,0 +1,145 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def get_checkpoint_id(checkpoint_path: str) -> str:
+    """Identifies a checkpoint by its path and by when it was written, so that a
+    checkpoint written again under the same path gets a new id.
+
+    Args:
+        checkpoint_path: The checkpoint prefix, e.g. models/tryout/model.ckpt-100.
+
+    Returns:
+        The id.
+
+    """
+    index_path = checkpoint_path + ".index"
+    stat_path = index_path if os.path.exists(index_path) else checkpoint_path
+
+    return f"{os.path.abspath(checkpoint_path)}@{os.stat(stat_path).st_mtime_ns}"
+
+
+class EmbeddingCache:
+    # A thread safe LRU cache of query embeddings bounded by their size in bytes
+    def __init__(self, max_bytes: int, cache_path: str = None, model_id: str = ""):
+        """Creates the cache and, if a cache path is given and exists, loads the
+        entries saved there by the same model.
+
+        Args:
+            max_bytes: The maximum total size of the cached embeddings.
+            cache_path: Where the cache is saved by EmbeddingCache.save.
+            model_id: The model that embeds the queries, e.g. get_checkpoint_id.
+            The embeddings saved by another model are discarded.
+        """
+        self.max_bytes = max_bytes
+        self.cache_path = cache_path
+        self.model_id = model_id
+        self.entries: OrderedDict = OrderedDict()
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        if cache_path is not None and os.path.exists(cache_path):
+            self.load(cache_path)
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Returns the cached embedding and marks it as the most recently used.
+
+        Args:
+            key: The key, e.g. a pre-processed caption.
+
+        Returns:
+            The embedding or None if it is not cached.
+
+        """
+        with self.lock:
+            embedding = self.entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+            return embedding
+
+    def put(self, key: str, embedding: np.ndarray) -> None:
+        """Caches the embedding, evicting the least recently used embeddings until
+        the cache fits in max_bytes.
+
+        Args:
+            key: The key, e.g. a pre-processed caption.
+            embedding: The embedding.
+
+        Returns:
+            None
+
+        """
+        if embedding.nbytes > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.num_bytes -= self.entries.pop(key).nbytes
+            self.entries[key] = embedding
+            self.num_bytes += embedding.nbytes
+            while self.num_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.num_bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def get_stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "bytes": self.num_bytes,
+            }
+
+    def save(self, cache_path: str = None) -> None:
+        """Saves the entries from the least to the most recently used, so the order
+        survives restarts.
+
+        Args:
+            cache_path: Where to save the cache, by default the path given when the
+            cache was created.
+
+        Returns:
+            None
+
+        """
+        cache_path = cache_path or self.cache_path
+        with self.lock:
+            keys = list(self.entries.keys())
+            embeddings = list(self.entries.values())
+        # Written to a temporary file first so a crash never leaves a corrupt cache
+        with open(cache_path + ".tmp", "wb") as file:
+            np.savez(
+                file,
+                model_id=np.array(self.model_id),
+                keys=np.array(keys, dtype=str),
+                embeddings=np.stack(embeddings) if embeddings else np.zeros((0, 0)),
+            )
+        os.replace(cache_path + ".tmp", cache_path)
+        logger.info(f"Saved {len(keys)} cached embeddings to {cache_path}")
+
+    def load(self, cache_path: str) -> None:
+        with np.load(cache_path) as cache_file:
+            model_id = str(cache_file["model_id"]) if "model_id" in cache_file else ""
+            if model_id != self.model_id:
+                logger.info(f"Discarding {cache_path}, saved by another model")
+                return
+            keys = cache_file["keys"]
+            embeddings = cache_file["embeddings"]
+        for key, embedding in zip(keys, embeddings):
+            self.put(str(key), embedding)
+        logger.info(f"Loaded {len(self.entries)} cached embeddings from {cache_path}")
@@ -0,0 +1,114 @@
+import logging
+from typing import List, Tuple
+
+import numpy as np
+
+from retrieval.top_k import exact_top_k
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def get_category_index_path(index_path: str) -> str:
+    # The category index is kept next to the index file whose rows it lists
+    return index_path + ".categories.npz"
+
+
+class CategoryIndex:
+    # Per category posting lists over the rows of an embedding index
+    def __init__(self, names: List[str], codes: np.ndarray):
+        """Builds the posting lists, stored as a single array of rows sorted by
+        category together with the offset of every category.
+
+        Args:
+            names: The names of the categories.
+            codes: The category of every row, as an index in names.
+        """
+        self.names = list(names)
+        self.codes = np.asarray(codes, dtype=np.int32)
+        self.name_to_code = {name: code for code, name in enumerate(self.names)}
+        # The stable sort keeps the rows of every category in increasing order
+        self.rows = np.argsort(self.codes, kind="stable")
+        self.offsets = np.zeros(len(self.names) + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum(np.bincount(self.codes, minlength=len(names)))
+
+    @staticmethod
+    def from_categories(categories: List[str]) -> "CategoryIndex":
+        names = sorted(set(categories))
+        name_to_code = {name: code for code, name in enumerate(names)}
+
+        return CategoryIndex(names, [name_to_code[category] for category in categories])
+
+    def get_rows(self, category: str) -> np.ndarray:
+        """Returns the posting list of a category.
+
+        Args:
+            category: The category.
+
+        Returns:
+            The sorted rows of the category.
+
+        """
+        if category not in self.name_to_code:
+            raise ValueError(f"Unknown category: {category}")
+        code = self.name_to_code[category]
+
+        return self.rows[self.offsets[code] : self.offsets[code + 1]]
+
+    def search(
+        self, queries: np.ndarray, embeddings: np.ndarray, k: int, category: str
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Finds the top K embeddings of a category for each query, scanning only the
+        rows of the category.
+
+        Args:
+            queries: The queries with shape [Q, D].
+            embeddings: The embeddings of all the rows with shape [N, D].
+            k: How many results to return per query.
+            category: The category.
+
+        Returns:
+            The rows and the scores of the results, both with shape [Q, K] and sorted
+            by decreasing score.
+
+        """
+        rows = self.get_rows(category)
+        if len(rows) == 0:
+            return (
+                np.zeros((queries.shape[0], 0), dtype=np.int64),
+                np.zeros((queries.shape[0], 0), dtype=np.float32),
+            )
+        if rows[-1] - rows[0] + 1 == len(rows):
+            # Contiguous rows are scanned in place, without gathering them
+            top_ids, top_scores = exact_top_k(
+                queries, embeddings[rows[0] : rows[-1] + 1], k
+            )
+            return top_ids + rows[0], top_scores
+        top_ids, top_scores = exact_top_k(queries, embeddings[rows], k)
+
+        return rows[top_ids], top_scores
+
+    def append(self, categories: List[str]) -> "CategoryIndex":
+        """Returns the index extended with new rows.
+
+        Args:
+            categories: The categories of the new rows.
+
+        Returns:
+            The new index.
+
+        """
+        names = self.names + sorted(set(categories) - set(self.names))
+        name_to_code = {name: code for code, name in enumerate(names)}
+        codes = [name_to_code[category] for category in categories]
+
+        return CategoryIndex(names, np.concatenate([self.codes, codes]))
+
+    def save(self, index_path: str) -> None:
+        with open(index_path, "wb") as file:
+            np.savez(file, names=np.array(self.names, dtype=str), codes=self.codes)
+
+    @staticmethod
+    def load(index_path: str) -> "CategoryIndex":
+        with np.load(index_path) as index_file:
+            return CategoryIndex(index_file["names"].tolist(), index_file["codes"])
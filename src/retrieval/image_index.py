@@ -0,0 +1,209 @@
+import os
+import hashlib
+import logging
+from typing import Dict, List, NamedTuple, Tuple
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+image_extensions = (".jpg", ".jpeg")
+# The row of the table lines of the images that were removed from the folder
+removed_row = -1
+
+
+class FileFingerprint(NamedTuple):
+    path: str
+    size: int
+    mtime_ns: int
+    sha1: str
+
+
+class ImageIndex:
+    # An append only on-disk index of image embeddings
+    def __init__(self, index_dir: str, dim: int):
+        """Opens the index in the directory or creates an empty one.
+
+        The index is made of:
+
+        1. embeddings.f32: The embeddings as a contiguous float32 matrix.
+        2. paths.tsv: A log where every line assigns a row of the matrix to an image
+        path, together with the size, modification time and hash of the file. When a
+        path appears more than once the last line is the valid one, and a line with
+        the row -1 removes the path.
+
+        Args:
+            index_dir: The directory of the index.
+            dim: The dimension of the embeddings.
+        """
+        os.makedirs(index_dir, exist_ok=True)
+        self.dim = dim
+        self.embeddings_path = os.path.join(index_dir, "embeddings.f32")
+        self.table_path = os.path.join(index_dir, "paths.tsv")
+        self.path_to_entry: Dict[str, Tuple[int, FileFingerprint]] = {}
+        self.sha1_to_row: Dict[str, int] = {}
+        self.num_rows = 0
+        if os.path.exists(self.table_path):
+            self.read_table()
+        # Drop the rows written by an update that was interrupted before its table
+        # lines were written
+        with open(self.embeddings_path, "ab") as file:
+            file.truncate(self.num_rows * self.dim * 4)
+        logger.info(f"Index with {len(self.path_to_entry)} images opened...")
+
+    def read_table(self) -> None:
+        with open(self.table_path, "r") as file:
+            for line in file:
+                row, size, mtime_ns, sha1, path = line[:-1].split("\t", 4)
+                if int(row) == removed_row:
+                    self.path_to_entry.pop(path, None)
+                    continue
+                fingerprint = FileFingerprint(path, int(size), int(mtime_ns), sha1)
+                self.path_to_entry[path] = (int(row), fingerprint)
+                self.sha1_to_row[sha1] = int(row)
+                self.num_rows = max(self.num_rows, int(row) + 1)
+
+    def write_table(self, entries: List[Tuple[int, FileFingerprint]]) -> None:
+        with open(self.table_path, "a") as file:
+            for row, fingerprint in entries:
+                file.write(
+                    f"{row}\t{fingerprint.size}\t{fingerprint.mtime_ns}\t"
+                    f"{fingerprint.sha1}\t{fingerprint.path}\n"
+                )
+                if row == removed_row:
+                    self.path_to_entry.pop(fingerprint.path, None)
+                    continue
+                self.path_to_entry[fingerprint.path] = (row, fingerprint)
+                self.sha1_to_row[fingerprint.sha1] = row
+
+    @staticmethod
+    def list_images(images_dir: str) -> List[str]:
+        """Lists all images in the directory and its subdirectories.
+
+        Args:
+            images_dir: The directory with the images.
+
+        Returns:
+            The sorted image paths.
+
+        """
+        image_paths = []
+        for root, _, file_names in os.walk(images_dir):
+            for file_name in file_names:
+                if file_name.lower().endswith(image_extensions):
+                    image_paths.append(os.path.join(root, file_name))
+
+        return sorted(image_paths)
+
+    @staticmethod
+    def hash_file(file_path: str) -> str:
+        sha1 = hashlib.sha1()
+        with open(file_path, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                sha1.update(chunk)
+
+        return sha1.hexdigest()
+
+    def get_pending(self, image_paths: List[str]) -> List[FileFingerprint]:
+        """Finds the images that have to be embedded.
+
+        1. Images whose path, size and modification time did not change are skipped
+        without being read.
+        2. Images whose content is already in the index, because they were touched,
+        copied or moved, are assigned the existing row without being embedded.
+        3. The rest are returned.
+
+        The images of the index that are not in the image paths anymore, because they
+        were moved or deleted, are removed from the index. Their rows stay in the
+        embeddings, to be reused if the same content comes back.
+
+        Args:
+            image_paths: The image paths.
+
+        Returns:
+            The fingerprints of the images to embed.
+
+        """
+        pending = []
+        reused = []
+        for image_path in image_paths:
+            stat = os.stat(image_path)
+            entry = self.path_to_entry.get(image_path)
+            if (
+                entry is not None
+                and entry[1].size == stat.st_size
+                and entry[1].mtime_ns == stat.st_mtime_ns
+            ):
+                continue
+            fingerprint = FileFingerprint(
+                image_path, stat.st_size, stat.st_mtime_ns, self.hash_file(image_path)
+            )
+            if fingerprint.sha1 in self.sha1_to_row:
+                reused.append((self.sha1_to_row[fingerprint.sha1], fingerprint))
+            else:
+                pending.append(fingerprint)
+        removed = [
+            (removed_row, FileFingerprint(image_path, 0, 0, ""))
+            for image_path in sorted(set(self.path_to_entry).difference(image_paths))
+        ]
+        self.write_table(reused + removed)
+        logger.info(
+            f"{len(pending)} images to embed, {len(reused)} reused, "
+            f"{len(image_paths) - len(pending) - len(reused)} unchanged and "
+            f"{len(removed)} removed..."
+        )
+
+        return pending
+
+    def append(
+        self, fingerprints: List[FileFingerprint], embeddings: np.ndarray
+    ) -> None:
+        """Appends the embeddings of the images to the index.
+
+        Args:
+            fingerprints: The fingerprints of the images.
+            embeddings: The embeddings of the images.
+
+        Returns:
+            None
+
+        """
+        assert embeddings.shape == (len(fingerprints), self.dim)
+        # The embeddings are written before the table, so an interruption never
+        # leaves a path pointing to a missing row
+        with open(self.embeddings_path, "ab") as file:
+            file.write(np.ascontiguousarray(embeddings, dtype=np.float32).tobytes())
+        rows = range(self.num_rows, self.num_rows + len(fingerprints))
+        self.num_rows += len(fingerprints)
+        self.write_table(list(zip(rows, fingerprints)))
+
+    def get_embeddings(self) -> np.ndarray:
+        """Memory maps the embeddings of the index.
+
+        Returns:
+            The embeddings with shape [num_rows, dim].
+
+        """
+        if self.num_rows == 0:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.memmap(
+            self.embeddings_path,
+            dtype=np.float32,
+            mode="r",
+            shape=(self.num_rows, self.dim),
+        )
+
+    def get_paths(self) -> Tuple[List[str], np.ndarray]:
+        """Returns the indexed image paths and the row of each of them.
+
+        Returns:
+            The image paths and their rows.
+
+        """
+        image_paths = sorted(self.path_to_entry.keys())
+        rows = np.array(
+            [self.path_to_entry[path][0] for path in image_paths], dtype=np.int64
+        )
+
+        return image_paths, rows
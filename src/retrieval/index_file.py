@@ -0,0 +1,470 @@
+import os
+import zlib
+import shutil
+import struct
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from retrieval.quantizers import BaseQuantizer
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Layout of an index file, where every offset is absolute:
+#
+# [0, 4096)            two header slots, each followed by the directory of the
+#                      quantizer params and a crc32 of the slot
+# [param offsets)      the quantizer params, e.g. the codebooks (optional)
+# [embeddings_offset)  the embeddings (or codes) with shape [count, dim], contiguous,
+#                      with room for [capacity, dim]
+# [table_offset)       ids int64[count], path offsets int64[count + 1], paths utf-8
+#
+# An append writes the new rows to the room after the embeddings and the new table
+# after the end of the file, then the header to the slot of the next generation.
+# Readers use the valid slot of the latest generation, so they see either the old or
+# the new index, and the old table stays in place for the readers that mapped it.
+magic = b"MHAINDEX"
+# The size of the model id field of the header
+max_model_id_bytes = 64
+version = 2
+header_size = 4096
+header_slot_size = header_size // 2
+block_alignment = 4096
+header_format = "<8sIIQQQ8s64s16sQQQIII"
+param_format = "<16s8sI4IQ"
+max_params = (header_slot_size - struct.calcsize(header_format) - 4) // struct.calcsize(
+    param_format
+)
+# The room for the embeddings, relative to their count, when an index is written
+capacity_growth = 1.5
+
+
+def align(offset: int, alignment: int = block_alignment) -> int:
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def checksum(file_path: str, begin: int, end: int, crc: int = 0) -> int:
+    with open(file_path, "rb") as file:
+        file.seek(begin)
+        while begin < end:
+            chunk = file.read(min(end - begin, 1 << 24))
+            if not chunk:
+                break
+            crc = zlib.crc32(chunk, crc)
+            begin += len(chunk)
+
+    return crc
+
+
+class IndexFile:
+    # A versioned binary index of embeddings that is memory mapped without parsing
+    def __init__(self, index_path: str):
+        """Opens an index written by IndexFile.write. Only the header is read, the
+        embeddings, the ids, the paths and the params are memory mapped, so opening
+        is instant regardless of the size and processes share the page cache.
+
+        Args:
+            index_path: The path to the index.
+        """
+        self.index_path = index_path
+        self.header = self.read_header(index_path)
+        self.dim = self.header["dim"]
+        self.count = self.header["count"]
+        self.dtype = np.dtype(self.header["dtype"])
+        self.model_id = self.header["model_id"]
+        self.quantizer_name = self.header["quantizer"]
+        self.embeddings = self.map_array(
+            self.header["embeddings_offset"], self.dtype, (self.count, self.dim)
+        )
+        table_offset = self.header["table_offset"]
+        self.ids = self.map_array(table_offset, np.dtype(np.int64), (self.count,))
+        self.path_offsets = self.map_array(
+            table_offset + 8 * self.count, np.dtype(np.int64), (self.count + 1,)
+        )
+        self.path_bytes = self.map_array(
+            table_offset + 16 * self.count + 8,
+            np.dtype(np.uint8),
+            (self.header["path_bytes"],),
+        )
+        self.params = {
+            name: self.map_array(offset, dtype, shape)
+            for name, (dtype, shape, offset) in self.header["params"].items()
+        }
+
+    def map_array(self, offset: int, dtype: np.dtype, shape: Tuple) -> np.ndarray:
+        if int(np.prod(shape)) == 0:
+            return np.zeros(shape, dtype=dtype)
+        # np.memmap maps scalars as arrays with a single element
+        return np.memmap(self.index_path, dtype, "r", offset, shape or (1,)).reshape(
+            shape
+        )
+
+    @staticmethod
+    def read_header(index_path: str) -> Dict:
+        """Reads the header of the latest generation and the directory of the params.
+
+        Args:
+            index_path: The path to the index.
+
+        Returns:
+            The fields of the header.
+
+        """
+        with open(index_path, "rb") as file:
+            buffer = file.read(header_size)
+        headers = []
+        if len(buffer) == header_size:
+            for begin in range(0, header_size, header_slot_size):
+                header = IndexFile.parse_header(
+                    buffer[begin : begin + header_slot_size]
+                )
+                if header is not None:
+                    headers.append(header)
+        if not headers:
+            raise ValueError(f"{index_path} is not an index file!")
+
+        return max(headers, key=lambda header: header["generation"])
+
+    @staticmethod
+    def parse_header(buffer: bytes) -> Optional[Dict]:
+        # An empty slot, or one torn by an interrupted append, is skipped
+        if buffer[: len(magic)] != magic:
+            return None
+        fields = struct.unpack_from(header_format, buffer)
+        if fields[1] != version:
+            raise ValueError(f"Unsupported index file version: {fields[1]}")
+        if (
+            zlib.crc32(buffer[:-4])
+            != struct.unpack_from("<I", buffer, len(buffer) - 4)[0]
+        ):
+            return None
+        header = {
+            "dim": fields[2],
+            "count": fields[3],
+            "capacity": fields[4],
+            "generation": fields[5],
+            "dtype": fields[6].rstrip(b"\0").decode("ascii"),
+            "model_id": fields[7].rstrip(b"\0").decode("utf-8"),
+            "quantizer": fields[8].rstrip(b"\0").decode("ascii"),
+            "embeddings_offset": fields[9],
+            "table_offset": fields[10],
+            "path_bytes": fields[11],
+            "embeddings_crc32": fields[12],
+            "table_crc32": fields[13],
+            "params": {},
+        }
+        position = struct.calcsize(header_format)
+        for _ in range(fields[14]):
+            name, dtype, ndim, *shape, offset = struct.unpack_from(
+                param_format, buffer, position
+            )
+            header["params"][name.rstrip(b"\0").decode("ascii")] = (
+                np.dtype(dtype.rstrip(b"\0").decode("ascii")),
+                tuple(shape[:ndim]),
+                offset,
+            )
+            position += struct.calcsize(param_format)
+
+        return header
+
+    @staticmethod
+    def write_header(file, header: Dict) -> None:
+        # Every generation goes to the other slot, so the previous header stays valid
+        # until this one is written
+        buffer = bytearray(header_slot_size)
+        struct.pack_into(
+            header_format,
+            buffer,
+            0,
+            magic,
+            version,
+            header["dim"],
+            header["count"],
+            header["capacity"],
+            header["generation"],
+            header["dtype"].encode("ascii"),
+            header["model_id"].encode("utf-8"),
+            header["quantizer"].encode("ascii"),
+            header["embeddings_offset"],
+            header["table_offset"],
+            header["path_bytes"],
+            header["embeddings_crc32"],
+            header["table_crc32"],
+            len(header["params"]),
+        )
+        position = struct.calcsize(header_format)
+        for name, (dtype, shape, offset) in header["params"].items():
+            struct.pack_into(
+                param_format,
+                buffer,
+                position,
+                name.encode("ascii"),
+                dtype.str.encode("ascii"),
+                len(shape),
+                *(list(shape) + [0] * (4 - len(shape))),
+                offset,
+            )
+            position += struct.calcsize(param_format)
+        struct.pack_into("<I", buffer, header_slot_size - 4, zlib.crc32(buffer[:-4]))
+        file.seek(header["generation"] % 2 * header_slot_size)
+        file.write(buffer)
+
+    @staticmethod
+    def encode_table(ids: np.ndarray, paths: List[str]) -> bytes:
+        encoded_paths = [path.encode("utf-8") for path in paths]
+        path_offsets = np.zeros(len(paths) + 1, dtype=np.int64)
+        path_offsets[1:] = np.cumsum([len(path) for path in encoded_paths])
+
+        return (
+            np.asarray(ids, dtype=np.int64).tobytes()
+            + path_offsets.tobytes()
+            + b"".join(encoded_paths)
+        )
+
+    @staticmethod
+    def write(
+        index_path: str,
+        embeddings: np.ndarray,
+        ids: np.ndarray,
+        paths: List[str],
+        model_id: str,
+        quantizer: BaseQuantizer = None,
+        capacity: int = None,
+    ) -> None:
+        """Writes an index. The file is written next to the index path and renamed,
+        so readers never see a partial index.
+
+        Args:
+            index_path: Where to write the index.
+            embeddings: The embeddings with shape [N, D], or the codes of the
+            quantizer.
+            ids: The id of every embedding.
+            paths: The path of every embedding.
+            model_id: Identifies the model that embedded the gallery.
+            quantizer: The quantizer of the codes, whose params are saved, if any.
+            capacity: How many embeddings the file has room for, so that appends
+            within it are written in place, by default capacity_growth times their
+            count. The room is left as a hole, which takes no space on most file
+            systems.
+
+        Returns:
+            None
+
+        """
+        assert embeddings.ndim == 2 and len(ids) == len(paths) == embeddings.shape[0]
+        # A longer id would be cut by the header and never match in append
+        if len(model_id.encode("utf-8")) > max_model_id_bytes:
+            raise ValueError(f"Wrong model id, longer than {max_model_id_bytes} bytes!")
+        params = {} if quantizer is None else quantizer.get_params()
+        if len(params) > max_params:
+            raise ValueError("Too many quantizer params!")
+        if capacity is None:
+            capacity = int(embeddings.shape[0] * capacity_growth)
+        header = {
+            "dim": embeddings.shape[1],
+            "count": embeddings.shape[0],
+            "capacity": max(capacity, embeddings.shape[0]),
+            "generation": 0,
+            "dtype": embeddings.dtype.str,
+            "model_id": model_id,
+            "quantizer": "" if quantizer is None else quantizer.name,
+            "params": {},
+        }
+        with open(index_path + ".tmp", "wb") as file:
+            offset = header_size
+            for name, param in params.items():
+                param = np.array(param, order="C")
+                file.seek(offset)
+                file.write(param.tobytes())
+                header["params"][name] = (param.dtype, param.shape, offset)
+                offset = align(offset + param.nbytes, 64)
+            header["embeddings_offset"] = align(offset)
+            file.seek(header["embeddings_offset"])
+            data = np.ascontiguousarray(embeddings).tobytes()
+            file.write(data)
+            header["embeddings_crc32"] = zlib.crc32(data)
+            header["table_offset"] = align(
+                header["embeddings_offset"]
+                + header["capacity"] * embeddings.shape[1] * embeddings.dtype.itemsize,
+                64,
+            )
+            file.seek(header["table_offset"])
+            table = IndexFile.encode_table(ids, paths)
+            file.write(table)
+            header["path_bytes"] = len(table) - 16 * len(ids) - 8
+            header["table_crc32"] = zlib.crc32(table)
+            IndexFile.write_header(file, header)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(index_path + ".tmp", index_path)
+        logger.info(f"Index with {len(ids)} embeddings written to {index_path}")
+
+    @staticmethod
+    def append(
+        index_path: str,
+        embeddings: np.ndarray,
+        ids: np.ndarray,
+        paths: List[str],
+        model_id: str,
+    ) -> None:
+        """Appends embeddings. If the room after the embeddings is large enough, the
+        new rows are written there and the new table after the end of the file, and
+        the header is switched last, so appending costs only the new rows and the
+        table. Otherwise the index is copied once into a file with more room, which
+        is renamed like in write. Either way the processes that have the index
+        memory mapped keep reading the old index and an interrupted append leaves the
+        old index intact.
+
+        Args:
+            index_path: The path to the index.
+            embeddings: The new embeddings (or codes) with shape [N, D].
+            ids: The id of every new embedding.
+            paths: The path of every new embedding.
+            model_id: The model that embedded the new embeddings, which must be the
+            model of the index.
+
+        Returns:
+            None
+
+        """
+        index = IndexFile(index_path)
+        if model_id != index.model_id:
+            raise ValueError(f"Wrong model id: {model_id} instead of {index.model_id}")
+        if embeddings.shape[1] != index.dim or embeddings.dtype != index.dtype:
+            raise ValueError("Wrong shape or dtype of the embeddings!")
+        assert len(ids) == len(paths) == embeddings.shape[0]
+        all_ids = np.concatenate([index.ids, np.asarray(ids, dtype=np.int64)])
+        all_paths = index.get_paths() + list(paths)
+        header = index.header
+        del index
+        row_size = header["dim"] * np.dtype(header["dtype"]).itemsize
+        embeddings_end = header["embeddings_offset"] + header["count"] * row_size
+        if len(all_ids) <= header["capacity"]:
+            file_path = index_path
+            table_offset = align(os.path.getsize(index_path), 64)
+        else:
+            header["capacity"] = int(len(all_ids) * capacity_growth)
+            file_path = index_path + ".tmp"
+            shutil.copyfile(index_path, file_path)
+            table_offset = align(
+                header["embeddings_offset"] + header["capacity"] * row_size, 64
+            )
+        with open(file_path, "r+b") as file:
+            file.seek(embeddings_end)
+            data = np.ascontiguousarray(embeddings).tobytes()
+            file.write(data)
+            header["embeddings_crc32"] = zlib.crc32(data, header["embeddings_crc32"])
+            file.seek(table_offset)
+            table = IndexFile.encode_table(all_ids, all_paths)
+            file.write(table)
+            file.truncate()
+            # The rows and the table are on disk before the header points to them
+            file.flush()
+            os.fsync(file.fileno())
+            header["count"] = len(all_ids)
+            header["generation"] += 1
+            header["table_offset"] = table_offset
+            header["path_bytes"] = len(table) - 16 * len(all_ids) - 8
+            header["table_crc32"] = zlib.crc32(table)
+            IndexFile.write_header(file, header)
+            file.flush()
+            os.fsync(file.fileno())
+        if file_path != index_path:
+            os.replace(file_path, index_path)
+        logger.info(f"{len(ids)} embeddings appended to {index_path}")
+
+    @staticmethod
+    def verify(index_path: str, check_data: bool = True) -> List[str]:
+        """Checks that an index is consistent.
+
+        Args:
+            index_path: The path to the index.
+            check_data: Whether to also check the checksums, which reads the whole
+            index.
+
+        Returns:
+            The problems found, empty if the index is valid.
+
+        """
+        try:
+            header = IndexFile.read_header(index_path)
+        except (ValueError, struct.error) as error:
+            return [str(error)]
+        problems = []
+        file_size = os.path.getsize(index_path)
+        row_size = header["dim"] * np.dtype(header["dtype"]).itemsize
+        embeddings_end = header["embeddings_offset"] + header["count"] * row_size
+        capacity_end = header["embeddings_offset"] + header["capacity"] * row_size
+        table_end = (
+            header["table_offset"] + 16 * header["count"] + 8 + header["path_bytes"]
+        )
+        for name, (dtype, shape, offset) in header["params"].items():
+            end = offset + dtype.itemsize * int(np.prod(shape))
+            if offset < header_size or end > header["embeddings_offset"]:
+                problems.append(f"The param {name} overlaps other sections")
+        if header["embeddings_offset"] % block_alignment != 0:
+            problems.append("The embeddings are not aligned")
+        if header["count"] > header["capacity"]:
+            problems.append("The embeddings exceed their capacity")
+        if capacity_end > header["table_offset"]:
+            problems.append("The embeddings overlap the table")
+        if table_end != file_size:
+            problems.append(f"The file has {file_size} bytes instead of {table_end}")
+        if problems:
+            return problems
+
+        index = IndexFile(index_path)
+        path_offsets = np.asarray(index.path_offsets)
+        if (
+            path_offsets[0] != 0
+            or path_offsets[-1] != header["path_bytes"]
+            or np.any(np.diff(path_offsets) < 0)
+        ):
+            problems.append("The path offsets are corrupt")
+        if len(np.unique(index.ids)) != index.count:
+            problems.append("The ids are not unique")
+        if index.quantizer_name:
+            try:
+                BaseQuantizer.from_params(index.quantizer_name, index.params)
+            except (KeyError, ValueError) as error:
+                problems.append(f"The quantizer params are corrupt: {error}")
+        if check_data:
+            crc = checksum(index_path, header["embeddings_offset"], embeddings_end)
+            if crc != header["embeddings_crc32"]:
+                problems.append("The checksum of the embeddings does not match")
+            crc = checksum(index_path, header["table_offset"], table_end)
+            if crc != header["table_crc32"]:
+                problems.append("The checksum of the table does not match")
+
+        return problems
+
+    def get_path(self, row: int) -> str:
+        begin, end = self.path_offsets[row], self.path_offsets[row + 1]
+        return bytes(self.path_bytes[begin:end]).decode("utf-8")
+
+    def get_paths(self) -> List[str]:
+        paths = bytes(self.path_bytes).decode("utf-8")
+        if self.path_bytes.shape[0] == len(paths):
+            # ASCII paths, where byte offsets are character offsets
+            return [
+                paths[begin:end]
+                for begin, end in zip(self.path_offsets[:-1], self.path_offsets[1:])
+            ]
+        return [self.get_path(row) for row in range(self.count)]
+
+    def get_quantizer(self) -> BaseQuantizer:
+        """Creates the quantizer of the index from its params, with the memory mapped
+        codes of the index.
+
+        Returns:
+            The quantizer.
+
+        """
+        if not self.quantizer_name:
+            raise ValueError("The index is not quantized!")
+        quantizer = BaseQuantizer.from_params(self.quantizer_name, self.params)
+        quantizer.codes = self.embeddings
+
+        return quantizer
@@ -0,0 +1,363 @@
+import logging
+from abc import ABC, abstractmethod
+from typing import Dict, Tuple
+
+import numpy as np
+
+from retrieval.top_k import merge_top_k
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class BaseQuantizer(ABC):
+
+    # Abstract class from which all quantized indexes must inherit
+    def __init__(self):
+        self.codes: np.ndarray = None
+
+    @abstractmethod
+    def fit(self, embeddings: np.ndarray) -> None:
+        """Learns the quantization parameters from a sample of embeddings.
+
+        Args:
+            embeddings: The training embeddings with shape [N, D].
+
+        Returns:
+            None
+
+        """
+        pass
+
+    @abstractmethod
+    def encode(self, embeddings: np.ndarray) -> np.ndarray:
+        """Quantizes the embeddings.
+
+        Args:
+            embeddings: The embeddings with shape [N, D].
+
+        Returns:
+            The codes with shape [N, code_size].
+
+        """
+        pass
+
+    @abstractmethod
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """Reconstructs the embeddings from their codes.
+
+        Args:
+            codes: The codes with shape [N, code_size].
+
+        Returns:
+            The reconstructed embeddings with shape [N, D].
+
+        """
+        pass
+
+    @abstractmethod
+    def asymmetric_scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Computes the dot products between the full precision queries and the
+        quantized embeddings, without reconstructing the embeddings.
+
+        Args:
+            queries: The queries with shape [Q, D].
+            codes: The codes with shape [N, code_size].
+
+        Returns:
+            The scores with shape [Q, N].
+
+        """
+        pass
+
+    @abstractmethod
+    def get_params(self) -> Dict[str, np.ndarray]:
+        """Returns the learned parameters, to be saved together with the codes."""
+        pass
+
+    @abstractmethod
+    def set_params(self, params: Dict[str, np.ndarray]) -> None:
+        """Restores the parameters returned by get_params."""
+        pass
+
+    def add(self, embeddings: np.ndarray) -> None:
+        """Quantizes the embeddings and appends them to the index.
+
+        Args:
+            embeddings: The embeddings with shape [N, D].
+
+        Returns:
+            None
+
+        """
+        codes = self.encode(embeddings)
+        self.codes = codes if self.codes is None else np.vstack([self.codes, codes])
+
+    def search(
+        self, queries: np.ndarray, k: int, block_size: int = 65536
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Finds the top K indexed embeddings for each query. The index is scanned in
+        blocks and the top K of each block is merged with the running top K, so the
+        memory does not grow with the size of the index.
+
+        Args:
+            queries: The queries with shape [Q, D].
+            k: How many results to return per query.
+            block_size: How many indexed embeddings to score at once.
+
+        Returns:
+            The ids and the scores of the results, both with shape [Q, K] and sorted
+            by decreasing score.
+
+        """
+        k = min(k, self.codes.shape[0])
+        top_ids = np.zeros((queries.shape[0], 0), dtype=np.int64)
+        top_scores = np.zeros((queries.shape[0], 0), dtype=np.float32)
+        for begin in range(0, self.codes.shape[0], block_size):
+            scores = self.asymmetric_scores(
+                queries, self.codes[begin : begin + block_size]
+            )
+            ids = np.broadcast_to(
+                np.arange(begin, begin + scores.shape[1]), scores.shape
+            )
+            top_ids, top_scores = merge_top_k(
+                np.hstack([top_ids, ids]), np.hstack([top_scores, scores]), k
+            )
+
+        return top_ids, top_scores
+
+    def save(self, index_path: str) -> None:
+        """Saves the quantizer and the codes of the index.
+
+        Args:
+            index_path: Where to save the index (.npz).
+
+        Returns:
+            None
+
+        """
+        np.savez(
+            index_path,
+            quantizer=np.array(self.name),
+            codes=self.codes,
+            **self.get_params(),
+        )
+
+    @staticmethod
+    def load(index_path: str) -> "BaseQuantizer":
+        """Loads an index saved with BaseQuantizer.save.
+
+        Args:
+            index_path: The path to the index.
+
+        Returns:
+            The quantizer with the codes of the index.
+
+        """
+        with np.load(index_path) as index_file:
+            params = {key: index_file[key] for key in index_file.files}
+        name = str(params.pop("quantizer"))
+        codes = params.pop("codes")
+        quantizer = BaseQuantizer.from_params(name, params)
+        quantizer.codes = codes
+
+        return quantizer
+
+    @staticmethod
+    def from_params(name: str, params: Dict[str, np.ndarray]) -> "BaseQuantizer":
+        """Creates a fitted quantizer without codes.
+
+        Args:
+            name: The name of the quantizer.
+            params: The parameters returned by get_params.
+
+        Returns:
+            The quantizer.
+
+        """
+        if name == ScalarQuantizer.name:
+            quantizer: BaseQuantizer = ScalarQuantizer()
+        elif name == ProductQuantizer.name:
+            quantizer = ProductQuantizer(int(params["num_subspaces"]))
+        else:
+            raise ValueError(f"Unknown quantizer: {name}")
+        quantizer.set_params(params)
+
+        return quantizer
+
+
+class ScalarQuantizer(BaseQuantizer):
+
+    # Quantizes every dimension to 8 bits, 4x smaller than float32
+    name = "scalar"
+
+    def __init__(self):
+        super().__init__()
+        self.minimum: np.ndarray = None
+        self.scale: np.ndarray = None
+
+    def fit(self, embeddings: np.ndarray) -> None:
+        self.minimum = embeddings.min(axis=0).astype(np.float32)
+        self.scale = np.maximum(
+            (embeddings.max(axis=0) - self.minimum) / 255, 1e-12
+        ).astype(np.float32)
+
+    def encode(self, embeddings: np.ndarray) -> np.ndarray:
+        codes = np.rint((embeddings - self.minimum) / self.scale)
+
+        return np.clip(codes, 0, 255).astype(np.uint8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return codes.astype(np.float32) * self.scale + self.minimum
+
+    def asymmetric_scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        # q . (minimum + scale * code) = q . minimum + (q * scale) . code
+        scaled_queries = (queries * self.scale).astype(np.float32)
+        offsets = np.dot(queries, self.minimum).astype(np.float32)
+
+        return np.dot(scaled_queries, codes.T.astype(np.float32)) + offsets[:, None]
+
+    def get_params(self) -> Dict[str, np.ndarray]:
+        return {"minimum": self.minimum, "scale": self.scale}
+
+    def set_params(self, params: Dict[str, np.ndarray]) -> None:
+        self.minimum = params["minimum"]
+        self.scale = params["scale"]
+
+
+class ProductQuantizer(BaseQuantizer):
+
+    # As per: https://hal.inria.fr/inria-00514462v2/document
+    name = "product"
+
+    def __init__(
+        self,
+        num_subspaces: int,
+        num_centroids: int = 256,
+        num_iters: int = 20,
+        seed: int = 42,
+    ):
+        """Creates a product quantizer, which splits the embeddings in subspaces and
+        replaces every subvector with the id of its closest k-means centroid.
+
+        Args:
+            num_subspaces: In how many subspaces to split the embeddings, which is
+            also the number of bytes per code.
+            num_centroids: The number of centroids per subspace (at most 256).
+            num_iters: The number of k-means iterations.
+            seed: The seed of the k-means initialization.
+        """
+        super().__init__()
+        assert num_centroids <= 256
+        self.num_subspaces = num_subspaces
+        self.num_centroids = num_centroids
+        self.num_iters = num_iters
+        self.seed = seed
+        # [M, C, D / M]
+        self.codebooks: np.ndarray = None
+
+    @staticmethod
+    def kmeans(
+        data: np.ndarray, num_clusters: int, num_iters: int, seed: int
+    ) -> np.ndarray:
+        """Clusters the data with Lloyd's k-means.
+
+        Args:
+            data: The data with shape [N, D].
+            num_clusters: The number of clusters.
+            num_iters: The number of iterations.
+            seed: The seed of the initialization.
+
+        Returns:
+            The centroids with shape [num_clusters, D].
+
+        """
+        random_state = np.random.RandomState(seed)
+        num_clusters = min(num_clusters, data.shape[0])
+        centroids = data[
+            random_state.choice(data.shape[0], num_clusters, replace=False)
+        ].copy()
+        for _ in range(num_iters):
+            assignments = ProductQuantizer.assign(data, centroids)
+            counts = np.bincount(assignments, minlength=num_clusters)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, data)
+            empty = counts == 0
+            centroids[~empty] = sums[~empty] / counts[~empty, None]
+            # Restart the empty clusters from random points
+            centroids[empty] = data[random_state.choice(data.shape[0], empty.sum())]
+
+        return centroids
+
+    @staticmethod
+    def assign(data: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        """Assigns every point to its closest centroid.
+
+        Args:
+            data: The data with shape [N, D].
+            centroids: The centroids with shape [C, D].
+
+        Returns:
+            The index of the closest centroid of every point.
+
+        """
+        # ||x - c||^2 = ||x||^2 - 2 x . c + ||c||^2, where ||x||^2 does not matter
+        distances = np.sum(centroids**2, axis=1) - 2 * np.dot(data, centroids.T)
+
+        return np.argmin(distances, axis=1)
+
+    def split(self, embeddings: np.ndarray) -> np.ndarray:
+        # [N, D] -> [M, N, D / M]
+        assert embeddings.shape[1] % self.num_subspaces == 0
+        return embeddings.reshape(embeddings.shape[0], self.num_subspaces, -1).swapaxes(
+            0, 1
+        )
+
+    def fit(self, embeddings: np.ndarray) -> None:
+        subvectors = self.split(embeddings.astype(np.float32))
+        self.codebooks = np.stack(
+            [
+                self.kmeans(
+                    subvectors[m], self.num_centroids, self.num_iters, self.seed
+                )
+                for m in range(self.num_subspaces)
+            ]
+        )
+        logger.info(f"Trained {self.num_subspaces} codebooks...")
+
+    def encode(self, embeddings: np.ndarray) -> np.ndarray:
+        subvectors = self.split(embeddings.astype(np.float32))
+
+        return np.stack(
+            [
+                self.assign(subvectors[m], self.codebooks[m])
+                for m in range(self.num_subspaces)
+            ],
+            axis=1,
+        ).astype(np.uint8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return np.concatenate(
+            [self.codebooks[m][codes[:, m]] for m in range(self.num_subspaces)], axis=1
+        )
+
+    def asymmetric_scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        # [M, Q, C] dot products of every query subvector with every centroid
+        tables = np.einsum(
+            "mqd,mcd->mqc", self.split(queries.astype(np.float32)), self.codebooks
+        )
+        scores = np.zeros((queries.shape[0], codes.shape[0]), dtype=np.float32)
+        for m in range(self.num_subspaces):
+            scores += tables[m][:, codes[:, m]]
+
+        return scores
+
+    def get_params(self) -> Dict[str, np.ndarray]:
+        return {
+            "codebooks": self.codebooks,
+            "num_subspaces": np.array(self.num_subspaces),
+        }
+
+    def set_params(self, params: Dict[str, np.ndarray]) -> None:
+        self.codebooks = params["codebooks"]
+        self.num_centroids = self.codebooks.shape[1]
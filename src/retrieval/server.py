@@ -0,0 +1,362 @@
+import os
+import json
+import base64
+import logging
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import tensorflow as tf
+
+from multi_hop_attention.hyperparameters import YParams
+from multi_hop_attention.loaders import BaseLoader
+from multi_hop_attention.models import ImageTower, TextTower
+from retrieval.batching import MicroBatcher
+from retrieval.categories import CategoryIndex, get_category_index_path
+from retrieval.caches import EmbeddingCache
+from retrieval.image_index import ImageIndex
+from retrieval.index_file import IndexFile
+from retrieval.shards import ShardedIndex
+from retrieval.top_k import exact_top_k
+from utils.constants import WIDTH, HEIGHT, NUM_CHANNELS, jpeg_magic
+from utils.datasets import preprocess_caption
+from utils.embeddings import EmbeddingStore
+from utils.word_vectors import WordVectors
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class RetrievalService:
+    def __init__(
+        self,
+        hparams: YParams,
+        checkpoint_path: str,
+        image_index_dir: str,
+        captions_store_dir: str,
+        image_encoder: str,
+        text_encoder: str,
+        word_vectors: WordVectors,
+        max_batch_size: int,
+        max_wait_ms: float,
+        cache: EmbeddingCache = None,
+        num_shards: int = 1,
+        shard_assignment: str = "contiguous",
+    ):
+        """Loads the towers of a trained model and the indexes, and answers text to
+        image and image to text queries. Concurrent queries are coalesced into
+        micro-batches, so every session run embeds and searches many queries.
+
+        Args:
+            hparams: The hyperparameters of the model.
+            checkpoint_path: Path to a valid model checkpoint.
+            image_index_dir: The image index built with build_image_index_pipeline.py,
+            or an index file built with build_index_file_pipeline.py. The text to
+            image queries of an index file with categories can be filtered by
+            category.
+            captions_store_dir: An embedding store whose captions are searched for
+            image to text queries. If None only text to image queries are answered.
+            image_encoder: The CNN used to encode the images.
+            text_encoder: How the words are embedded before the Bi-GRU.
+            word_vectors: The pretrained word vectors, used by word_vectors.
+            max_batch_size: The maximum number of queries in a micro-batch.
+            max_wait_ms: How long to wait for more queries after the first one.
+            cache: Caches the embeddings of the text queries, if given.
+            num_shards: If more than 1, the image gallery is split into shards
+            searched by worker processes.
+            shard_assignment: How the images are assigned to the shards.
+        """
+        self.cache = cache
+        self.category_index: CategoryIndex = None
+        # Image gallery, where the rows of the index that no path points to anymore
+        # are never returned
+        if os.path.isfile(image_index_dir):
+            index: Any = IndexFile(image_index_dir)
+            if index.quantizer_name:
+                raise ValueError("Only float index files can be served!")
+            self.image_embeddings = index.embeddings
+            image_paths, rows = index.get_paths(), np.arange(index.count)
+            category_index_path = get_category_index_path(image_index_dir)
+            if os.path.exists(category_index_path):
+                self.category_index = CategoryIndex.load(category_index_path)
+        else:
+            index = ImageIndex(image_index_dir, hparams.joint_space * hparams.attn_hops)
+            self.image_embeddings = index.get_embeddings()
+            image_paths, rows = index.get_paths()
+        self.row_to_image_path: List[Any] = [None] * self.image_embeddings.shape[0]
+        for image_path, row in zip(image_paths, rows):
+            self.row_to_image_path[row] = image_path
+        self.num_unused_rows = self.row_to_image_path.count(None)
+        self.sharded_index = (
+            ShardedIndex(self.image_embeddings, num_shards, shard_assignment)
+            if num_shards > 1
+            else None
+        )
+        logger.info(f"{len(image_paths)} images loaded...")
+
+        # Caption gallery
+        self.captions: List[str] = []
+        self.caption_embeddings = np.zeros((0, index.dim), dtype=np.float32)
+        if captions_store_dir is not None:
+            store = EmbeddingStore(captions_store_dir)
+            self.captions = store.captions
+            self.caption_embeddings = store.embedded_captions
+            logger.info(f"{len(self.captions)} captions loaded...")
+
+        # Towers
+        tf.reset_default_graph()
+        self.captions_ph = tf.placeholder(tf.string, [None], name="captions")
+        words = tf.sparse_tensor_to_dense(
+            tf.string_split(self.captions_ph), default_value=""
+        )
+        words_len = tf.reduce_sum(tf.cast(tf.not_equal(words, ""), tf.int32), axis=1)
+        self.text_tower = TextTower(
+            words,
+            words_len,
+            hparams.joint_space,
+            hparams.num_layers,
+            hparams.attn_size,
+            hparams.attn_hops,
+            text_encoder,
+            word_vectors,
+        )
+        self.images_ph = tf.placeholder(tf.string, [None], name="images")
+        images = tf.map_fn(
+            lambda image_string: tf.image.resize_image_with_crop_or_pad(
+                BaseLoader.decode_image(image_string), WIDTH, HEIGHT
+            ),
+            self.images_ph,
+            dtype=tf.float32,
+        )
+        images.set_shape([None, WIDTH, HEIGHT, NUM_CHANNELS])
+        self.image_tower = ImageTower(
+            images,
+            hparams.joint_space,
+            hparams.attn_size,
+            hparams.attn_hops,
+            image_encoder,
+        )
+        self.sess = tf.Session()
+        self.sess.run([tf.global_variables_initializer(), tf.tables_initializer()])
+        tf.train.Saver().restore(self.sess, checkpoint_path)
+        logger.info("Towers restored...")
+
+        self.text2image_batcher = MicroBatcher(
+            self.text2image_batch, max_batch_size, max_wait_ms
+        )
+        self.image2text_batcher = MicroBatcher(
+            self.image2text_batch, max_batch_size, max_wait_ms
+        )
+
+    def embed_captions(self, captions: List[str]) -> np.ndarray:
+        return self.sess.run(
+            self.text_tower.attended_captions, feed_dict={self.captions_ph: captions}
+        )
+
+    def embed_images(self, images: List[bytes]) -> np.ndarray:
+        return self.sess.run(
+            self.image_tower.attended_images, feed_dict={self.images_ph: images}
+        )
+
+    def search_images(
+        self, queries: np.ndarray, ks: List[int], categories: List[str]
+    ) -> List[List[Dict[str, Any]]]:
+        """Finds the top K images of every query. The queries filtered by category
+        only scan the images of their category.
+
+        Args:
+            queries: The embedded queries.
+            ks: The number of results of every query.
+            categories: The category of every query, None to search all the images.
+
+        Returns:
+            The results of every query.
+
+        """
+        ids = [np.zeros(0, dtype=np.int64)] * len(ks)
+        scores = [np.zeros(0, dtype=np.float32)] * len(ks)
+        unfiltered = [i for i, category in enumerate(categories) if category is None]
+        if unfiltered:
+            max_k = max(ks[i] for i in unfiltered) + self.num_unused_rows
+            if self.sharded_index is not None:
+                top_ids, top_scores = self.sharded_index.search(
+                    queries[unfiltered], max_k
+                )
+            else:
+                top_ids, top_scores = exact_top_k(
+                    queries[unfiltered], self.image_embeddings, max_k
+                )
+            for i, query_ids, query_scores in zip(unfiltered, top_ids, top_scores):
+                ids[i], scores[i] = query_ids, query_scores
+        for i, category in enumerate(categories):
+            if category is not None:
+                top_ids, top_scores = self.category_index.search(
+                    queries[i : i + 1], self.image_embeddings, ks[i], category
+                )
+                ids[i], scores[i] = top_ids[0], top_scores[0]
+        results = []
+        for k, query_ids, query_scores in zip(ks, ids, scores):
+            query_results = [
+                {"path": self.row_to_image_path[row], "score": float(score)}
+                for row, score in zip(query_ids, query_scores)
+                if self.row_to_image_path[row] is not None
+            ]
+            results.append(query_results[:k])
+
+        return results
+
+    def text2image_batch(
+        self, requests: List[Tuple[str, int, str]]
+    ) -> List[Tuple[np.ndarray, List[Dict[str, Any]]]]:
+        """Answers a micro-batch of text to image queries.
+
+        Args:
+            requests: Triples of pre-processed caption, number of results and category
+            (None to search all the images).
+
+        Returns:
+            The embedding and the results of every query.
+
+        """
+        queries = self.embed_captions([caption for caption, _, _ in requests])
+        results = self.search_images(
+            queries,
+            [k for _, k, _ in requests],
+            [category for _, _, category in requests],
+        )
+
+        return list(zip(queries, results))
+
+    def image2text_batch(
+        self, requests: List[Tuple[bytes, int]]
+    ) -> List[List[Dict[str, Any]]]:
+        """Answers a micro-batch of image to text queries.
+
+        Args:
+            requests: Pairs of JPEG image bytes and number of results.
+
+        Returns:
+            The results of every query.
+
+        """
+        queries = self.embed_images([image for image, _ in requests])
+        max_k = max(k for _, k in requests)
+        ids, scores = exact_top_k(queries, self.caption_embeddings, max_k)
+        results = []
+        for (_, k), query_ids, query_scores in zip(requests, ids, scores):
+            results.append(
+                [
+                    {"caption": self.captions[row], "score": float(score)}
+                    for row, score in zip(query_ids[:k], query_scores[:k])
+                ]
+            )
+
+        return results
+
+    def text2image(
+        self, caption: str, k: int, category: str = None
+    ) -> List[Dict[str, Any]]:
+        caption = preprocess_caption(caption)
+        if category is not None:
+            # Checked here, so a wrong category never fails the whole micro-batch
+            if self.category_index is None:
+                raise ValueError("The image index has no categories!")
+            self.category_index.get_rows(category)
+        if self.cache is not None:
+            embedding = self.cache.get(caption)
+            if embedding is not None:
+                return self.search_images(embedding[np.newaxis], [k], [category])[0]
+        embedding, results = self.text2image_batcher((caption, k, category))
+        if self.cache is not None:
+            self.cache.put(caption, embedding)
+
+        return results
+
+    def image2text(self, image: bytes, k: int) -> List[Dict[str, Any]]:
+        if len(self.captions) == 0:
+            raise ValueError("No captions to search!")
+        # Checked here, so that most bad images never fail a micro-batch
+        if not image.startswith(jpeg_magic):
+            raise ValueError("Wrong image, it is not a JPEG!")
+        return self.image2text_batcher((image, k))
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {
+            "text2image_requests": self.text2image_batcher.num_requests,
+            "text2image_batches": self.text2image_batcher.num_batches,
+            "image2text_requests": self.image2text_batcher.num_requests,
+            "image2text_batches": self.image2text_batcher.num_batches,
+        }
+        if self.cache is not None:
+            stats["cache"] = self.cache.get_stats()
+
+        return stats
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def create_server(service: RetrievalService, host: str, port: int) -> HTTPServer:
+    """Creates an HTTP server for the service, which handles every connection in its
+    own thread:
+
+    - POST /text2image with {"caption": str, "k": int, "category": optional str}
+    - POST /image2text with {"image": base64 encoded JPEG, "k": int}
+    - GET /stats
+
+    Args:
+        service: The retrieval service.
+        host: The host to bind to.
+        port: The port to bind to.
+
+    Returns:
+        The server.
+
+    """
+
+    class RequestHandler(BaseHTTPRequestHandler):
+        def send_json(self, status: int, body: Any) -> None:
+            content = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self.send_json(200, service.get_stats())
+            else:
+                self.send_json(404, {"error": "Not found"})
+
+        def do_POST(self):
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length).decode("utf-8"))
+                k = int(request.get("k", 10))
+                if self.path == "/text2image":
+                    results = service.text2image(
+                        request["caption"], k, request.get("category")
+                    )
+                elif self.path == "/image2text":
+                    image = base64.b64decode(request["image"])
+                    results = service.image2text(image, k)
+                else:
+                    self.send_json(404, {"error": "Not found"})
+                    return
+            except (KeyError, ValueError, tf.errors.InvalidArgumentError) as error:
+                # The request is wrong, e.g. an image that does not decode
+                self.send_json(400, {"error": str(error)})
+                return
+            except Exception as error:
+                logger.exception("Answering the request failed...")
+                self.send_json(500, {"error": str(error)})
+                return
+            self.send_json(200, {"results": results})
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    return ThreadingHTTPServer((host, port), RequestHandler)
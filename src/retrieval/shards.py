@@ -0,0 +1,232 @@
+import heapq
+import logging
+import itertools
+import threading
+import multiprocessing
+from multiprocessing.connection import Connection
+from typing import List, Tuple
+
+import numpy as np
+
+from retrieval.top_k import exact_top_k
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+shard_assignments = ["contiguous", "round_robin", "hash"]
+
+
+def assign_shards(ids: np.ndarray, num_shards: int, assignment: str) -> np.ndarray:
+    """Assigns every id of the gallery to a shard.
+
+    Args:
+        ids: The ids of the gallery.
+        num_shards: The number of shards.
+        assignment: Either contiguous (ranges of ids), round_robin (id modulo the
+        number of shards) or hash (a multiplicative hash of the id, which spreads
+        runs of similar ids).
+
+    Returns:
+        The shard of every id.
+
+    """
+    if assignment == "contiguous":
+        return (ids * num_shards // max(len(ids), 1)).astype(np.int64)
+    elif assignment == "round_robin":
+        return (ids % num_shards).astype(np.int64)
+    elif assignment == "hash":
+        hashes = (ids.astype(np.uint64) * np.uint64(2654435761)) % np.uint64(2**32)
+        return (hashes % np.uint64(num_shards)).astype(np.int64)
+    else:
+        raise ValueError("Wrong shard assignment!")
+
+
+def heap_merge_top_k(
+    shard_ids: List[np.ndarray], shard_scores: List[np.ndarray], k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Merges the sorted top K lists of the shards with a heap, so each query only
+    touches the K best results of every shard.
+
+    Args:
+        shard_ids: The ids of each shard with shape [Q, K_s], sorted by decreasing
+        score.
+        shard_scores: The scores of each shard with shape [Q, K_s].
+        k: How many results to keep.
+
+    Returns:
+        The ids and the scores with shape [Q, min(K, sum(K_s))].
+
+    """
+    num_queries = shard_ids[0].shape[0]
+    k = min(k, sum(ids.shape[1] for ids in shard_ids))
+    top_ids = np.zeros((num_queries, k), dtype=np.int64)
+    top_scores = np.zeros((num_queries, k), dtype=np.float32)
+    for query in range(num_queries):
+        merged = heapq.merge(
+            *[
+                zip(scores[query], ids[query])
+                for ids, scores in zip(shard_ids, shard_scores)
+            ],
+            key=lambda result: -result[0],
+        )
+        for rank, (score, id) in enumerate(itertools.islice(merged, k)):
+            top_ids[query, rank] = id
+            top_scores[query, rank] = score
+
+    return top_ids, top_scores
+
+
+def serve_shard(
+    connection: Connection,
+    embeddings_path: str,
+    offset: int,
+    dtype: np.dtype,
+    shape: Tuple[int, int],
+    ids: np.ndarray,
+    block_size: int,
+) -> None:
+    """The loop of a shard worker: answers (queries, k) messages with the top K ids
+    and scores of its shard until it receives None. The worker memory maps the
+    gallery and reads only the rows of its shard.
+
+    Args:
+        connection: The end of the pipe of the worker.
+        embeddings_path: The file of the gallery.
+        offset: Where the gallery starts in the file.
+        dtype: The dtype of the gallery.
+        shape: The shape of the gallery.
+        ids: The gallery ids of the embeddings of the shard.
+        block_size: How many embeddings to score at once.
+
+    Returns:
+        None
+
+    """
+    embeddings = np.memmap(embeddings_path, dtype, "r", offset, shape)[ids]
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        queries, k = message
+        try:
+            top_rows, top_scores = exact_top_k(queries, embeddings, k, block_size)
+            connection.send((ids[top_rows], top_scores))
+        except Exception as exception:
+            connection.send(exception)
+    connection.close()
+
+
+class ShardedIndex:
+    # An exact index split into shards that live in local worker processes
+    def __init__(
+        self,
+        embeddings: np.memmap,
+        num_shards: int,
+        assignment: str = "contiguous",
+        block_size: int = 65536,
+    ):
+        """Splits the gallery into shards and starts a worker process per shard.
+        Queries are scattered to all the workers and their top K lists are gathered
+        and merged. Only the file of the gallery is passed to the workers, which
+        read their own rows, so the gallery is never copied into this process.
+
+        Args:
+            embeddings: The memory mapped gallery with shape [N, D], e.g. from
+            ImageIndex.get_embeddings, IndexFile or np.load with mmap_mode.
+            num_shards: The number of shards.
+            assignment: How the ids are assigned to the shards, see assign_shards.
+            block_size: How many embeddings a worker scores at once.
+        """
+        if not isinstance(embeddings, np.memmap) or embeddings.ndim != 2:
+            raise ValueError("Wrong gallery, the shards need a memory mapped matrix!")
+        self.embeddings_path = embeddings.filename
+        self.offset = embeddings.offset
+        self.dtype = embeddings.dtype
+        self.shape = embeddings.shape
+        self.block_size = block_size
+        self.context = multiprocessing.get_context("spawn")
+        self.workers: List[multiprocessing.Process] = []
+        self.connections: List[Connection] = []
+        # The pipes carry one query batch at a time
+        self.lock = threading.Lock()
+        self.start(num_shards, assignment)
+
+    def start(self, num_shards: int, assignment: str) -> None:
+        self.num_shards = num_shards
+        self.assignment = assignment
+        self.shard_of_id = assign_shards(
+            np.arange(self.shape[0]), num_shards, assignment
+        )
+        for shard in range(num_shards):
+            connection, worker_connection = self.context.Pipe()
+            worker = self.context.Process(
+                target=serve_shard,
+                args=(
+                    worker_connection,
+                    self.embeddings_path,
+                    self.offset,
+                    self.dtype,
+                    self.shape,
+                    np.flatnonzero(self.shard_of_id == shard),
+                    self.block_size,
+                ),
+                daemon=True,
+            )
+            worker.start()
+            worker_connection.close()
+            self.workers.append(worker)
+            self.connections.append(connection)
+        logger.info(f"{num_shards} shards started: {self.get_shard_sizes()}...")
+
+    def get_shard_sizes(self) -> List[int]:
+        return np.bincount(self.shard_of_id, minlength=self.num_shards).tolist()
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Finds the top K embeddings for each query by dot product.
+
+        Args:
+            queries: The queries with shape [Q, D].
+            k: How many results to return per query.
+
+        Returns:
+            The ids and the scores of the results, both with shape [Q, K] and sorted
+            by decreasing score.
+
+        """
+        # Scatter to all the shards before gathering, so the shards work in parallel
+        with self.lock:
+            for connection in self.connections:
+                connection.send((queries, k))
+            results = [connection.recv() for connection in self.connections]
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+        return heap_merge_top_k(
+            [ids for ids, _ in results], [scores for _, scores in results], k
+        )
+
+    def rebalance(self, num_shards: int = None, assignment: str = None) -> None:
+        """Stops the workers and splits the gallery again, e.g. to add shards or to
+        switch to another assignment.
+
+        Args:
+            num_shards: The new number of shards, by default the current one.
+            assignment: The new assignment, by default the current one.
+
+        Returns:
+            None
+
+        """
+        with self.lock:
+            self.close()
+            self.start(num_shards or self.num_shards, assignment or self.assignment)
+
+    def close(self) -> None:
+        for connection in self.connections:
+            connection.send(None)
+            connection.close()
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+        self.connections = []
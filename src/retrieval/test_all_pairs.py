@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from retrieval.all_pairs import SparseTopK, all_pairs_top_k, write_rows
+from retrieval.top_k import exact_top_k
+
+
+@pytest.fixture
+def gallery():
+    np.random.seed(42)
+    return np.random.rand(30, 8).astype(np.float32)
+
+
+@pytest.fixture
+def queries():
+    np.random.seed(40)
+    return np.random.rand(11, 8).astype(np.float32)
+
+
+def test_write_rows(gallery, tmp_path):
+    array_path = str(tmp_path / "rows.npy")
+    write_rows(gallery, np.array([0, 5, 10, 15]), array_path, 3)
+    np.testing.assert_equal(np.load(array_path), gallery[[0, 5, 10, 15]])
+
+
+def test_all_pairs_top_k(queries, gallery, tmp_path):
+    queries_path = str(tmp_path / "queries.npy")
+    gallery_path = str(tmp_path / "gallery.npy")
+    np.save(queries_path, queries)
+    np.save(gallery_path, gallery)
+    matrix_dir = str(tmp_path / "matrix")
+    all_pairs_top_k(queries_path, gallery_path, matrix_dir, 5, 4, 7, 2)
+    matrix = SparseTopK(matrix_dir)
+    assert matrix.num_rows == 11
+    true_ids, true_scores = exact_top_k(queries, gallery, 5)
+    for row in range(11):
+        indices, scores = matrix.get_row(row)
+        np.testing.assert_equal(indices, true_ids[row])
+        np.testing.assert_almost_equal(scores, true_scores[row], decimal=5)
@@ -0,0 +1,57 @@
+import threading
+
+import pytest
+
+from retrieval.batching import MicroBatcher
+
+
+def test_results_match_requests():
+    batcher = MicroBatcher(lambda requests: [r * 2 for r in requests], 4, 5)
+    futures = [batcher.submit(i) for i in range(10)]
+    assert [future.result(timeout=5) for future in futures] == list(range(0, 20, 2))
+
+
+def test_concurrent_requests_are_coalesced():
+    batch_sizes = []
+    release = threading.Event()
+
+    def process_batch(requests):
+        # Block the first batch so the rest of the requests pile up
+        release.wait(timeout=5)
+        batch_sizes.append(len(requests))
+        return requests
+
+    batcher = MicroBatcher(process_batch, 8, 50)
+    futures = [batcher.submit(i) for i in range(17)]
+    release.set()
+    assert [future.result(timeout=5) for future in futures] == list(range(17))
+    assert max(batch_sizes) <= 8
+    assert len(batch_sizes) < 17
+    assert batcher.num_requests == 17
+
+
+def test_failed_batch_sets_exception():
+    def process_batch(requests):
+        raise ValueError("Wrong request!")
+
+    batcher = MicroBatcher(process_batch, 4, 1)
+    with pytest.raises(ValueError):
+        batcher(1)
+
+
+def test_failed_batch_only_fails_bad_requests():
+    release = threading.Event()
+
+    def process_batch(requests):
+        release.wait(timeout=5)
+        if any(request < 0 for request in requests):
+            raise ValueError("Wrong request!")
+        return [request * 2 for request in requests]
+
+    batcher = MicroBatcher(process_batch, 8, 50)
+    futures = [batcher.submit(request) for request in [1, -1, 2, 3]]
+    release.set()
+    assert futures[0].result(timeout=5) == 2
+    with pytest.raises(ValueError):
+        futures[1].result(timeout=5)
+    assert [future.result(timeout=5) for future in futures[2:]] == [4, 6]
@@ -0,0 +1,80 @@
+import os
+import numpy as np
+import pytest
+
+from retrieval.caches import EmbeddingCache, get_checkpoint_id
+
+
+@pytest.fixture
+def embedding():
+    # 40 bytes
+    return np.ones(10, dtype=np.float32)
+
+
+def test_hits_and_misses(embedding):
+    cache = EmbeddingCache(1000)
+    assert cache.get("a dog") is None
+    cache.put("a dog", embedding)
+    np.testing.assert_equal(cache.get("a dog"), embedding)
+    stats = cache.get_stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["bytes"] == 40
+
+
+def test_least_recently_used_is_evicted(embedding):
+    cache = EmbeddingCache(100)
+    cache.put("a dog", embedding)
+    cache.put("a cat", embedding * 2)
+    cache.get("a dog")
+    cache.put("a bird", embedding * 3)
+    assert cache.get("a cat") is None
+    assert cache.get("a dog") is not None
+    assert cache.get("a bird") is not None
+    assert cache.get_stats()["evictions"] == 1
+    assert cache.num_bytes <= 100
+
+
+def test_replacing_a_key_does_not_leak_bytes(embedding):
+    cache = EmbeddingCache(100)
+    cache.put("a dog", embedding)
+    cache.put("a dog", embedding * 2)
+    assert cache.num_bytes == 40
+    assert len(cache.entries) == 1
+
+
+def test_persistence_keeps_order(embedding, tmp_path):
+    cache_path = str(tmp_path / "cache.npz")
+    cache = EmbeddingCache(100, cache_path)
+    cache.put("a dog", embedding)
+    cache.put("a cat", embedding * 2)
+    cache.get("a dog")
+    cache.save()
+    restored = EmbeddingCache(100, cache_path)
+    assert list(restored.entries.keys()) == ["a cat", "a dog"]
+    np.testing.assert_equal(restored.get("a cat"), embedding * 2)
+
+
+def test_persistence_of_empty_cache(tmp_path):
+    cache_path = str(tmp_path / "cache.npz")
+    EmbeddingCache(100, cache_path).save()
+    assert len(EmbeddingCache(100, cache_path).entries) == 0
+
+
+def test_cache_of_another_model_is_discarded(embedding, tmp_path):
+    cache_path = str(tmp_path / "cache.npz")
+    cache = EmbeddingCache(100, cache_path, "model_a")
+    cache.put("a dog", embedding)
+    cache.save()
+    assert len(EmbeddingCache(100, cache_path, "model_a").entries) == 1
+    assert len(EmbeddingCache(100, cache_path, "model_b").entries) == 0
+
+
+def test_checkpoint_id(tmp_path):
+    checkpoint_path = str(tmp_path / "model.ckpt-1")
+    with open(checkpoint_path + ".index", "w") as file:
+        file.write("index")
+    checkpoint_id = get_checkpoint_id(checkpoint_path)
+    assert checkpoint_id.startswith(checkpoint_path)
+    os.utime(checkpoint_path + ".index", ns=(0, 0))
+    assert get_checkpoint_id(checkpoint_path) != checkpoint_id
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from retrieval.categories import CategoryIndex
+from retrieval.top_k import exact_top_k
+
+
+@pytest.fixture
+def embeddings():
+    np.random.seed(42)
+    return np.random.rand(12, 8).astype(np.float32)
+
+
+@pytest.fixture
+def queries():
+    np.random.seed(40)
+    return np.random.rand(3, 8).astype(np.float32)
+
+
+@pytest.fixture
+def categories():
+    return ["bus"] * 4 + ["cat"] * 4 + ["bus", "dog", "cat", "dog"]
+
+
+def test_posting_lists(categories):
+    index = CategoryIndex.from_categories(categories)
+    assert index.names == ["bus", "cat", "dog"]
+    np.testing.assert_equal(index.get_rows("bus"), [0, 1, 2, 3, 8])
+    np.testing.assert_equal(index.get_rows("dog"), [9, 11])
+    with pytest.raises(ValueError):
+        index.get_rows("boat")
+
+
+@pytest.mark.parametrize("category", ["bus", "cat", "dog"])
+def test_search_equals_post_filter(queries, embeddings, categories, category):
+    index = CategoryIndex.from_categories(categories)
+    top_ids, top_scores = index.search(queries, embeddings, 3, category)
+    all_ids, _ = exact_top_k(queries, embeddings, len(categories))
+    for query_ids, true_ids in zip(top_ids, all_ids):
+        filtered = [i for i in true_ids if categories[i] == category][:3]
+        np.testing.assert_equal(query_ids, filtered)
+
+
+def test_contiguous_category_is_scanned_in_place(queries, embeddings):
+    index = CategoryIndex.from_categories(["bus"] * 6 + ["cat"] * 6)
+    top_ids, _ = index.search(queries, embeddings, 2, "cat")
+    assert np.all(top_ids >= 6)
+
+
+def test_append_and_save(categories, tmp_path):
+    index = CategoryIndex.from_categories(categories).append(["boat", "bus"])
+    index_path = str(tmp_path / "categories.npz")
+    index.save(index_path)
+    loaded = CategoryIndex.load(index_path)
+    assert loaded.names == ["bus", "cat", "dog", "boat"]
+    np.testing.assert_equal(loaded.get_rows("bus"), [0, 1, 2, 3, 8, 13])
+    np.testing.assert_equal(loaded.get_rows("boat"), [12])
@@ -0,0 +1,103 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from retrieval.image_index import ImageIndex
+
+
+@pytest.fixture
+def images_dir(tmp_path):
+    images_dir = tmp_path / "images"
+    (images_dir / "sub").mkdir(parents=True)
+    (images_dir / "a.jpg").write_bytes(b"first image")
+    (images_dir / "b.jpg").write_bytes(b"second image")
+    (images_dir / "sub" / "c.jpeg").write_bytes(b"third image")
+    (images_dir / "notes.txt").write_bytes(b"not an image")
+    return str(images_dir)
+
+
+def embed(fingerprints, dim):
+    return np.array(
+        [[len(fingerprint.path)] * dim for fingerprint in fingerprints],
+        dtype=np.float32,
+    )
+
+
+def test_list_images(images_dir):
+    image_paths = ImageIndex.list_images(images_dir)
+    assert [os.path.relpath(path, images_dir) for path in image_paths] == [
+        "a.jpg",
+        "b.jpg",
+        os.path.join("sub", "c.jpeg"),
+    ]
+
+
+def test_incremental_update(images_dir, tmp_path):
+    index_dir = str(tmp_path / "index")
+    index = ImageIndex(index_dir, 4)
+    pending = index.get_pending(ImageIndex.list_images(images_dir))
+    assert len(pending) == 3
+    index.append(pending, embed(pending, 4))
+
+    # Reopening the index and adding a new image only embeds the new image
+    with open(os.path.join(images_dir, "d.jpg"), "wb") as file:
+        file.write(b"fourth image")
+    index = ImageIndex(index_dir, 4)
+    pending = index.get_pending(ImageIndex.list_images(images_dir))
+    assert [os.path.basename(fingerprint.path) for fingerprint in pending] == ["d.jpg"]
+    index.append(pending, embed(pending, 4))
+
+    image_paths, rows = ImageIndex(index_dir, 4).get_paths()
+    assert len(image_paths) == 4
+    assert index.get_embeddings().shape == (4, 4)
+    np.testing.assert_equal(sorted(rows), [0, 1, 2, 3])
+
+
+def test_copied_image_is_not_embedded(images_dir, tmp_path):
+    index = ImageIndex(str(tmp_path / "index"), 4)
+    pending = index.get_pending(ImageIndex.list_images(images_dir))
+    index.append(pending, embed(pending, 4))
+    shutil.copy(os.path.join(images_dir, "a.jpg"), os.path.join(images_dir, "e.jpg"))
+    assert index.get_pending(ImageIndex.list_images(images_dir)) == []
+    image_paths, rows = index.get_paths()
+    path_to_row = dict(zip(image_paths, rows))
+    assert (
+        path_to_row[os.path.join(images_dir, "e.jpg")]
+        == path_to_row[os.path.join(images_dir, "a.jpg")]
+    )
+
+
+def test_moved_and_deleted_images_are_removed(images_dir, tmp_path):
+    index_dir = str(tmp_path / "index")
+    index = ImageIndex(index_dir, 4)
+    pending = index.get_pending(ImageIndex.list_images(images_dir))
+    index.append(pending, embed(pending, 4))
+    a_path, b_path = os.path.join(images_dir, "a.jpg"), os.path.join(
+        images_dir, "b.jpg"
+    )
+    a_row = index.path_to_entry[a_path][0]
+    moved_path = os.path.join(images_dir, "sub", "moved.jpg")
+    shutil.move(a_path, moved_path)
+    os.remove(b_path)
+    assert index.get_pending(ImageIndex.list_images(images_dir)) == []
+    # Every row is returned once, for a path that exists, also after reopening
+    for opened_index in [index, ImageIndex(index_dir, 4)]:
+        image_paths, rows = opened_index.get_paths()
+        assert image_paths == [os.path.join(images_dir, "sub", "c.jpeg"), moved_path]
+        assert len(set(rows)) == 2
+        assert dict(zip(image_paths, rows))[moved_path] == a_row
+
+
+def test_interrupted_update_is_dropped(images_dir, tmp_path):
+    index_dir = str(tmp_path / "index")
+    index = ImageIndex(index_dir, 4)
+    pending = index.get_pending(ImageIndex.list_images(images_dir))
+    index.append(pending, embed(pending, 4))
+    # Embeddings written without their table lines
+    with open(index.embeddings_path, "ab") as file:
+        file.write(np.ones((2, 4), dtype=np.float32).tobytes())
+    index = ImageIndex(index_dir, 4)
+    assert os.path.getsize(index.embeddings_path) == 3 * 4 * 4
+    assert index.get_embeddings().shape == (3, 4)
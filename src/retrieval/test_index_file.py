@@ -0,0 +1,109 @@
+import os
+
+import numpy as np
+import pytest
+
+from retrieval.index_file import IndexFile, header_slot_size
+from retrieval.quantizers import ProductQuantizer
+
+
+@pytest.fixture
+def embeddings():
+    np.random.seed(42)
+    return np.random.rand(20, 8).astype(np.float32)
+
+
+@pytest.fixture
+def paths():
+    return [f"images/{i}_é.jpg" for i in range(20)]
+
+
+def test_write_and_map(tmp_path, embeddings, paths):
+    index_path = str(tmp_path / "index.bin")
+    IndexFile.write(index_path, embeddings, np.arange(20), paths, "model_a")
+    index = IndexFile(index_path)
+    assert isinstance(index.embeddings, np.memmap)
+    assert index.model_id == "model_a"
+    np.testing.assert_equal(index.embeddings, embeddings)
+    np.testing.assert_equal(index.ids, np.arange(20))
+    assert index.get_paths() == paths
+    assert index.get_path(3) == paths[3]
+    assert IndexFile.verify(index_path) == []
+
+
+def test_append(tmp_path, embeddings, paths):
+    index_path = str(tmp_path / "index.bin")
+    IndexFile.write(
+        index_path, embeddings[:12], np.arange(12), paths[:12], "model_a", capacity=16
+    )
+    serving = IndexFile(index_path)
+    inode = os.stat(index_path).st_ino
+    # Within the capacity the rows are appended in place
+    IndexFile.append(
+        index_path, embeddings[12:16], np.arange(12, 16), paths[12:16], "model_a"
+    )
+    assert os.stat(index_path).st_ino == inode
+    assert IndexFile.verify(index_path) == []
+    # Beyond it the index is copied into a larger file
+    IndexFile.append(
+        index_path, embeddings[16:], np.arange(16, 20), paths[16:], "model_a"
+    )
+    assert os.stat(index_path).st_ino != inode
+    assert IndexFile.verify(index_path) == []
+    # A reader that mapped the index before the appends still sees the old index
+    assert serving.get_paths() == paths[:12]
+    np.testing.assert_equal(serving.embeddings, embeddings[:12])
+    index = IndexFile(index_path)
+    np.testing.assert_equal(index.embeddings, embeddings)
+    assert index.get_paths() == paths
+    assert index.header["capacity"] >= 20
+    with pytest.raises(ValueError):
+        IndexFile.append(index_path, embeddings, np.arange(20), paths, "model_b")
+
+
+def test_torn_header(tmp_path, embeddings, paths):
+    index_path = str(tmp_path / "index.bin")
+    IndexFile.write(index_path, embeddings[:12], np.arange(12), paths[:12], "model_a")
+    IndexFile.append(
+        index_path, embeddings[12:16], np.arange(12, 16), paths[12:16], "model_a"
+    )
+    # An append interrupted while writing the header of the next generation
+    with open(index_path, "r+b") as file:
+        file.seek(header_slot_size + 100)
+        file.write(b"torn")
+    index = IndexFile(index_path)
+    assert index.header["generation"] == 0
+    assert index.get_paths() == paths[:12]
+    np.testing.assert_equal(index.embeddings, embeddings[:12])
+
+
+def test_long_model_id(tmp_path, embeddings, paths):
+    index_path = str(tmp_path / "index.bin")
+    with pytest.raises(ValueError):
+        IndexFile.write(index_path, embeddings, np.arange(20), paths, "m" * 65)
+
+
+def test_quantized_index(tmp_path, embeddings, paths):
+    quantizer = ProductQuantizer(4, num_centroids=8)
+    quantizer.fit(embeddings)
+    quantizer.add(embeddings)
+    index_path = str(tmp_path / "index.bin")
+    IndexFile.write(index_path, quantizer.codes, np.arange(20), paths, "m", quantizer)
+    assert IndexFile.verify(index_path) == []
+    loaded = IndexFile(index_path).get_quantizer()
+    np.testing.assert_equal(
+        loaded.search(embeddings, 5)[0], quantizer.search(embeddings, 5)[0]
+    )
+
+
+def test_verify_detects_corruption(tmp_path, embeddings, paths):
+    index_path = str(tmp_path / "index.bin")
+    IndexFile.write(index_path, embeddings, np.arange(20), paths, "model_a")
+    with open(index_path, "r+b") as file:
+        file.seek(IndexFile(index_path).header["embeddings_offset"])
+        file.write(b"corrupt")
+    assert IndexFile.verify(index_path, check_data=False) == []
+    assert len(IndexFile.verify(index_path)) == 1
+    with open(index_path, "ab") as file:
+        file.write(b"trailing bytes")
+    assert len(IndexFile.verify(index_path)) == 1
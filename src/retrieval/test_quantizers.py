@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from retrieval.quantizers import BaseQuantizer, ProductQuantizer, ScalarQuantizer
+
+
+@pytest.fixture
+def embeddings():
+    np.random.seed(42)
+    embeddings = np.random.randn(300, 16).astype(np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def queries():
+    np.random.seed(40)
+    return np.random.randn(10, 16).astype(np.float32)
+
+
+def exact_top_k(queries, embeddings, k):
+    return np.argsort(-np.dot(queries, embeddings.T), axis=1)[:, :k]
+
+
+def test_scalar_quantizer_asymmetric_scores(embeddings, queries):
+    quantizer = ScalarQuantizer()
+    quantizer.fit(embeddings)
+    codes = quantizer.encode(embeddings)
+    assert codes.dtype == np.uint8
+    np.testing.assert_almost_equal(
+        quantizer.asymmetric_scores(queries, codes),
+        np.dot(queries, quantizer.decode(codes).T),
+        decimal=4,
+    )
+    np.testing.assert_almost_equal(quantizer.decode(codes), embeddings, decimal=2)
+
+
+def test_scalar_quantizer_search_matches_exact(embeddings, queries):
+    quantizer = ScalarQuantizer()
+    quantizer.fit(embeddings)
+    quantizer.add(embeddings[:150])
+    quantizer.add(embeddings[150:])
+    top_ids, _ = quantizer.search(queries, 1, block_size=64)
+    np.testing.assert_equal(top_ids, exact_top_k(queries, embeddings, 1))
+
+
+def test_product_quantizer_asymmetric_scores(embeddings, queries):
+    quantizer = ProductQuantizer(4, num_centroids=32, num_iters=5)
+    quantizer.fit(embeddings)
+    codes = quantizer.encode(embeddings)
+    assert codes.shape == (300, 4)
+    np.testing.assert_almost_equal(
+        quantizer.asymmetric_scores(queries, codes),
+        np.dot(queries, quantizer.decode(codes).T),
+        decimal=4,
+    )
+
+
+def test_product_quantizer_search(embeddings, queries):
+    quantizer = ProductQuantizer(4, num_centroids=32, num_iters=5)
+    quantizer.fit(embeddings)
+    quantizer.add(embeddings)
+    top_ids, top_scores = quantizer.search(queries, 10, block_size=64)
+    assert top_ids.shape == (10, 10)
+    assert np.all(np.diff(top_scores, axis=1) <= 0)
+    # Most exact nearest neighbours are found among the quantized top 10
+    exact = exact_top_k(queries, embeddings, 1)
+    assert np.mean(np.any(top_ids == exact, axis=1)) >= 0.5
+
+
+def test_save_and_load(embeddings, queries, tmp_path):
+    quantizer = ProductQuantizer(4, num_centroids=32, num_iters=5)
+    quantizer.fit(embeddings)
+    quantizer.add(embeddings)
+    index_path = str(tmp_path / "index.npz")
+    quantizer.save(index_path)
+    loaded = BaseQuantizer.load(index_path)
+    assert isinstance(loaded, ProductQuantizer)
+    np.testing.assert_equal(
+        loaded.search(queries, 5)[0], quantizer.search(queries, 5)[0]
+    )
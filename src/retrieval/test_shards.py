@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from retrieval.shards import ShardedIndex, assign_shards, heap_merge_top_k
+from retrieval.top_k import exact_top_k
+from utils.evaluators import Evaluator
+
+
+@pytest.fixture
+def embeddings():
+    np.random.seed(42)
+    return np.random.rand(50, 8).astype(np.float32)
+
+
+def map_gallery(embeddings, tmp_path):
+    # The shards are memory mapped from the file of the gallery
+    gallery_path = str(tmp_path / "gallery.npy")
+    np.save(gallery_path, embeddings)
+    return np.load(gallery_path, mmap_mode="r")
+
+
+@pytest.fixture
+def queries():
+    np.random.seed(40)
+    return np.random.rand(6, 8).astype(np.float32)
+
+
+@pytest.mark.parametrize("assignment", ["contiguous", "round_robin", "hash"])
+def test_assign_shards_covers_all_shards(assignment):
+    shard_of_id = assign_shards(np.arange(100), 4, assignment)
+    assert shard_of_id.shape == (100,)
+    assert set(shard_of_id.tolist()) == {0, 1, 2, 3}
+
+
+def test_heap_merge_top_k():
+    shard_ids = [np.array([[1, 3]]), np.array([[2, 4]])]
+    shard_scores = [np.array([[0.9, 0.1]]), np.array([[0.5, 0.4]])]
+    top_ids, top_scores = heap_merge_top_k(shard_ids, shard_scores, 3)
+    np.testing.assert_equal(top_ids, [[1, 2, 4]])
+    np.testing.assert_almost_equal(top_scores, [[0.9, 0.5, 0.4]])
+
+
+def test_sharded_search_equals_exact_search(queries, embeddings, tmp_path):
+    index = ShardedIndex(map_gallery(embeddings, tmp_path), 3, "hash", block_size=7)
+    try:
+        top_ids, top_scores = index.search(queries, 10)
+        true_ids, true_scores = exact_top_k(queries, embeddings, 10)
+        np.testing.assert_equal(top_ids, true_ids)
+        np.testing.assert_almost_equal(top_scores, true_scores)
+        # Rebalancing keeps the results
+        index.rebalance(num_shards=4, assignment="round_robin")
+        assert sum(index.get_shard_sizes()) == 50
+        np.testing.assert_equal(index.search(queries, 10)[0], true_ids)
+    finally:
+        index.close()
+
+
+def test_sharded_index_needs_memory_mapped_gallery(embeddings):
+    with pytest.raises(ValueError):
+        ShardedIndex(embeddings, 2)
+
+
+def test_sharded_recall_equals_evaluator_recall(tmp_path):
+    np.random.seed(42)
+    embedded_images = np.repeat(np.random.rand(10, 8), 5, axis=0)
+    embedded_captions = np.random.rand(50, 8)
+    evaluator = Evaluator(50, 8)
+    evaluator.update_embeddings(embedded_images, embedded_captions)
+    index = ShardedIndex(map_gallery(embedded_images[0::5], tmp_path), 2)
+    try:
+        retrieved, _ = index.search(embedded_captions, 10)
+    finally:
+        index.close()
+    query_groups = np.arange(50) // 5
+    for k in [1, 5, 10]:
+        assert evaluator.recall_at_k_from_retrieved(
+            retrieved, query_groups, k
+        ) == evaluator.text2image_recall_at_k(k)
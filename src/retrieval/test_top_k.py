@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from retrieval.top_k import exact_top_k, merge_top_k
+
+
+@pytest.fixture
+def embeddings():
+    np.random.seed(42)
+    return np.random.rand(100, 8)
+
+
+@pytest.fixture
+def queries():
+    np.random.seed(40)
+    return np.random.rand(5, 8)
+
+
+def test_merge_top_k():
+    ids = np.array([[10, 11, 12, 13]])
+    scores = np.array([[0.1, 0.9, 0.5, 0.7]])
+    top_ids, top_scores = merge_top_k(ids, scores, 2)
+    np.testing.assert_equal(top_ids, [[11, 13]])
+    np.testing.assert_almost_equal(top_scores, [[0.9, 0.7]])
+
+
+def test_exact_top_k_is_independent_of_block_size(queries, embeddings):
+    top_ids, top_scores = exact_top_k(queries, embeddings, 10, block_size=7)
+    true_ids = np.argsort(-np.dot(queries, embeddings.T), axis=1)[:, :10]
+    np.testing.assert_equal(top_ids, true_ids)
+    assert np.all(np.diff(top_scores, axis=1) <= 0)
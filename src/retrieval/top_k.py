@@ -0,0 +1,61 @@
+from typing import Tuple
+
+import numpy as np
+
+
+def merge_top_k(
+    ids: np.ndarray, scores: np.ndarray, k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Keeps the K highest scores of each row, sorted by decreasing score.
+
+    Args:
+        ids: The ids with shape [Q, N].
+        scores: The scores with shape [Q, N].
+        k: How many results to keep.
+
+    Returns:
+        The ids and the scores with shape [Q, min(K, N)].
+
+    """
+    k = min(k, scores.shape[1])
+    if k < scores.shape[1]:
+        partition = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        ids = np.take_along_axis(ids, partition, axis=1)
+        scores = np.take_along_axis(scores, partition, axis=1)
+    order = np.argsort(-scores, axis=1, kind="stable")
+
+    return (
+        np.take_along_axis(ids, order, axis=1),
+        np.take_along_axis(scores, order, axis=1),
+    )
+
+
+def exact_top_k(
+    queries: np.ndarray, embeddings: np.ndarray, k: int, block_size: int = 65536
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Finds the top K embeddings for each query by dot product. The embeddings are
+    scanned in blocks and the top K of each block is merged with the running top K,
+    so the memory does not grow with the number of embeddings, which can be memory
+    mapped.
+
+    Args:
+        queries: The queries with shape [Q, D].
+        embeddings: The embeddings with shape [N, D].
+        k: How many results to return per query.
+        block_size: How many embeddings to score at once.
+
+    Returns:
+        The ids and the scores of the results, both with shape [Q, K] and sorted by
+        decreasing score.
+
+    """
+    top_ids = np.zeros((queries.shape[0], 0), dtype=np.int64)
+    top_scores = np.zeros((queries.shape[0], 0), dtype=np.float32)
+    for begin in range(0, embeddings.shape[0], block_size):
+        scores = np.dot(queries, np.asarray(embeddings[begin : begin + block_size]).T)
+        ids = np.broadcast_to(np.arange(begin, begin + scores.shape[1]), scores.shape)
+        top_ids, top_scores = merge_top_k(
+            np.hstack([top_ids, ids]), np.hstack([top_scores, scores]), k
+        )
+
+    return top_ids, top_scores
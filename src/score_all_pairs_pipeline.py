@@ -0,0 +1,133 @@
+import argparse
+import logging
+import os
+
+from retrieval.all_pairs import all_pairs_top_k, write_rows
+from utils.embeddings import EmbeddingStore
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def score(
+    store_dir: str,
+    output_dir: str,
+    k: int,
+    query_block_size: int,
+    gallery_block_size: int,
+    num_workers: int,
+) -> None:
+    """Finds the top K images of every caption and the top K captions of every image
+    of an embedding store, and writes them as CSR sparse matrices:
+
+    - output_dir/text2image: a row per caption of the store, whose columns are the
+    lines of output_dir/image_paths.txt.
+    - output_dir/image2text: a row per line of output_dir/image_paths.txt, whose
+    columns are the captions of the store.
+
+    Args:
+        store_dir: The embedding store exported with export_embeddings_pipeline.py.
+        output_dir: Where to write the matrices.
+        k: How many results to keep per query.
+        query_block_size: How many queries a worker scores at once.
+        gallery_block_size: How many gallery embeddings a worker scores at once.
+        num_workers: The number of worker processes.
+
+    Returns:
+        None
+
+    """
+    store = EmbeddingStore(store_dir)
+    image_paths, first_rows, _ = store.get_unique_images()
+    os.makedirs(output_dir, exist_ok=True)
+    EmbeddingStore.write_lines(os.path.join(output_dir, "image_paths.txt"), image_paths)
+    # Every image is repeated once per caption in the store
+    images_path = os.path.join(output_dir, "images.npy")
+    write_rows(store.embedded_images, first_rows, images_path, gallery_block_size)
+    captions_path = os.path.join(store_dir, "captions.npy")
+    logger.info(f"Scoring {len(store.captions)} captions and {len(image_paths)} images")
+
+    all_pairs_top_k(
+        captions_path,
+        images_path,
+        os.path.join(output_dir, "text2image"),
+        k,
+        query_block_size,
+        gallery_block_size,
+        num_workers,
+    )
+    all_pairs_top_k(
+        images_path,
+        captions_path,
+        os.path.join(output_dir, "image2text"),
+        k,
+        query_block_size,
+        gallery_block_size,
+        num_workers,
+    )
+    os.remove(images_path)
+
+
+def main():
+    # Without the main sentinel, the code would be executed even if the script were
+    # imported as a module.
+    args = parse_args()
+    score(
+        args.store_dir,
+        args.output_dir,
+        args.k,
+        args.query_block_size,
+        args.gallery_block_size,
+        args.num_workers,
+    )
+
+
+def parse_args():
+    """Parse command line arguments.
+
+    Returns:
+        Arguments
+
+    """
+    parser = argparse.ArgumentParser(
+        description="Finds the top K images of every caption and vice versa."
+    )
+    parser.add_argument(
+        "--store_dir",
+        type=str,
+        default="models/embeddings/test",
+        help="Where the exported embeddings are.",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        default="models/all_pairs",
+        help="Where to write the sparse top K matrices.",
+    )
+    parser.add_argument(
+        "--k", type=int, default=10, help="How many results to keep per query."
+    )
+    parser.add_argument(
+        "--query_block_size",
+        type=int,
+        default=1024,
+        help="How many queries a worker scores at once.",
+    )
+    parser.add_argument(
+        "--gallery_block_size",
+        type=int,
+        default=65536,
+        help="How many gallery embeddings a worker scores at once.",
+    )
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=os.cpu_count(),
+        help="The number of worker processes.",
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
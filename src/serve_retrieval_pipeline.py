@@ -0,0 +1,228 @@
+import tensorflow as tf
+import argparse
+import logging
+import os
+import signal
+import sys
+import absl.logging
+
+from multi_hop_attention.hyperparameters import YParams
+from retrieval.caches import EmbeddingCache, get_checkpoint_id
+from retrieval.server import RetrievalService, create_server
+from retrieval.shards import shard_assignments
+from utils.word_vectors import WordVectors
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"
+tf.logging.set_verbosity(tf.logging.ERROR)
+
+# https://github.com/abseil/abseil-py/issues/99
+absl.logging.set_verbosity("info")
+absl.logging.set_stderrthreshold("info")
+
+
+def serve(
+    hparams_path: str,
+    checkpoint_path: str,
+    image_index_dir: str,
+    captions_store_dir: str,
+    image_encoder: str,
+    text_encoder: str,
+    word_vectors_dir: str,
+    max_batch_size: int,
+    max_wait_ms: float,
+    cache_max_mb: int,
+    cache_path: str,
+    num_shards: int,
+    shard_assignment: str,
+    host: str,
+    port: int,
+) -> None:
+    """Serves text to image and image to text retrieval over HTTP.
+
+    Args:
+        hparams_path: The path to the hyperparameters yaml file.
+        checkpoint_path: Path to a valid model checkpoint.
+        image_index_dir: The image index built with build_image_index_pipeline.py,
+        or an index file built with build_index_file_pipeline.py.
+        captions_store_dir: An embedding store whose captions are searched for image
+        to text queries.
+        image_encoder: The CNN used to encode the images.
+        text_encoder: How the words are embedded before the Bi-GRU.
+        word_vectors_dir: Where the word vectors for the word_vectors encoder are.
+        max_batch_size: The maximum number of queries in a micro-batch.
+        max_wait_ms: How long to wait for more queries after the first one.
+        cache_max_mb: The size of the cache of the text queries, 0 disables it.
+        cache_path: Where the cache is kept across restarts, if given.
+        num_shards: The number of worker processes the image gallery is split into.
+        shard_assignment: How the images are assigned to the shards.
+        host: The host to bind to.
+        port: The port to bind to.
+
+    Returns:
+        None
+
+    """
+    hparams = YParams(hparams_path)
+    word_vectors = (
+        WordVectors(word_vectors_dir) if text_encoder == "word_vectors" else None
+    )
+    cache = (
+        EmbeddingCache(
+            cache_max_mb * 1024 * 1024,
+            cache_path,
+            f"{get_checkpoint_id(checkpoint_path)}:{text_encoder}",
+        )
+        if cache_max_mb > 0
+        else None
+    )
+    service = RetrievalService(
+        hparams,
+        checkpoint_path,
+        image_index_dir,
+        captions_store_dir,
+        image_encoder,
+        text_encoder,
+        word_vectors,
+        max_batch_size,
+        max_wait_ms,
+        cache,
+        num_shards,
+        shard_assignment,
+    )
+    server = create_server(service, host, port)
+    # Stopping the server with SIGTERM also saves the cache
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    logger.info(f"Serving on http://{host}:{port}...")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if service.sharded_index is not None:
+            service.sharded_index.close()
+        if cache is not None and cache_path is not None:
+            cache.save()
+
+
+def main():
+    # Without the main sentinel, the code would be executed even if the script were
+    # imported as a module.
+    args = parse_args()
+    serve(
+        args.hparams_path,
+        args.checkpoint_path,
+        args.image_index_dir,
+        args.captions_store_dir,
+        args.image_encoder,
+        args.text_encoder,
+        args.word_vectors_dir,
+        args.max_batch_size,
+        args.max_wait_ms,
+        args.cache_max_mb,
+        args.cache_path,
+        args.num_shards,
+        args.shard_assignment,
+        args.host,
+        args.port,
+    )
+
+
+def parse_args():
+    """Parse command line arguments.
+
+    Returns:
+        Arguments
+
+    """
+    parser = argparse.ArgumentParser(
+        description="Serves text to image and image to text retrieval over HTTP."
+    )
+    parser.add_argument(
+        "--hparams_path",
+        type=str,
+        default="hyperparameters/default_hparams.yaml",
+        help="Path to an hyperparameters yaml file.",
+    )
+    parser.add_argument(
+        "--checkpoint_path", type=str, default=None, help="Path to a model checkpoint."
+    )
+    parser.add_argument(
+        "--image_index_dir",
+        type=str,
+        default="models/image_index",
+        help="The directory of the image index, or an index file.",
+    )
+    parser.add_argument(
+        "--captions_store_dir",
+        type=str,
+        default=None,
+        help="The embedding store whose captions are searched for image queries.",
+    )
+    parser.add_argument(
+        "--image_encoder",
+        type=str,
+        default="resnet152",
+        choices=["resnet152", "resnet50", "mobilenet"],
+        help="The CNN used to encode the images.",
+    )
+    parser.add_argument(
+        "--text_encoder",
+        type=str,
+        default="elmo",
+        choices=["elmo", "gru", "word_vectors"],
+        help="How the words are embedded before the Bi-GRU.",
+    )
+    parser.add_argument(
+        "--word_vectors_dir",
+        type=str,
+        default="models/word_vectors",
+        help="Where the word vectors for the word_vectors text encoder are.",
+    )
+    parser.add_argument(
+        "--max_batch_size",
+        type=int,
+        default=32,
+        help="The maximum number of queries in a micro-batch.",
+    )
+    parser.add_argument(
+        "--max_wait_ms",
+        type=float,
+        default=5.0,
+        help="How long to wait for more queries after the first one.",
+    )
+    parser.add_argument(
+        "--cache_max_mb",
+        type=int,
+        default=256,
+        help="The size of the cache of the text queries in MB, 0 disables it.",
+    )
+    parser.add_argument(
+        "--cache_path",
+        type=str,
+        default=None,
+        help="Where to keep the cache of the text queries across restarts.",
+    )
+    parser.add_argument(
+        "--num_shards",
+        type=int,
+        default=1,
+        help="The number of worker processes the image gallery is split into.",
+    )
+    parser.add_argument(
+        "--shard_assignment",
+        type=str,
+        default="contiguous",
+        choices=shard_assignments,
+        help="How the images are assigned to the shards.",
+    )
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="The host.")
+    parser.add_argument("--port", type=int, default=8000, help="The port.")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
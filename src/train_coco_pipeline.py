@@ -0,0 +1,453 @@
+import tensorflow as tf
+import argparse
+import logging
+from tqdm import tqdm
+import os
+import absl.logging
+
+from utils.datasets import TrainCocoDataset, ValCocoDataset, read_image_ids
+from multi_hop_attention.hyperparameters import YParams
+from multi_hop_attention.loaders import TrainValLoader
+from multi_hop_attention.models import MultiHopAttentionModel
+from utils.evaluators import Evaluator
+from utils.word_vectors import WordVectors
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"
+tf.logging.set_verbosity(tf.logging.ERROR)
+
+# https://github.com/abseil/abseil-py/issues/99
+absl.logging.set_verbosity("info")
+absl.logging.set_stderrthreshold("info")
+
+
+def train(
+    hparams_path: str,
+    train_images_path: str,
+    train_json_path: str,
+    val_images_path: str,
+    val_json_path: str,
+    val_size: int,
+    epochs: int,
+    recall_at: int,
+    batch_size: int,
+    prefetch_size: int,
+    save_model_path: str,
+    log_model_path: str,
+    decay_rate_epochs: int,
+    batch_hard: bool,
+    image_encoder: str,
+    text_encoder: str,
+    word_vectors_dir: str,
+    learning_rate: float = None,
+    frob_norm_pen: float = None,
+    attn_hops: int = None,
+    quarantine_path: str = None,
+    val_ids_path: str = None,
+    test_ids_path: str = None,
+    val_offset: int = 5000,
+    test_size: int = 5000,
+) -> None:
+    """Starts a training session with the Microsoft COCO dataset.
+
+    Args:
+        hparams_path: The path to the hyperparameters yaml file.
+        train_images_path: A path where the train images are located.
+        train_json_path: Path to the json file with the train captions.
+        val_images_path: A path where the validation images are located.
+        val_json_path: Path to the json file with the validation captions.
+        val_size: How many images of the validation json file to validate on.
+        epochs: The number of epochs to train the model excluding the vgg.
+        recall_at: Validate on recall at K.
+        batch_size: The batch size to be used.
+        prefetch_size: How many batches to keep on GPU ready for processing.
+        save_model_path: Where to save the model.
+        log_model_path: Where to log the summaries.
+        learning_rate: If provided update the one in hparams.
+        frob_norm_pen: If provided update the one in hparams.
+        attn_hops: If provided update the one in hparams.
+        batch_hard: Whether to train only on the hard negatives.
+        image_encoder: The CNN used to encode the images.
+        text_encoder: How the words are embedded before the Bi-GRU.
+        word_vectors_dir: Where the word vectors for the word_vectors encoder are.
+        decay_rate_epochs: When to decay the learning rate.
+        quarantine_path: The broken images to leave out, if any.
+        val_ids_path: The ids of the validation images, e.g. the Karpathy val split.
+        test_ids_path: The ids of the test images, which must not be validated on.
+        val_offset: Without validation ids, where the validation images begin in
+        the validation json file.
+        test_size: Without test ids, the test images are the first test_size
+        images of the validation json file, as in inference_coco_pipeline.py.
+
+    Returns:
+        None
+
+    """
+    hparams = YParams(hparams_path)
+    # If learning rate is provided update the hparams learning rate
+    if learning_rate is not None:
+        hparams.set_hparam("learning_rate", learning_rate)
+    # If frob_norm_pen is provided update the hparams frob_norm_pen
+    if frob_norm_pen is not None:
+        hparams.set_hparam("frob_norm_pen", frob_norm_pen)
+    # If attn_hops is provided update the hparams attn_hops
+    if attn_hops is not None:
+        hparams.set_hparam("attn_hops", attn_hops)
+    # The tables keep every path once and the captions in a single buffer, the
+    # loaders read them through list like views
+    train_table = TrainCocoDataset(
+        train_images_path, train_json_path, quarantine_path
+    ).get_table()
+    val_dataset = ValCocoDataset(
+        val_images_path,
+        val_json_path,
+        val_size,
+        quarantine_path,
+        image_ids_path=val_ids_path,
+        offset=val_offset,
+    )
+    # Choosing the checkpoint on test images would inflate the reported recalls
+    if test_ids_path is not None:
+        test_ids = read_image_ids(test_ids_path)
+    elif val_ids_path is None:
+        test_ids = val_dataset.get_captioned_ids()[:test_size]
+    else:
+        test_ids = []
+        logger.warning("No test ids, the validation images are not checked")
+    if set(val_dataset.get_pair_ids()) & set(test_ids):
+        raise ValueError("Wrong validation images, they overlap the test images!")
+    val_table = val_dataset.get_table()
+    train_image_paths, train_captions = (
+        train_table.get_image_paths(),
+        train_table.get_captions(),
+    )
+    val_image_paths, val_captions = (
+        val_table.get_image_paths(),
+        val_table.get_captions(),
+    )
+    logger.info("Train dataset created...")
+    logger.info("Validation dataset created...")
+
+    evaluator_train = Evaluator()
+    evaluator_val = Evaluator(
+        len(val_image_paths),
+        hparams.joint_space * hparams.attn_hops,
+        val_table.get_image_offsets(),
+    )
+
+    logger.info("Evaluators created...")
+
+    # Resetting the default graph and setting the random seed
+    tf.reset_default_graph()
+    tf.set_random_seed(hparams.seed)
+
+    loader = TrainValLoader(
+        train_image_paths,
+        train_captions,
+        val_image_paths,
+        val_captions,
+        batch_size,
+        prefetch_size,
+    )
+    images, captions, captions_lengths = loader.get_next()
+    logger.info("Loader created...")
+
+    decay_steps = decay_rate_epochs * len(train_image_paths) / batch_size
+    word_vectors = (
+        WordVectors(word_vectors_dir) if text_encoder == "word_vectors" else None
+    )
+    model = MultiHopAttentionModel(
+        images,
+        captions,
+        captions_lengths,
+        hparams.margin,
+        hparams.joint_space,
+        hparams.num_layers,
+        hparams.attn_size,
+        hparams.attn_hops,
+        hparams.learning_rate,
+        hparams.gradient_clip_val,
+        decay_steps,
+        batch_hard,
+        log_model_path,
+        hparams.name,
+        image_encoder,
+        text_encoder,
+        word_vectors,
+    )
+    logger.info("Model created...")
+    logger.info("Training is starting...")
+
+    with tf.Session() as sess:
+
+        # Initializers
+        model.init(sess)
+        model.add_summary_graph(sess)
+
+        for e in range(epochs):
+            # Reset evaluators
+            evaluator_train.reset_all_vars()
+            evaluator_val.reset_all_vars()
+
+            # Initialize iterator with train data
+            sess.run(loader.train_init)
+            try:
+                with tqdm(total=len(train_image_paths)) as pbar:
+                    while True:
+                        _, loss, lengths = sess.run(
+                            [model.optimize, model.loss, model.captions_len],
+                            feed_dict={
+                                model.frob_norm_pen: hparams.frob_norm_pen,
+                                model.keep_prob: hparams.keep_prob,
+                                model.weight_decay: hparams.weight_decay,
+                            },
+                        )
+                        evaluator_train.update_metrics(loss)
+                        pbar.update(len(lengths))
+                        pbar.set_postfix({"Batch loss": loss})
+            except tf.errors.OutOfRangeError:
+                pass
+
+            # Initialize iterator with validation data
+            sess.run(loader.val_init)
+            try:
+                with tqdm(total=len(val_image_paths)) as pbar:
+                    while True:
+                        loss, lengths, embedded_images, embedded_captions = sess.run(
+                            [
+                                model.loss,
+                                model.captions_len,
+                                model.attended_images,
+                                model.attended_captions,
+                            ]
+                        )
+                        evaluator_val.update_metrics(loss)
+                        evaluator_val.update_embeddings(
+                            embedded_images, embedded_captions
+                        )
+                        pbar.update(len(lengths))
+            except tf.errors.OutOfRangeError:
+                pass
+
+            if evaluator_val.is_best_image2text_recall_at_k(recall_at):
+                evaluator_val.update_best_image2text_recall_at_k()
+                logger.info("=============================")
+                logger.info(
+                    f"Found new best on epoch {e+1} with recall at {recall_at}: "
+                    f"{evaluator_val.best_image2text_recall_at_k}! Saving model..."
+                )
+                logger.info("=============================")
+                model.save_model(sess, save_model_path)
+            else:
+                logger.info(
+                    f"On epoch {e + 1} the recall at {recall_at} is: "
+                    f"{evaluator_val.cur_image2text_recall_at_k} :("
+                )
+
+            # Write multi_hop_attention summaries
+            train_loss_summary = sess.run(
+                model.train_loss_summary,
+                feed_dict={model.train_loss_ph: evaluator_train.loss},
+            )
+            model.add_summary(sess, train_loss_summary)
+
+            # Write validation summaries
+            val_loss_summary, val_recall_at_k = sess.run(
+                [model.val_loss_summary, model.val_recall_at_k_summary],
+                feed_dict={
+                    model.val_loss_ph: evaluator_val.loss,
+                    model.val_recall_at_k_ph: evaluator_val.cur_image2text_recall_at_k,
+                },
+            )
+            model.add_summary(sess, val_loss_summary)
+            model.add_summary(sess, val_recall_at_k)
+
+
+def main():
+    # Without the main sentinel, the code would be executed even if the script were
+    # imported as a module.
+    args = parse_args()
+    train(
+        args.hparams_path,
+        args.train_images_path,
+        args.train_json_path,
+        args.val_images_path,
+        args.val_json_path,
+        args.val_size,
+        args.epochs,
+        args.recall_at,
+        args.batch_size,
+        args.prefetch_size,
+        args.save_model_path,
+        args.log_model_path,
+        args.decay_rate_epochs,
+        args.batch_hard,
+        args.image_encoder,
+        args.text_encoder,
+        args.word_vectors_dir,
+        args.learning_rate,
+        args.frob_norm_pen,
+        args.attn_hops,
+        args.quarantine_path,
+        args.val_ids_path,
+        args.test_ids_path,
+        args.val_offset,
+        args.test_size,
+    )
+
+
+def parse_args():
+    """Parse command line arguments.
+
+    Returns:
+        Arguments
+
+    """
+    parser = argparse.ArgumentParser(
+        description="Performs multi_hop_attention on the Microsoft COCO dataset."
+    )
+    parser.add_argument(
+        "--hparams_path",
+        type=str,
+        default="hyperparameters/default_hparams.yaml",
+        help="Path to a hyperparameters yaml file.",
+    )
+    parser.add_argument(
+        "--train_images_path",
+        type=str,
+        default="data/coco/train2014",
+        help="Path where the train images are.",
+    )
+    parser.add_argument(
+        "--train_json_path",
+        type=str,
+        default="data/coco/annotations/captions_train2014.json",
+        help="Path to the json file with the train captions.",
+    )
+    parser.add_argument(
+        "--val_images_path",
+        type=str,
+        default="data/coco/val2014",
+        help="Path where the validation images are.",
+    )
+    parser.add_argument(
+        "--val_json_path",
+        type=str,
+        default="data/coco/annotations/captions_val2014.json",
+        help="Path to the json file with the validation captions.",
+    )
+    parser.add_argument(
+        "--val_size",
+        type=int,
+        default=1000,
+        help="How many validation images to validate on.",
+    )
+    parser.add_argument(
+        "--val_ids_path",
+        type=str,
+        default=None,
+        help="The validation image ids, see export_coco_split_ids_pipeline.py.",
+    )
+    parser.add_argument(
+        "--test_ids_path",
+        type=str,
+        default=None,
+        help="The test image ids, which must not overlap the validation images.",
+    )
+    parser.add_argument(
+        "--val_offset",
+        type=int,
+        default=5000,
+        help="Without validation ids, where the validation images begin.",
+    )
+    parser.add_argument(
+        "--test_size",
+        type=int,
+        default=5000,
+        help="Without test ids, how many images at the beginning are for testing.",
+    )
+    parser.add_argument(
+        "--log_model_path",
+        type=str,
+        default="logs/tryout",
+        help="Where to log the summaries.",
+    )
+    parser.add_argument(
+        "--save_model_path",
+        type=str,
+        default="models/tryout",
+        help="Where to save the model.",
+    )
+    parser.add_argument(
+        "--epochs",
+        type=int,
+        default=5,
+        help="The number of epochs to train the model excluding the vgg.",
+    )
+    parser.add_argument(
+        "--recall_at", type=int, default=10, help="Validate on recall at K."
+    )
+    parser.add_argument(
+        "--batch_size", type=int, default=64, help="The size of the batch."
+    )
+    parser.add_argument(
+        "--prefetch_size", type=int, default=5, help="The size of prefetch on gpu."
+    )
+    parser.add_argument(
+        "--learning_rate",
+        type=float,
+        default=None,
+        help="This will override the hparams learning rate.",
+    )
+    parser.add_argument(
+        "--frob_norm_pen",
+        type=float,
+        default=None,
+        help="This will override the hparams frob norm penalization rate.",
+    )
+    parser.add_argument(
+        "--attn_hops",
+        type=int,
+        default=None,
+        help="This will override the hparams attention heads.",
+    )
+    parser.add_argument(
+        "--decay_rate_epochs",
+        type=int,
+        default=4,
+        help="How often to decay the learning rate.",
+    )
+    parser.add_argument("--batch_hard", action="store_true")
+    parser.add_argument(
+        "--image_encoder",
+        type=str,
+        default="resnet152",
+        choices=["resnet152", "resnet50", "mobilenet"],
+        help="The CNN used to encode the images.",
+    )
+    parser.add_argument(
+        "--text_encoder",
+        type=str,
+        default="elmo",
+        choices=["elmo", "gru", "word_vectors"],
+        help="How the words are embedded before the Bi-GRU.",
+    )
+    parser.add_argument(
+        "--word_vectors_dir",
+        type=str,
+        default="models/word_vectors",
+        help="Where the word vectors for the word_vectors text encoder are.",
+    )
+    parser.add_argument(
+        "--quarantine_path",
+        type=str,
+        default=None,
+        help="The broken images to leave out, from the validate images pipeline.",
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,11 +5,12 @@ from tqdm import tqdm
 import os
 import absl.logging
 
-from utils.datasets import FlickrDataset
+from utils.datasets import FlickrDataset, get_image_offsets
 from multi_hop_attention.hyperparameters import YParams
 from multi_hop_attention.loaders import TrainValLoader
 from multi_hop_attention.models import MultiHopAttentionModel
 from utils.evaluators import Evaluator
+from utils.word_vectors import WordVectors
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -35,9 +36,14 @@ def train(
     log_model_path: str,
     decay_rate_epochs: int,
     batch_hard: bool,
+    image_encoder: str,
+    text_encoder: str,
+    word_vectors_dir: str,
     learning_rate: float = None,
     frob_norm_pen: float = None,
     attn_hops: int = None,
+    cache_path: str = None,
+    quarantine_path: str = None,
 ) -> None:
     """Starts a training session with the Flickr8k dataset.
 
@@ -57,7 +63,12 @@ def train(
         frob_norm_pen: If provided update the one in hparams.
         attn_hops: If provided update the one in hparams.
         batch_hard: Whether to train only on the hard negatives.
+        image_encoder: The CNN used to encode the images.
+        text_encoder: How the words are embedded before the Bi-GRU.
+        word_vectors_dir: Where the word vectors for the word_vectors encoder are.
         decay_rate_epochs: When to decay the learning rate.
+        cache_path: Where to cache the parsed dataset, if anywhere.
+        quarantine_path: The broken images to leave out, if any.
 
     Returns:
         None
@@ -73,7 +84,7 @@ def train(
     # If attn_hops is provided update the hparams attn_hops
     if attn_hops is not None:
         hparams.set_hparam("attn_hops", attn_hops)
-    dataset = FlickrDataset(images_path, texts_path)
+    dataset = FlickrDataset(images_path, texts_path, cache_path, quarantine_path)
     train_image_paths, train_captions = dataset.get_data(train_imgs_file_path)
     val_image_paths, val_captions = dataset.get_data(val_imgs_file_path)
     logger.info("Train dataset created...")
@@ -81,7 +92,9 @@ def train(
 
     evaluator_train = Evaluator()
     evaluator_val = Evaluator(
-        len(val_image_paths), hparams.joint_space * hparams.attn_hops
+        len(val_image_paths),
+        hparams.joint_space * hparams.attn_hops,
+        get_image_offsets(val_image_paths),
     )
 
     logger.info("Evaluators created...")
@@ -102,6 +115,9 @@ def train(
     logger.info("Loader created...")
 
     decay_steps = decay_rate_epochs * len(train_image_paths) / batch_size
+    word_vectors = (
+        WordVectors(word_vectors_dir) if text_encoder == "word_vectors" else None
+    )
     model = MultiHopAttentionModel(
         images,
         captions,
@@ -117,6 +133,9 @@ def train(
         batch_hard,
         log_model_path,
         hparams.name,
+        image_encoder,
+        text_encoder,
+        word_vectors,
     )
     logger.info("Model created...")
     logger.info("Training is starting...")
@@ -224,9 +243,14 @@ def main():
         args.log_model_path,
         args.decay_rate_epochs,
         args.batch_hard,
+        args.image_encoder,
+        args.text_encoder,
+        args.word_vectors_dir,
         args.learning_rate,
         args.frob_norm_pen,
         args.attn_hops,
+        args.cache_path,
+        args.quarantine_path,
     )
 
 
@@ -323,6 +347,38 @@ def parse_args():
         help="How often to decay the learning rate.",
     )
     parser.add_argument("--batch_hard", action="store_true")
+    parser.add_argument(
+        "--image_encoder",
+        type=str,
+        default="resnet152",
+        choices=["resnet152", "resnet50", "mobilenet"],
+        help="The CNN used to encode the images.",
+    )
+    parser.add_argument(
+        "--text_encoder",
+        type=str,
+        default="elmo",
+        choices=["elmo", "gru", "word_vectors"],
+        help="How the words are embedded before the Bi-GRU.",
+    )
+    parser.add_argument(
+        "--word_vectors_dir",
+        type=str,
+        default="models/word_vectors",
+        help="Where the word vectors for the word_vectors text encoder are.",
+    )
+    parser.add_argument(
+        "--cache_path",
+        type=str,
+        default=None,
+        help="Where to cache the parsed captions and splits.",
+    )
+    parser.add_argument(
+        "--quarantine_path",
+        type=str,
+        default=None,
+        help="The broken images to leave out, from the validate images pipeline.",
+    )
 
     return parser.parse_args()
 
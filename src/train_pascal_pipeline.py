@@ -5,11 +5,12 @@ from tqdm import tqdm
 import os
 import absl.logging
 
-from utils.datasets import PascalSentencesDataset
+from utils.datasets import PascalSentencesDataset, get_image_offsets
 from multi_hop_attention.hyperparameters import YParams
 from multi_hop_attention.loaders import TrainValLoader
 from multi_hop_attention.models import MultiHopAttentionModel
 from utils.evaluators import Evaluator
+from utils.word_vectors import WordVectors
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -33,9 +34,13 @@ def train(
     log_model_path: str,
     decay_rate_epochs: int,
     batch_hard: bool,
+    image_encoder: str,
+    text_encoder: str,
+    word_vectors_dir: str,
     learning_rate: float = None,
     frob_norm_pen: float = None,
     attn_hops: int = None,
+    quarantine_path: str = None,
 ) -> None:
     """Starts a training session with the Pascal1k sentences dataset.
 
@@ -53,7 +58,11 @@ def train(
         frob_norm_pen: If provided update the one in hparams.
         attn_hops: If provided update the one in hparams.
         batch_hard: Whether to train only on the hardest negatives.
+        image_encoder: The CNN used to encode the images.
+        text_encoder: How the words are embedded before the Bi-GRU.
+        word_vectors_dir: Where the word vectors for the word_vectors encoder are.
         decay_rate_epochs: When to decay the learning rate.
+        quarantine_path: The broken images to leave out, if any.
 
     Returns:
         None
@@ -69,7 +78,7 @@ def train(
     # If attn_hops is provided update the hparams attn_hops
     if attn_hops is not None:
         hparams.set_hparam("attn_hops", attn_hops)
-    dataset = PascalSentencesDataset(images_path, texts_path)
+    dataset = PascalSentencesDataset(images_path, texts_path, quarantine_path)
     train_image_paths, train_captions = dataset.get_train_data()
     val_image_paths, val_captions = dataset.get_val_data()
     logger.info("Train dataset created...")
@@ -77,7 +86,9 @@ def train(
 
     evaluator_train = Evaluator()
     evaluator_val = Evaluator(
-        len(val_image_paths), hparams.joint_space * hparams.attn_hops
+        len(val_image_paths),
+        hparams.joint_space * hparams.attn_hops,
+        get_image_offsets(val_image_paths),
     )
 
     logger.info("Evaluators created...")
@@ -98,6 +109,9 @@ def train(
     logger.info("Loader created...")
 
     decay_steps = decay_rate_epochs * len(train_image_paths) / batch_size
+    word_vectors = (
+        WordVectors(word_vectors_dir) if text_encoder == "word_vectors" else None
+    )
     model = MultiHopAttentionModel(
         images,
         captions,
@@ -113,6 +127,9 @@ def train(
         batch_hard,
         log_model_path,
         hparams.name,
+        image_encoder,
+        text_encoder,
+        word_vectors,
     )
     logger.info("Model created...")
     logger.info("Training is starting...")
@@ -218,9 +235,13 @@ def main():
         args.log_model_path,
         args.decay_rate_epochs,
         args.batch_hard,
+        args.image_encoder,
+        args.text_encoder,
+        args.word_vectors_dir,
         args.learning_rate,
         args.frob_norm_pen,
         args.attn_hops,
+        args.quarantine_path,
     )
 
 
@@ -307,6 +328,32 @@ def parse_args():
         help="When to decay the learning rate.",
     )
     parser.add_argument("--batch_hard", action="store_true")
+    parser.add_argument(
+        "--image_encoder",
+        type=str,
+        default="resnet152",
+        choices=["resnet152", "resnet50", "mobilenet"],
+        help="The CNN used to encode the images.",
+    )
+    parser.add_argument(
+        "--text_encoder",
+        type=str,
+        default="elmo",
+        choices=["elmo", "gru", "word_vectors"],
+        help="How the words are embedded before the Bi-GRU.",
+    )
+    parser.add_argument(
+        "--word_vectors_dir",
+        type=str,
+        default="models/word_vectors",
+        help="Where the word vectors for the word_vectors text encoder are.",
+    )
+    parser.add_argument(
+        "--quarantine_path",
+        type=str,
+        default=None,
+        help="The broken images to leave out, from the validate images pipeline.",
+    )
 
     return parser.parse_args()
 
@@ -5,7 +5,7 @@ from tqdm import tqdm
 import os
 import absl.logging
 
-from utils.datasets import FlickrDataset
+from utils.datasets import FlickrDataset, get_image_offsets
 from transformer_resnet.loaders import TrainValLoader
 from transformer_resnet.models import TransformerResnet
 from utils.evaluators import Evaluator
@@ -69,7 +69,9 @@ def train(
     logger.info("Validation dataset created...")
 
     evaluator_train = Evaluator()
-    evaluator_val = Evaluator(len(val_image_paths), joint_space)
+    evaluator_val = Evaluator(
+        len(val_image_paths), joint_space, get_image_offsets(val_image_paths)
+    )
 
     logger.info("Evaluators created...")
 
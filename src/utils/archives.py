@@ -0,0 +1,298 @@
+import os
+import json
+import zlib
+import hashlib
+import struct
+import logging
+import posixpath
+import tarfile
+import threading
+import zipfile
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from utils.dataset_caches import decode_strings, encode_strings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# An image inside an archive has the path archive_path::member_name
+member_separator = "::"
+# The same, for tf.strings.regex_full_match in the loaders
+member_pattern = ".*::.*"
+archive_extensions = (".tar", ".zip")
+# The fixed size part of a zip local file header, see read_zip_members
+zip_local_header = struct.Struct("<4s5H3L2H")
+
+
+def is_member_path(image_path: str) -> bool:
+    return member_separator in image_path
+
+
+def split_member_path(image_path: str) -> Tuple[str, str]:
+    archive_path, member_name = image_path.split(member_separator, 1)
+
+    return archive_path, normalize_member_name(member_name)
+
+
+def normalize_member_name(member_name: str) -> str:
+    # os.path.join adds a slash after the separator and tar adds ./ before the names
+    member_name = posixpath.normpath(member_name).lstrip("/")
+
+    return "" if member_name == "." else member_name
+
+
+def resolve_images_path(images_path: str, index_dir: str = None) -> str:
+    """Returns the path the datasets join the image names to. An archive, or a
+    directory inside an archive as archive_path::directory, is indexed right away
+    so that the loaders only have to load the index.
+
+    Args:
+        images_path: A directory, an archive or a directory inside an archive.
+        index_dir: Where to keep the index of an archive, see get_index_path.
+
+    Returns:
+        The images path, with the member separator after an archive.
+
+    """
+    if images_path.endswith(archive_extensions) and os.path.isfile(images_path):
+        images_path += member_separator
+    if is_member_path(images_path):
+        get_archive(split_member_path(images_path)[0], index_dir)
+
+    return images_path
+
+
+def get_index_path(archive_path: str, index_dir: str = None) -> str:
+    """Returns where the index of an archive is kept.
+
+    Args:
+        archive_path: The archive.
+        index_dir: A writable directory for archives on read-only storage. If None,
+        the index is next to the archive.
+
+    Returns:
+        The path of the index.
+
+    """
+    if index_dir is None:
+        return archive_path + ".index.npz"
+    # Archives with the same name in different directories get different indexes
+    digest = hashlib.sha1(os.path.abspath(archive_path).encode()).hexdigest()[:8]
+    os.makedirs(index_dir, exist_ok=True)
+
+    return os.path.join(
+        index_dir, f"{os.path.basename(archive_path)}.{digest}.index.npz"
+    )
+
+
+def read_tar_members(archive_path: str) -> Tuple[List[str], List[int], List[int]]:
+    # Only the headers are read, tarfile seeks over the data of the members
+    try:
+        with tarfile.open(archive_path, "r:") as archive:
+            members = [member for member in archive if member.isreg()]
+    except tarfile.ReadError:
+        raise ValueError("Wrong archive, only uncompressed tar files can be read!")
+
+    return (
+        [member.name for member in members],
+        [member.offset_data for member in members],
+        [member.size for member in members],
+    )
+
+
+def read_zip_members(
+    archive_path: str,
+) -> Tuple[List[str], List[int], List[int], List[bool]]:
+    # The central directory gives where the local header of every member is, the
+    # data follows the header and its variable length name and extra fields
+    names, offsets, sizes, compressed = [], [], [], []
+    with zipfile.ZipFile(archive_path) as archive, open(archive_path, "rb") as file:
+        for member in archive.infolist():
+            if member.is_dir():
+                continue
+            if member.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+                raise ValueError("Wrong archive, only stored or deflated members!")
+            file.seek(member.header_offset)
+            header = zip_local_header.unpack(file.read(zip_local_header.size))
+            names.append(member.filename)
+            offsets.append(
+                member.header_offset + zip_local_header.size + header[-2] + header[-1]
+            )
+            sizes.append(member.compress_size)
+            compressed.append(member.compress_type == zipfile.ZIP_DEFLATED)
+
+    return names, offsets, sizes, compressed
+
+
+class ArchiveIndex:
+    # Where the data of every member of an archive is, to read it in place
+    def __init__(self, archive_path: str, index_path: str = None):
+        """Loads the index of an archive, building it and writing it next to the
+        archive if it is missing or the archive changed since. On read-only storage
+        the index is only kept in memory.
+
+        Args:
+            archive_path: An uncompressed tar file or a zip file.
+            index_path: Where the index is, by default next to the archive, see
+            get_index_path.
+        """
+        # Opened lazily, once in every process that reads from the archive
+        self.file_descriptor = None
+        self.pid = None
+        self.open_lock = threading.Lock()
+        self.archive_path = archive_path
+        self.index_path = index_path or get_index_path(archive_path)
+        stat = os.stat(archive_path)
+        self.fingerprint = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+        if not self.load():
+            self.build()
+            self.save()
+        self.name_to_row = {name: row for row, name in enumerate(self.names)}
+
+    def load(self) -> bool:
+        if not os.path.isfile(self.index_path):
+            return False
+        with np.load(self.index_path) as index_file:
+            metadata = json.loads(index_file["metadata"].tobytes().decode())
+            # Hashing a whole archive is too slow, its size and mtime are enough
+            if metadata["fingerprint"] != self.fingerprint:
+                logger.info(f"{self.archive_path} changed, {self.index_path} is stale")
+                return False
+            self.names = decode_strings(index_file["names"], metadata["num_names"])
+            self.offsets = index_file["offsets"]
+            self.sizes = index_file["sizes"]
+            self.compressed = index_file["compressed"]
+
+        return True
+
+    def build(self) -> None:
+        logger.info(f"Indexing {self.archive_path}...")
+        if self.archive_path.endswith(".zip"):
+            names, offsets, sizes, compressed = read_zip_members(self.archive_path)
+        else:
+            names, offsets, sizes = read_tar_members(self.archive_path)
+            compressed = [False] * len(names)
+        self.names = [normalize_member_name(name) for name in names]
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.sizes = np.array(sizes, dtype=np.int64)
+        self.compressed = np.array(compressed, dtype=bool)
+        logger.info(f"{len(self.names)} members indexed")
+
+    def save(self) -> None:
+        metadata = {"fingerprint": self.fingerprint, "num_names": len(self.names)}
+        try:
+            with open(self.index_path + ".tmp", "wb") as file:
+                np.savez(
+                    file,
+                    metadata=np.frombuffer(json.dumps(metadata).encode(), np.uint8),
+                    names=encode_strings(self.names),
+                    offsets=self.offsets,
+                    sizes=self.sizes,
+                    compressed=self.compressed,
+                )
+            os.replace(self.index_path + ".tmp", self.index_path)
+        except OSError as error:
+            logger.warning(f"The index is kept in memory, it cannot be saved: {error}")
+
+    def read(self, member_name: str) -> bytes:
+        """Reads a member with a single ranged read of the archive.
+
+        Args:
+            member_name: The normalized name of the member.
+
+        Returns:
+            The content of the member.
+
+        """
+        row = self.name_to_row.get(member_name)
+        if row is None:
+            raise FileNotFoundError(f"{member_name} not in {self.archive_path}")
+        # The archive is opened once in every process, also after a fork
+        if self.pid != os.getpid():
+            with self.open_lock:
+                if self.pid != os.getpid():
+                    self.close()
+                    self.file_descriptor = os.open(self.archive_path, os.O_RDONLY)
+                    self.pid = os.getpid()
+        data = os.pread(
+            self.file_descriptor, int(self.sizes[row]), int(self.offsets[row])
+        )
+        if self.compressed[row]:
+            return zlib.decompress(data, -zlib.MAX_WBITS)
+
+        return data
+
+    def close(self) -> None:
+        if self.file_descriptor is not None:
+            os.close(self.file_descriptor)
+            self.file_descriptor = None
+
+    def __del__(self):
+        self.close()
+
+
+# The open archives of this process, shared by the threads of the loaders
+archives: Dict[str, ArchiveIndex] = {}
+archives_lock = threading.Lock()
+
+
+def get_archive(archive_path: str, index_dir: str = None) -> ArchiveIndex:
+    # The index directory is used when the archive is first opened in this process
+    with archives_lock:
+        if archive_path not in archives:
+            archives[archive_path] = ArchiveIndex(
+                archive_path, get_index_path(archive_path, index_dir)
+            )
+
+        return archives[archive_path]
+
+
+def get_archive_paths(image_paths: List[str]) -> List[str]:
+    # The archives that the images in archives are in
+    return sorted(
+        {
+            split_member_path(image_path)[0]
+            for image_path in image_paths
+            if is_member_path(image_path)
+        }
+    )
+
+
+def open_archives(archive_paths: List[str], index_dir: str = None) -> None:
+    """Opens archives, e.g. when a worker process starts, so that the reads of the
+    worker use the indexes in the index directory.
+
+    Args:
+        archive_paths: The archives.
+        index_dir: Where the indexes are kept, see get_index_path.
+
+    Returns:
+        None
+
+    """
+    for archive_path in archive_paths:
+        get_archive(archive_path, index_dir)
+
+
+def read_image(image_path: str) -> bytes:
+    """Reads an image from a file or from an archive, see is_member_path.
+
+    Args:
+        image_path: The image path.
+
+    Returns:
+        The encoded image.
+
+    """
+    if is_member_path(image_path):
+        archive_path, member_name = split_member_path(image_path)
+        return get_archive(archive_path).read(member_name)
+    with open(image_path, "rb") as file:
+        return file.read()
+
+
+def read_image_bytes(image_path: bytes) -> bytes:
+    # The paths come as bytes from tf.py_func
+    return read_image(image_path.decode())
@@ -0,0 +1,214 @@
+import logging
+from collections.abc import Sequence
+from typing import List, Tuple, Union
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def encode_captions(captions: List[str]) -> Tuple[bytes, np.ndarray, np.ndarray]:
+    # The UTF-8 buffer of the captions and where every caption begins and ends
+    encoded = [caption.encode() for caption in captions]
+    lengths = np.array([len(caption) for caption in encoded], dtype=np.int64)
+    caption_ends = np.cumsum(lengths)
+
+    return b"".join(encoded), caption_ends - lengths, caption_ends
+
+
+class CaptionTable:
+    # The rows of a dataset, one per caption, stored in columns
+    def __init__(
+        self,
+        image_paths: List[str],
+        image_indices: np.ndarray,
+        caption_buffer: bytes,
+        caption_begins: np.ndarray,
+        caption_ends: np.ndarray,
+    ):
+        """Creates a table where every image path is stored once and the text of all
+        the captions lives in a single buffer. Selecting rows only gathers the three
+        integer columns, the paths and the buffer are shared.
+
+        Args:
+            image_paths: The unique image paths.
+            image_indices: The image of every row, as an index in image_paths.
+            caption_buffer: The UTF-8 text of the captions.
+            caption_begins: Where the caption of every row begins in the buffer.
+            caption_ends: Where the caption of every row ends in the buffer.
+        """
+        self.image_paths = image_paths
+        self.image_indices = np.asarray(image_indices, dtype=np.int32)
+        self.caption_buffer = caption_buffer
+        self.caption_begins = np.asarray(caption_begins, dtype=np.int64)
+        self.caption_ends = np.asarray(caption_ends, dtype=np.int64)
+
+    @staticmethod
+    def from_groups(
+        image_paths: List[str], captions_per_image: List[List[str]]
+    ) -> "CaptionTable":
+        """Creates a table from the captions of every image, with the rows of every
+        image consecutive as in the lists returned by the datasets.
+
+        Args:
+            image_paths: The image paths.
+            captions_per_image: The captions of every image.
+
+        Returns:
+            The table.
+
+        """
+        assert len(image_paths) == len(captions_per_image)
+        image_indices = np.repeat(
+            np.arange(len(image_paths), dtype=np.int32),
+            [len(captions) for captions in captions_per_image],
+        )
+
+        return CaptionTable(
+            list(image_paths),
+            image_indices,
+            *encode_captions(
+                [caption for captions in captions_per_image for caption in captions]
+            ),
+        )
+
+    @staticmethod
+    def from_lists(image_paths: List[str], captions: List[str]) -> "CaptionTable":
+        """Creates a table from the parallel lists returned by the datasets.
+
+        Args:
+            image_paths: The image path of every row.
+            captions: The caption of every row.
+
+        Returns:
+            The table.
+
+        """
+        assert len(image_paths) == len(captions)
+        path_to_index = {}
+        for image_path in image_paths:
+            if image_path not in path_to_index:
+                path_to_index[image_path] = len(path_to_index)
+
+        return CaptionTable(
+            list(path_to_index.keys()),
+            np.array([path_to_index[path] for path in image_paths], dtype=np.int32),
+            *encode_captions(captions),
+        )
+
+    def __len__(self) -> int:
+        return len(self.image_indices)
+
+    def get_image_path(self, row: int) -> str:
+        return self.image_paths[self.image_indices[row]]
+
+    def get_caption(self, row: int) -> str:
+        return self.caption_buffer[
+            self.caption_begins[row] : self.caption_ends[row]
+        ].decode()
+
+    def take(self, rows: Union[np.ndarray, slice]) -> "CaptionTable":
+        """Selects rows, e.g. a slice, a shard or a permutation to shuffle the table.
+
+        Args:
+            rows: The rows, as a slice or as an array of row indices.
+
+        Returns:
+            A table with the selected rows, sharing the paths and the captions buffer.
+
+        """
+        return CaptionTable(
+            self.image_paths,
+            self.image_indices[rows],
+            self.caption_buffer,
+            self.caption_begins[rows],
+            self.caption_ends[rows],
+        )
+
+    def get_image_offsets(self) -> np.ndarray:
+        """Returns where the rows of every image begin, like get_image_offsets of the
+        datasets, comparing the image indices instead of the paths.
+
+        Returns:
+            The offsets with shape [num_images + 1].
+
+        """
+        if len(self) == 0:
+            return np.zeros(1, dtype=np.int64)
+        starts = np.flatnonzero(np.diff(self.image_indices)) + 1
+
+        return np.concatenate([[0], starts, [len(self)]]).astype(np.int64)
+
+    def get_image_paths(self) -> "ImagePathsView":
+        return ImagePathsView(self)
+
+    def get_captions(self) -> "CaptionsView":
+        return CaptionsView(self)
+
+    def to_lists(self) -> Tuple[List[str], List[str]]:
+        # The parallel lists of image paths and captions, as returned by get_data
+        return list(self.get_image_paths()), list(self.get_captions())
+
+    def get_nbytes(self) -> int:
+        return (
+            sum(len(image_path) for image_path in self.image_paths)
+            + self.image_indices.nbytes
+            + len(self.caption_buffer)
+            + self.caption_begins.nbytes
+            + self.caption_ends.nbytes
+        )
+
+
+class ImagePathsView(Sequence):
+    # The image path of every row of a table, for the loaders that expect a list
+    def __init__(self, table: CaptionTable):
+        self.table = table
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return ImagePathsView(self.table.take(row))
+        return self.table.get_image_path(row)
+
+    def __iter__(self):
+        image_paths = self.table.image_paths
+        for image_index in self.table.image_indices.tolist():
+            yield image_paths[image_index]
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(
+            image_path == other_path for image_path, other_path in zip(self, other)
+        )
+
+
+class CaptionsView(Sequence):
+    # The caption of every row of a table, for the loaders that expect a list
+    def __init__(self, table: CaptionTable):
+        self.table = table
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return CaptionsView(self.table.take(row))
+        return self.table.get_caption(row)
+
+    def __iter__(self):
+        buffer = self.table.caption_buffer
+        for begin, end in zip(
+            self.table.caption_begins.tolist(), self.table.caption_ends.tolist()
+        ):
+            yield buffer[begin:end].decode()
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(
+            caption == other_caption for caption, other_caption in zip(self, other)
+        )
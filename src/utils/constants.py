@@ -2,6 +2,10 @@
 WIDTH = 224
 HEIGHT = 224
 NUM_CHANNELS = 3
+# The images are resized to this smallest side before they are cropped
+SMALLEST_SIDE = 256
+# Every JPEG file starts with a start of image marker followed by another marker
+jpeg_magic = b"\xff\xd8\xff"
 
 # Pascal sentences splits
 pascal_train_size = 0.8
@@ -9,3 +13,16 @@ pascal_val_size = 0.1
 
 # Metrics
 inference_for_recall_at = [1, 5, 10]
+# The COCO 1K protocol averages the recalls over 5 folds of 1000 test images
+coco_fold_size = 1000
+
+# Lightweight text encoder
+num_hash_buckets = 100000
+word_embedding_size = 300
+
+# Two-stage retrieval: how many candidates to re-rank with the full embeddings
+two_stage_num_candidates = [10, 50, 100, 500]
+
+# Bootstrap confidence intervals of the recalls
+bootstrap_num_resamples = 10000
+bootstrap_confidence = 0.95
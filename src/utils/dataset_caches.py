@@ -0,0 +1,205 @@
+import os
+import json
+import zlib
+import logging
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def get_file_hash(file_path: str) -> int:
+    crc = 0
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 24), b""):
+            crc = zlib.crc32(chunk, crc)
+
+    return crc
+
+
+def get_fingerprint(file_path: str) -> Dict[str, Any]:
+    stat = os.stat(file_path)
+
+    return {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "hash": get_file_hash(file_path),
+    }
+
+
+def is_fresh(file_path: str, fingerprint: Dict[str, Any]) -> bool:
+    """Checks whether a file is unchanged since its fingerprint was taken. The file
+    is only hashed when its size is the same but its mtime is not, e.g. after a
+    checkout that rewrote it with the same content.
+
+    Args:
+        file_path: The file.
+        fingerprint: Its fingerprint, see get_fingerprint.
+
+    Returns:
+        Whether the file is unchanged.
+
+    """
+    if not os.path.isfile(file_path):
+        return False
+    stat = os.stat(file_path)
+    if stat.st_size != fingerprint["size"]:
+        return False
+    if stat.st_mtime_ns == fingerprint["mtime"]:
+        return True
+
+    return get_file_hash(file_path) == fingerprint["hash"]
+
+
+def encode_strings(strings: List[str]) -> np.ndarray:
+    # Neither the image names nor the preprocessed captions contain newlines
+    return np.frombuffer("\n".join(strings).encode(), dtype=np.uint8)
+
+
+def decode_strings(buffer: np.ndarray, count: int) -> List[str]:
+    return buffer.tobytes().decode().split("\n") if count > 0 else []
+
+
+class FlickrCache:
+    # The parsed Flickr captions and splits in a binary file
+    def __init__(self, cache_path: str, texts_path: str):
+        """Loads the cache of a captions file, if there is one and the captions file
+        did not change since it was written.
+
+        Args:
+            cache_path: Where the cache is.
+            texts_path: The captions file the cache was built from.
+        """
+        self.cache_path = cache_path
+        self.texts_path = texts_path
+        self.img_path_caption: Optional[Dict[str, List[str]]] = None
+        # The image names of every split file, keyed by the path of the file
+        self.splits: Dict[str, List[str]] = {}
+        self.split_fingerprints: Dict[str, Dict[str, Any]] = {}
+        self.fingerprint: Optional[Dict[str, Any]] = None
+        if os.path.isfile(cache_path):
+            self.load()
+
+    def load(self) -> None:
+        with np.load(self.cache_path) as cache_file:
+            metadata = json.loads(cache_file["metadata"].tobytes().decode())
+            if os.path.abspath(self.texts_path) != metadata["texts_path"]:
+                return
+            fingerprint = metadata["fingerprint"]
+            if not is_fresh(self.texts_path, fingerprint):
+                logger.info(f"{self.texts_path} changed, {self.cache_path} is stale")
+                return
+            names = decode_strings(cache_file["names"], metadata["num_names"])
+            caption_offsets = np.cumsum(
+                np.concatenate([[0], cache_file["caption_counts"]])
+            ).tolist()
+            captions = decode_strings(cache_file["captions"], caption_offsets[-1])
+            self.img_path_caption = {
+                name: captions[caption_offsets[i] : caption_offsets[i + 1]]
+                for i, name in enumerate(names)
+            }
+            for split in metadata["splits"]:
+                if is_fresh(split["path"], split["fingerprint"]):
+                    self.splits[split["path"]] = [
+                        names[index] for index in cache_file[split["array"]]
+                    ]
+                    self.split_fingerprints[split["path"]] = split["fingerprint"]
+        self.fingerprint = fingerprint
+        # Files touched without changes keep the cache, with their new mtime
+        touched = False
+        for file_path, file_fingerprint in [
+            (self.texts_path, self.fingerprint),
+            *self.split_fingerprints.items(),
+        ]:
+            mtime = os.stat(file_path).st_mtime_ns
+            if file_fingerprint["mtime"] != mtime:
+                file_fingerprint["mtime"] = mtime
+                touched = True
+        if touched or len(self.splits) < len(metadata["splits"]):
+            self.save()
+
+    def save(self) -> None:
+        """Writes the captions and the splits to the cache file, together with the
+        fingerprints of their source files.
+
+        Returns:
+            None
+
+        """
+        names = list(self.img_path_caption.keys())
+        name_to_index = {name: index for index, name in enumerate(names)}
+        arrays = {
+            "names": encode_strings(names),
+            "caption_counts": np.array(
+                [len(self.img_path_caption[name]) for name in names], dtype=np.int32
+            ),
+            "captions": encode_strings(
+                [caption for name in names for caption in self.img_path_caption[name]]
+            ),
+        }
+        splits = []
+        for split_index, (split_path, split_names) in enumerate(self.splits.items()):
+            array_name = f"split_{split_index}"
+            arrays[array_name] = np.array(
+                [name_to_index[name] for name in split_names], dtype=np.int32
+            )
+            splits.append(
+                {
+                    "path": split_path,
+                    "fingerprint": self.split_fingerprints[split_path],
+                    "array": array_name,
+                }
+            )
+        metadata = {
+            "texts_path": os.path.abspath(self.texts_path),
+            "fingerprint": self.fingerprint,
+            "num_names": len(names),
+            "splits": splits,
+        }
+        arrays["metadata"] = np.frombuffer(json.dumps(metadata).encode(), np.uint8)
+        with open(self.cache_path + ".tmp", "wb") as file:
+            np.savez(file, **arrays)
+        os.replace(self.cache_path + ".tmp", self.cache_path)
+
+    def get_captions(self, parse_function) -> Dict[str, List[str]]:
+        """Returns the parsed captions, parsing the captions file and writing the
+        cache if it is missing or stale.
+
+        Args:
+            parse_function: Parses the captions file.
+
+        Returns:
+            Image name to list of captions dict.
+
+        """
+        if self.img_path_caption is None:
+            self.fingerprint = get_fingerprint(self.texts_path)
+            self.img_path_caption = parse_function(self.texts_path)
+            self.splits = {}
+            self.split_fingerprints = {}
+            self.save()
+            logger.info(f"Parsed captions cached to {self.cache_path}")
+
+        return self.img_path_caption
+
+    def get_split(self, split_path: str, read_function) -> List[str]:
+        """Returns the image names of a split file, reading the file and updating the
+        cache if it is not cached yet or it changed.
+
+        Args:
+            split_path: The file where the images of the split are listed.
+            read_function: Reads the image names of the split file.
+
+        Returns:
+            The image names.
+
+        """
+        split_path = os.path.abspath(split_path)
+        if split_path not in self.splits:
+            self.split_fingerprints[split_path] = get_fingerprint(split_path)
+            self.splits[split_path] = read_function(split_path)
+            self.save()
+
+        return self.splits[split_path]
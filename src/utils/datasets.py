@@ -1,15 +1,32 @@
+import io
 import json
 import re
 import os
 import logging
+import multiprocessing
 from abc import ABC
-from typing import Dict, Any, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterator, List, Set, Tuple
 
+import numpy as np
+
+from utils.archives import resolve_images_path
+from utils.caption_tables import CaptionTable
 from utils.constants import pascal_train_size, pascal_val_size
+from utils.dataset_caches import FlickrCache
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+json_whitespace = re.compile(r"[ \t\n\r]*")
+non_letters = re.compile("[^a-z' ]+")
+spaces = re.compile(r"\s+")
+# Joins the captions of a chunk, see preprocess_captions_chunk
+caption_separator = "\x00"
+non_letter_bytes = bytes(
+    char for char in range(128) if chr(char) not in "abcdefghijklmnopqrstuvwxyz' \x00"
+)
+
 
 def preprocess_caption(caption: str) -> str:
     """Basic method used around all classes
@@ -26,29 +43,304 @@ def preprocess_caption(caption: str) -> str:
 
     """
     caption = caption.lower()
-    caption = re.sub("[^a-z' ]+", "", caption)
-    caption = re.sub("\s+", " ", caption).strip()  # NOQA
+    caption = non_letters.sub("", caption)
+    caption = spaces.sub(" ", caption).strip()
     caption = caption.strip()
 
     return caption
 
 
+def preprocess_captions_chunk(captions: List[str]) -> List[str]:
+    """Pre-processes a chunk of captions exactly like preprocess_caption, but on the
+    whole chunk joined with a separator, with string methods instead of regexes:
+
+    1. After lower casing, every non ASCII character is removed by the letters
+    regex, so the chunk is encoded to ASCII dropping them.
+    2. The remaining characters which are not letters are deleted with a bytes
+    translation table.
+    3. Only spaces are left, so splitting and joining every caption squeezes them
+    and strips it.
+
+    Args:
+        captions: The captions.
+
+    Returns:
+        The pre-processed captions.
+
+    """
+    if not captions:
+        return []
+    chunk = caption_separator.join(captions)
+    if chunk.count(caption_separator) != len(captions) - 1:
+        # A caption contains the separator itself
+        return [preprocess_caption(caption) for caption in captions]
+    chunk = chunk.lower().encode("ascii", "ignore").translate(None, non_letter_bytes)
+
+    return [
+        " ".join(caption.split())
+        for caption in chunk.decode("ascii").split(caption_separator)
+    ]
+
+
+def preprocess_captions(
+    captions: List[str], num_workers: int = 1, chunk_size: int = 10000
+) -> List[str]:
+    """Pre-processes a batch of captions, in chunks spread over a pool of worker
+    processes for large corpora. The result is the same as preprocess_caption on
+    every caption.
+
+    Args:
+        captions: The captions.
+        num_workers: The number of worker processes, or 1 to pre-process the chunks
+        in this process.
+        chunk_size: How many captions to pre-process at once.
+
+    Returns:
+        The pre-processed captions.
+
+    """
+    chunks = [
+        captions[begin : begin + chunk_size]
+        for begin in range(0, len(captions), chunk_size)
+    ]
+    if num_workers > 1 and len(chunks) > 1:
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(min(num_workers, len(chunks))) as pool:
+            processed_chunks = pool.map(preprocess_captions_chunk, chunks)
+    else:
+        processed_chunks = [preprocess_captions_chunk(chunk) for chunk in chunks]
+
+    return [caption for chunk in processed_chunks for caption in chunk]
+
+
+def read_quarantine(quarantine_path: str) -> Set[str]:
+    """Reads the broken images listed by the validate images pipeline, so that the
+    datasets leave them out.
+
+    Args:
+        quarantine_path: The quarantine list, one image path and why it is broken per
+        line, or None to leave no image out.
+
+    Returns:
+        The image paths.
+
+    """
+    if quarantine_path is None:
+        return set()
+    with open(quarantine_path) as file:
+        return {line.split("\t")[0] for line in file.read().splitlines() if line}
+
+
+def read_image_ids(ids_path: str) -> List[int]:
+    """Reads the image ids of a split, one per line, e.g. the Karpathy COCO test
+    split written by export_coco_split_ids_pipeline.py.
+
+    Args:
+        ids_path: The file with the image ids.
+
+    Returns:
+        The image ids, in the order of the file.
+
+    """
+    with open(ids_path) as file:
+        return [int(line) for line in file.read().split()]
+
+
+def check_shard(shard_index: int, num_shards: int) -> None:
+    # The datasets keep every num_shards-th image starting with the shard_index-th, so
+    # the rows of an image stay together and the shards differ by at most one image
+    if not 0 <= shard_index < num_shards:
+        raise ValueError("Wrong shard!")
+
+
+def get_image_offsets(image_paths: List[str]) -> np.ndarray:
+    """Returns where the rows of every image begin, CSR style, since every image is
+    repeated once per caption in consecutive rows and the number of captions per
+    image can vary.
+
+    Args:
+        image_paths: The image path of every row.
+
+    Returns:
+        The offsets with shape [num_images + 1], where the rows of the i-th image are
+        offsets[i] to offsets[i + 1].
+
+    """
+    num_rows = len(image_paths)
+    starts = [
+        row
+        for row in range(num_rows)
+        if row == 0 or image_paths[row] != image_paths[row - 1]
+    ]
+
+    return np.array(starts + [num_rows], dtype=np.int64)
+
+
+class JsonStream:
+    # Decodes a JSON file one value at a time, reading it in chunks
+    def __init__(self, file, chunk_size: int):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.position :] + chunk
+        self.position = 0
+
+        return True
+
+    def peek(self) -> str:
+        # The next non whitespace character, or an empty string at the end
+        while True:
+            self.position = json_whitespace.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.fill():
+                return ""
+
+    def expect(self, chars: str) -> str:
+        char = self.peek()
+        if char == "" or char not in chars:
+            raise ValueError(f"Wrong JSON file, expected one of {chars}!")
+        self.position += 1
+
+        return char
+
+    def decode(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                # A value that ends the buffer, e.g. a number, may go on in the file
+                if end < len(self.buffer) or self.eof:
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+
+def stream_json_arrays(
+    json_path: str, keys: List[str], chunk_size: int = 1 << 20
+) -> Iterator[Tuple[str, Any]]:
+    """Streams the elements of some arrays of a JSON object without loading the whole
+    file, so only one element is decoded at a time. The other values of the object
+    are decoded and dropped.
+
+    Args:
+        json_path: The JSON file, holding an object.
+        keys: The keys of the arrays to stream.
+        chunk_size: How many characters to read at once.
+
+    Returns:
+        The key of the array and the element, for every element of the arrays in the
+        order of the file.
+
+    """
+    with open(json_path) as file:
+        stream = JsonStream(file, chunk_size)
+        stream.expect("{")
+        if stream.peek() == "}":
+            return
+        while True:
+            key = stream.decode()
+            stream.expect(":")
+            if key in keys and stream.peek() == "[":
+                stream.expect("[")
+                if stream.peek() == "]":
+                    stream.expect("]")
+                else:
+                    while True:
+                        yield key, stream.decode()
+                        if stream.expect(",]") == "]":
+                            break
+            else:
+                stream.decode()
+            if stream.expect(",}") == "}":
+                return
+
+
 class BaseCocoDataset(ABC):
 
     # Adapted for working with the Microsoft COCO dataset.
-    def __init__(self, images_path: str, json_path: str):
+    def __init__(
+        self,
+        images_path: str,
+        json_path: str,
+        quarantine_path: str = None,
+        shard_index: int = 0,
+        num_shards: int = 1,
+    ):
         """Creates a dataset object.
 
         Args:
-            images_path: Path where the images are located.
+            images_path: Path where the images are located, or an archive of them,
+            see resolve_images_path.
             json_path: Path to the json file where the mappings are indicated as well
             as the captions.
+            quarantine_path: The broken images to leave out, see read_quarantine.
+            shard_index: The shard of this worker, see check_shard.
+            num_shards: The number of workers the images are split across.
         """
-        json_file = self.read_json(json_path)
-        self.id_to_filename = self.parse_image_paths(json_file, images_path)
-        self.id_to_captions = self.parse_captions(json_file)
+        check_shard(shard_index, num_shards)
+        self.shard_index = shard_index
+        self.num_shards = num_shards
+        self.id_to_filename, self.id_to_captions = self.parse_json_stream(
+            json_path, resolve_images_path(images_path)
+        )
+        quarantined = read_quarantine(quarantine_path)
+        for pair_id, image_path in list(self.id_to_filename.items()):
+            if image_path in quarantined:
+                del self.id_to_filename[pair_id]
+                self.id_to_captions.pop(pair_id, None)
         logger.info("Object variables set...")
 
+    @staticmethod
+    def parse_json_stream(
+        json_path: str, images_path: str
+    ) -> Tuple[Dict[int, str], Dict[int, List[str]]]:
+        """Parses the images and the captions metadata while streaming the json file,
+        so that the transient objects of the whole file are never held at once. The
+        result is the same as parse_image_paths and parse_captions on the loaded
+        json file.
+
+        Args:
+            json_path: Path where the json file is.
+            images_path: A path where the images are.
+
+        Returns:
+            The image id to image filename dict and the image id to captions dict.
+
+        """
+        id_to_filename: Dict[int, str] = {}
+        image_ids = []
+        captions = []
+        for key, data in stream_json_arrays(json_path, ["images", "annotations"]):
+            if key == "images":
+                id_to_filename[data["id"]] = os.path.join(
+                    images_path, data["file_name"]
+                )
+            else:
+                image_ids.append(data["image_id"])
+                captions.append(data["caption"])
+        id_to_captions: Dict[int, List[str]] = {}
+        for image_id, caption in zip(image_ids, preprocess_captions(captions)):
+            if image_id not in id_to_captions:
+                id_to_captions[image_id] = []
+            id_to_captions[image_id].append(caption)
+
+        return id_to_filename, id_to_captions
+
     @staticmethod
     def parse_image_paths(
         json_file: Dict[str, Any], images_path: str
@@ -83,12 +375,13 @@ class BaseCocoDataset(ABC):
 
         """
         id_to_captions: Dict[int, List[str]] = {}
-        for captions_data in json_file["annotations"]:
+        captions = preprocess_captions(
+            [captions_data["caption"] for captions_data in json_file["annotations"]]
+        )
+        for captions_data, caption in zip(json_file["annotations"], captions):
             if captions_data["image_id"] not in id_to_captions.keys():
                 id_to_captions[captions_data["image_id"]] = []
-            id_to_captions[captions_data["image_id"]].append(
-                preprocess_caption(captions_data["caption"])
-            )
+            id_to_captions[captions_data["image_id"]].append(caption)
 
         return id_to_captions
 
@@ -114,12 +407,14 @@ class BaseCocoDataset(ABC):
     ) -> Tuple[List[str], List[str]]:
         """Returns the image paths and captions.
 
-        Because in the dataset there are 5 captions for each image, what the method does
-        is create:
+        Because in the dataset there are 5 to 7 captions for each image, what the method
+        does is create:
+
+        - A list of image paths where each image path is repeated once per caption.
+        - A list of captions where the number of captions is equal to the number of
+        image paths.
 
-        - A list of image paths where each image path is repeated 5 times.
-        - A list of lists of word tokens where the number of inner lists is equal to the
-        number of image paths.
+        The rows of every image are consecutive, see get_image_offsets.
 
         Args:
             id_to_filename: Pair id to image filename dict.
@@ -133,41 +428,77 @@ class BaseCocoDataset(ABC):
         image_paths = []
         captions = []
         for pair_id in id_to_filename.keys():
-            for i in range(5):
+            for caption in id_to_captions[pair_id]:
                 image_paths.append(id_to_filename[pair_id])
-                captions.append(id_to_captions[pair_id][i])
+                captions.append(caption)
 
         assert len(image_paths) == len(captions)
 
         return image_paths, captions
 
     def get_data(self):
+        pair_ids = self.get_pair_ids()
         image_paths, captions = self.get_data_wrapper(
-            self.id_to_filename, self.id_to_captions
+            {pair_id: self.id_to_filename[pair_id] for pair_id in pair_ids},
+            {pair_id: self.id_to_captions[pair_id] for pair_id in pair_ids},
         )
 
         return image_paths, captions
 
+    def get_pair_ids(self) -> List[int]:
+        return list(self.id_to_filename.keys())[self.shard_index :: self.num_shards]
+
+    def get_table(self) -> CaptionTable:
+        # The rows of get_data, stored in columns
+        pair_ids = self.get_pair_ids()
+
+        return CaptionTable.from_groups(
+            [self.id_to_filename[pair_id] for pair_id in pair_ids],
+            [self.id_to_captions[pair_id] for pair_id in pair_ids],
+        )
+
 
 class TrainCocoDataset(BaseCocoDataset):
     # Adapted for working with the Microsoft COCO dataset.
 
-    def __init__(self, images_path: str, json_path: str):
+    def __init__(
+        self,
+        images_path: str,
+        json_path: str,
+        quarantine_path: str = None,
+        shard_index: int = 0,
+        num_shards: int = 1,
+    ):
         """Creates a dataset object.
 
         Args:
             images_path: Path where the images are located.
             json_path: Path to the json file where the mappings are indicated as well
             as the captions.
+            quarantine_path: The broken images to leave out, see read_quarantine.
+            shard_index: The shard of this worker, see check_shard.
+            num_shards: The number of workers the images are split across.
         """
-        super().__init__(images_path, json_path)
+        super().__init__(
+            images_path, json_path, quarantine_path, shard_index, num_shards
+        )
         logger.info("Class variables set...")
 
 
 class ValCocoDataset(BaseCocoDataset):
     # Adapted for working with the Microsoft COCO dataset.
 
-    def __init__(self, images_path: str, json_path: str, val_size: int = None):
+    def __init__(
+        self,
+        images_path: str,
+        json_path: str,
+        val_size: int = None,
+        quarantine_path: str = None,
+        shard_index: int = 0,
+        num_shards: int = 1,
+        image_ids_path: str = None,
+        offset: int = 0,
+    ):
         """Creates a dataset object.
 
         Args:
@@ -175,17 +506,84 @@ class ValCocoDataset(BaseCocoDataset):
             json_path: Path to the json file where the mappings are indicated as well
             as the captions.
             val_size: The size of the validation set.
+            quarantine_path: The broken images to leave out, see read_quarantine.
+            shard_index: The shard of this worker, see check_shard.
+            num_shards: The number of workers the images are split across.
+            image_ids_path: The images of the set, see read_image_ids. If missing,
+            the set is a range of the images with captions in the json file.
+            offset: Where the range of images begins, when there are no image ids.
         """
-        super().__init__(images_path, json_path)
+        super().__init__(
+            images_path, json_path, quarantine_path, shard_index, num_shards
+        )
         self.val_size = val_size
+        self.image_ids = read_image_ids(image_ids_path) if image_ids_path else None
+        self.offset = offset
+
+    def get_captioned_ids(self) -> List[int]:
+        # The images with captions, in the order of the json file
+        return [
+            pair_id
+            for pair_id in self.id_to_filename.keys()
+            if pair_id in self.id_to_captions
+        ]
+
+    def get_pair_ids(self) -> List[int]:
+        # The listed images or val_size images from the offset, without the
+        # quarantined ones
+        if self.image_ids is not None:
+            pair_ids = [
+                pair_id
+                for pair_id in self.image_ids
+                if pair_id in self.id_to_filename and pair_id in self.id_to_captions
+            ]
+            if len(pair_ids) < len(self.image_ids):
+                logger.warning(
+                    f"{len(self.image_ids) - len(pair_ids)} listed images are "
+                    f"quarantined or not in the json file"
+                )
+        else:
+            pair_ids = self.get_captioned_ids()[self.offset :]
+
+        return pair_ids[: self.val_size][self.shard_index :: self.num_shards]
 
 
 class FlickrDataset:
     # Adapted for working with the Flickr8k and Flickr30k dataset.
 
-    def __init__(self, images_path: str, texts_path: str):
-        self.img_path_caption = self.parse_captions_filenames(texts_path)
-        self.images_path = images_path
+    def __init__(
+        self,
+        images_path: str,
+        texts_path: str,
+        cache_path: str = None,
+        quarantine_path: str = None,
+        shard_index: int = 0,
+        num_shards: int = 1,
+    ):
+        """Creates a dataset object.
+
+        Args:
+            images_path: Path where the images are located, or an archive of them,
+            see resolve_images_path.
+            texts_path: Path where the text doc with the descriptions is.
+            cache_path: Where to cache the parsed captions and splits, so that they
+            are only parsed again when the text files change.
+            quarantine_path: The broken images to leave out, see read_quarantine.
+            shard_index: The shard of this worker, see check_shard.
+            num_shards: The number of workers the images are split across.
+        """
+        check_shard(shard_index, num_shards)
+        self.shard_index = shard_index
+        self.num_shards = num_shards
+        self.cache = FlickrCache(cache_path, texts_path) if cache_path else None
+        if self.cache is not None:
+            self.img_path_caption = self.cache.get_captions(
+                self.parse_captions_filenames
+            )
+        else:
+            self.img_path_caption = self.parse_captions_filenames(texts_path)
+        self.images_path = resolve_images_path(images_path)
+        self.quarantined = read_quarantine(quarantine_path)
         logger.info("Object variables set...")
 
     @staticmethod
@@ -204,22 +602,49 @@ class FlickrDataset:
 
         """
         img_path_caption: Dict[str, List[str]] = {}
+        image_tags = []
+        captions = []
         with open(texts_path, "r") as file:
             for line in file:
                 line_parts = line.split("\t")
-                image_tag = line_parts[0].partition("#")[0]
-                caption = line_parts[1]
-                if image_tag not in img_path_caption:
-                    img_path_caption[image_tag] = []
-                img_path_caption[image_tag].append(preprocess_caption(caption))
+                image_tags.append(line_parts[0].partition("#")[0])
+                captions.append(line_parts[1])
+        for image_tag, caption in zip(image_tags, preprocess_captions(captions)):
+            if image_tag not in img_path_caption:
+                img_path_caption[image_tag] = []
+            img_path_caption[image_tag].append(caption)
 
         return img_path_caption
 
+    @staticmethod
+    def read_image_names(imgs_file_path: str) -> List[str]:
+        """Reads the names of the images of a split.
+
+        Args:
+            imgs_file_path: A path to a file where the images of the split are listed.
+
+        Returns:
+            The image names.
+
+        """
+        image_names = []
+        with open(imgs_file_path, "r") as file:
+            for image_name in file:
+                # Remove the newline character at the end
+                image_name = image_name[:-1]
+                # If there is no specified codec in the name of the image append jpg
+                if not image_name.endswith(".jpg"):
+                    image_name += ".jpg"
+                image_names.append(image_name)
+
+        return image_names
+
     @staticmethod
     def get_data_wrapper(
         imgs_file_path: str,
         img_path_caption: Dict[str, List[str]],
         images_dir_path: str,
+        image_names: List[str] = None,
     ):
         """Returns the image paths, the captions and the lengths of the captions.
 
@@ -228,47 +653,193 @@ class FlickrDataset:
             validation part of the dataset are listed.
             img_path_caption: Image name to list of captions dict.
             images_dir_path: A path where all the images are located.
+            image_names: The images listed in imgs_file_path, if already read.
 
         Returns:
             Image paths, captions and lengths.
 
         """
+        if image_names is None:
+            image_names = FlickrDataset.read_image_names(imgs_file_path)
         image_paths = []
         captions = []
-        with open(imgs_file_path, "r") as file:
-            for image_name in file:
-                # Remove the newline character at the end
-                image_name = image_name[:-1]
-                # If there is no specified codec in the name of the image append jpg
-                if not image_name.endswith(".jpg"):
-                    image_name += ".jpg"
-                for i in range(5):
-                    image_paths.append(os.path.join(images_dir_path, image_name))
-                    captions.append(img_path_caption[image_name][i])
+        for image_name in image_names:
+            for caption in img_path_caption[image_name]:
+                image_paths.append(os.path.join(images_dir_path, image_name))
+                captions.append(caption)
 
         assert len(image_paths) == len(captions)
 
         return image_paths, captions
 
+    def get_image_names(self, images_file_path: str) -> List[str]:
+        if self.cache is not None:
+            image_names = self.cache.get_split(images_file_path, self.read_image_names)
+        else:
+            image_names = self.read_image_names(images_file_path)
+
+        return [
+            image_name
+            for image_name in image_names
+            if os.path.join(self.images_path, image_name) not in self.quarantined
+        ][self.shard_index :: self.num_shards]
+
     def get_data(self, images_file_path: str):
         image_paths, captions = self.get_data_wrapper(
-            images_file_path, self.img_path_caption, self.images_path
+            images_file_path,
+            self.img_path_caption,
+            self.images_path,
+            self.get_image_names(images_file_path),
         )
 
         return image_paths, captions
 
+    def get_table(self, images_file_path: str) -> CaptionTable:
+        # The rows of get_data, stored in columns
+        image_names = self.get_image_names(images_file_path)
+
+        return CaptionTable.from_groups(
+            [os.path.join(self.images_path, image_name) for image_name in image_names],
+            [self.img_path_caption[image_name] for image_name in image_names],
+        )
+
 
 class PascalSentencesDataset:
     # Adapted for working with the Pascal sentences dataset.
 
-    def __init__(self, images_path, texts_path):
+    def __init__(
+        self,
+        images_path,
+        texts_path,
+        quarantine_path: str = None,
+        shard_index: int = 0,
+        num_shards: int = 1,
+    ):
+        check_shard(shard_index, num_shards)
+        self.shard_index = shard_index
+        self.num_shards = num_shards
+        # The images can also be in an archive, see resolve_images_path
         self.category_image_path_captions = self.parse_captions_filenames(
-            texts_path, images_path
+            texts_path, resolve_images_path(images_path)
+        )
+        # The images flattened in the order of the categories, with their category
+        # and their index within the category
+        self.image_paths: List[str] = []
+        self.image_captions: List[List[str]] = []
+        self.image_categories: List[str] = []
+        category_indices = []
+        for category, image_path_captions in self.category_image_path_captions.items():
+            for v, (image_path, captions) in enumerate(image_path_captions.items()):
+                self.image_paths.append(image_path)
+                self.image_captions.append(captions)
+                self.image_categories.append(category)
+                category_indices.append(v)
+        self.category_indices = np.array(category_indices, dtype=np.int32)
+        # The broken images are left out of the splits and the folds, but keep their
+        # place so that the other images stay in the same split
+        quarantined = read_quarantine(quarantine_path)
+        self.is_usable = np.array(
+            [image_path not in quarantined for image_path in self.image_paths],
+            dtype=bool,
         )
+        # The images of every split, computed once
+        self.split_indices = {
+            data_type: np.array(
+                [
+                    image_index
+                    for image_index, v in enumerate(category_indices)
+                    if self.in_split(v, data_type) and self.is_usable[image_index]
+                ],
+                dtype=np.int64,
+            )[shard_index::num_shards]
+            for data_type in ["train", "val", "test"]
+        }
+
+    @staticmethod
+    def list_caption_files(texts_path: str) -> List[Tuple[str, str, str]]:
+        """Lists the caption files of every category with os.scandir, which gets
+        whether an entry is a directory from the directory listing itself.
+
+        Args:
+            texts_path: Path where the image captions are.
+
+        Returns:
+            The category, the caption file name and the caption file path of every
+            caption file, in the order of the directory listings. Categories without
+            caption files get a None file name.
+
+        """
+        caption_files = []
+        with os.scandir(texts_path) as category_entries:
+            for category_entry in category_entries:
+                if not category_entry.is_dir():
+                    continue
+                caption_files.append((category_entry.name, None, None))
+                with os.scandir(category_entry.path) as file_entries:
+                    for file_entry in file_entries:
+                        if file_entry.name.endswith(".txt"):
+                            caption_files.append(
+                                (category_entry.name, file_entry.name, file_entry.path)
+                            )
+
+        return caption_files
+
+    @staticmethod
+    def read_texts(texts_path: str, num_threads: int) -> Dict[str, Dict[str, str]]:
+        """Reads the content of every caption file, either from the text tree, where
+        the small files are read by a pool of threads, or from a file packed with
+        pack_texts.
+
+        Args:
+            texts_path: Path where the image captions are, or the packed file.
+            num_threads: How many files to read at the same time.
+
+        Returns:
+            The content of every caption file by category and by file name.
+
+        """
+        if os.path.isfile(texts_path):
+            with open(texts_path, "r") as file:
+                return json.load(file)["categories"]
+        caption_files = PascalSentencesDataset.list_caption_files(texts_path)
+
+        def read_file(file_path: str) -> str:
+            with open(file_path, "r") as file:
+                return file.read()
+
+        file_paths = [file_path for _, _, file_path in caption_files if file_path]
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            contents = iter(list(executor.map(read_file, file_paths)))
+        texts: Dict[str, Dict[str, str]] = {}
+        for category, txt_file, _ in caption_files:
+            texts.setdefault(category, {})
+            if txt_file is not None:
+                texts[category][txt_file] = next(contents)
+
+        return texts
+
+    @staticmethod
+    def pack_texts(texts_path: str, packed_path: str, num_threads: int = 16) -> None:
+        """Packs the whole text tree into a single file, which can be given instead of
+        the text tree to read all the captions with one sequential read.
+
+        Args:
+            texts_path: Path where the image captions are.
+            packed_path: Where to write the packed file.
+            num_threads: How many files to read at the same time.
+
+        Returns:
+            None
+
+        """
+        texts = PascalSentencesDataset.read_texts(texts_path, num_threads)
+        with open(packed_path + ".tmp", "w") as file:
+            json.dump({"format": "pascal_sentences", "categories": texts}, file)
+        os.replace(packed_path + ".tmp", packed_path)
 
     @staticmethod
     def parse_captions_filenames(
-        texts_path: str, images_path: str
+        texts_path: str, images_path: str, num_threads: int = 16
     ) -> Dict[str, Dict[str, List[str]]]:
         """Creates a dictionary of dictionaries where:
 
@@ -280,88 +851,157 @@ class PascalSentencesDataset:
         words of the caption.
 
         Args:
-            texts_path: Path where the image captions are.
+            texts_path: Path where the image captions are, or a file packed with
+            pack_texts.
             images_path: Path where the images are.
+            num_threads: How many caption files to read at the same time.
 
         Returns:
             A dictionary as explained above.
 
         """
         category_image_path_captions: Dict[str, Dict[str, List[str]]] = dict(dict())
-        for category in os.listdir(texts_path):
-            file_path = os.path.join(texts_path, category)
-            if os.path.isdir(file_path):
-                if category not in category_image_path_captions:
-                    category_image_path_captions[category] = {}
-                for txt_file in os.listdir(file_path):
-                    if txt_file.endswith(".txt"):
-                        image_path = os.path.join(
-                            images_path, category, txt_file[:-3] + "jpg"
-                        )
-                        if image_path not in category_image_path_captions[category]:
-                            category_image_path_captions[category][image_path] = []
-                        txt_file_path = os.path.join(file_path, txt_file)
-                        with open(txt_file_path, "r") as f:
-                            for caption in f:
-                                category_image_path_captions[category][
-                                    image_path
-                                ].append(preprocess_caption(caption))
+        texts = PascalSentencesDataset.read_texts(texts_path, num_threads)
+        for category, category_texts in texts.items():
+            category_image_path_captions[category] = {}
+            for txt_file, text in category_texts.items():
+                image_path = os.path.join(images_path, category, txt_file[:-3] + "jpg")
+                # Iterating over the text splits it into lines like iterating over
+                # the file
+                category_image_path_captions[category][image_path] = [
+                    preprocess_caption(caption) for caption in io.StringIO(text)
+                ]
 
         return category_image_path_captions
 
     @staticmethod
-    def get_data_wrapper(category_image_path_captions, data_type: str):
-        """Returns the image paths, the captions and the captions lengths.
+    def in_split(image_index: int, data_type: str) -> bool:
+        """Checks whether the image belongs to the split.
 
         Args:
-            category_image_path_captions: A really compex dict :(
-            data_type: The type of the data that is returned (Train, val or test).
+            image_index: The index of the image within its category.
+            data_type: The type of the data (Train, val or test).
 
         Returns:
-            The image paths, the captions and the captions lengths.
+            Whether the image belongs to the split.
 
         """
-        image_paths = []
-        captions = []
         train_size = pascal_train_size * 50
         val_size = pascal_val_size * 50
-        for category in category_image_path_captions.keys():
-            for v, image_path in enumerate(
-                category_image_path_captions[category].keys()
-            ):
-                for caption in category_image_path_captions[category][image_path]:
-                    if data_type == "train":
-                        if v < train_size:
-                            image_paths.append(image_path)
-                            captions.append(caption)
-                    elif data_type == "val":
-                        if train_size + val_size > v >= train_size:
-                            image_paths.append(image_path)
-                            captions.append(caption)
-                    elif data_type == "test":
-                        if v >= train_size + val_size:
-                            image_paths.append(image_path)
-                            captions.append(caption)
-                    else:
-                        raise ValueError("Wrong data type!")
+        if data_type == "train":
+            return image_index < train_size
+        elif data_type == "val":
+            return train_size + val_size > image_index >= train_size
+        elif data_type == "test":
+            return image_index >= train_size + val_size
+        else:
+            raise ValueError("Wrong data type!")
+
+    def get_fold_indices(
+        self, num_folds: int, fold: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Splits the images into k folds for cross-validation. Like the fixed splits,
+        the folds are contiguous blocks of images of every category, so every fold
+        holds about the same number of images of each category.
+
+        Args:
+            num_folds: The number of folds.
+            fold: The fold to hold out.
+
+        Returns:
+            The indices of the training images and of the held out images.
+
+        """
+        if not 0 <= fold < num_folds:
+            raise ValueError("Wrong fold!")
+        category_sizes = np.array(
+            [
+                len(self.category_image_path_captions[category])
+                for category in self.image_categories
+            ]
+        )
+        image_folds = self.category_indices * num_folds // category_sizes
+
+        train_indices = np.flatnonzero((image_folds != fold) & self.is_usable)
+        held_out_indices = np.flatnonzero((image_folds == fold) & self.is_usable)
+        # Like the splits, the folds are sharded across the workers
+        shard = slice(self.shard_index, None, self.num_shards)
+
+        return train_indices[shard], held_out_indices[shard]
+
+    def get_data_from_indices(
+        self, image_indices: np.ndarray
+    ) -> Tuple[List[str], List[str]]:
+        """Returns the image paths and the captions of some images, one row per
+        caption.
+
+        Args:
+            image_indices: The indices of the images, e.g. from split_indices.
+
+        Returns:
+            The image paths and the captions.
+
+        """
+        image_paths = []
+        captions = []
+        for image_index in image_indices:
+            for caption in self.image_captions[image_index]:
+                image_paths.append(self.image_paths[image_index])
+                captions.append(caption)
 
         return image_paths, captions
 
-    def get_train_data(self):
-        img_paths, cap = self.get_data_wrapper(
-            self.category_image_path_captions, "train"
+    def get_table_from_indices(self, image_indices: np.ndarray) -> CaptionTable:
+        # The rows of get_data_from_indices, stored in columns
+        return CaptionTable.from_groups(
+            [self.image_paths[image_index] for image_index in image_indices],
+            [self.image_captions[image_index] for image_index in image_indices],
+        )
+
+    def get_categories_from_indices(self, image_indices: np.ndarray) -> List[str]:
+        # The category of every row of get_data_from_indices
+        return [
+            self.image_categories[image_index]
+            for image_index in image_indices
+            for _ in self.image_captions[image_index]
+        ]
+
+    def get_table(self, data_type: str) -> CaptionTable:
+        return self.get_table_from_indices(self.split_indices[data_type])
+
+    def get_fold_data(
+        self, num_folds: int, fold: int
+    ) -> Tuple[Tuple[List[str], List[str]], Tuple[List[str], List[str]]]:
+        """Returns the training and the held out data of a cross-validation fold, see
+        get_fold_indices.
+
+        Args:
+            num_folds: The number of folds.
+            fold: The fold to hold out.
+
+        Returns:
+            The image paths and the captions of the training and of the held out
+            images.
+
+        """
+        train_indices, held_out_indices = self.get_fold_indices(num_folds, fold)
+
+        return (
+            self.get_data_from_indices(train_indices),
+            self.get_data_from_indices(held_out_indices),
         )
 
+    def get_train_data(self):
+        img_paths, cap = self.get_data_from_indices(self.split_indices["train"])
+
         return img_paths, cap
 
     def get_val_data(self):
-        img_paths, cap = self.get_data_wrapper(self.category_image_path_captions, "val")
+        img_paths, cap = self.get_data_from_indices(self.split_indices["val"])
 
         return img_paths, cap
 
     def get_test_data(self):
-        img_paths, cap = self.get_data_wrapper(
-            self.category_image_path_captions, "test"
-        )
+        img_paths, cap = self.get_data_from_indices(self.split_indices["test"])
 
         return img_paths, cap
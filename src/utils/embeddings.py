@@ -0,0 +1,114 @@
+import os
+import logging
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingStore:
+    # Embeddings of images and captions exported from a trained model
+    def __init__(self, store_dir: str):
+        """Opens an embedding store written by EmbeddingStore.save.
+
+        The embeddings are memory mapped, so opening the store is instant regardless
+        of its size.
+
+        Args:
+            store_dir: The directory of the store.
+        """
+        self.embedded_images = np.load(
+            os.path.join(store_dir, "images.npy"), mmap_mode="r"
+        )
+        self.embedded_captions = np.load(
+            os.path.join(store_dir, "captions.npy"), mmap_mode="r"
+        )
+        self.image_paths = self.read_lines(os.path.join(store_dir, "image_paths.txt"))
+        self.captions = self.read_lines(os.path.join(store_dir, "captions.txt"))
+        # Only stores of datasets with categories, e.g. Pascal sentences, have them
+        categories_path = os.path.join(store_dir, "categories.txt")
+        self.categories = (
+            self.read_lines(categories_path)
+            if os.path.exists(categories_path)
+            else None
+        )
+        assert len(self.image_paths) == self.embedded_images.shape[0]
+        assert len(self.captions) == self.embedded_captions.shape[0]
+        self.dim = self.embedded_images.shape[1]
+        logger.info("Object variables set...")
+
+    @staticmethod
+    def read_lines(file_path: str) -> List[str]:
+        with open(file_path, "r") as file:
+            return [line[:-1] for line in file]
+
+    @staticmethod
+    def write_lines(file_path: str, lines: List[str]) -> None:
+        with open(file_path, "w") as file:
+            for line in lines:
+                file.write(line + "\n")
+
+    @staticmethod
+    def save(
+        store_dir: str,
+        image_paths: List[str],
+        captions: List[str],
+        embedded_images: np.ndarray,
+        embedded_captions: np.ndarray,
+        categories: List[str] = None,
+    ) -> None:
+        """Writes the embeddings together with the image paths and captions they
+        belong to. The i-th row of each array belongs to the i-th image path, the i-th
+        caption and the i-th category.
+
+        Args:
+            store_dir: Where to write the store.
+            image_paths: The image paths.
+            captions: The captions.
+            embedded_images: The embedded images.
+            embedded_captions: The embedded captions.
+            categories: The categories, if the dataset has them.
+
+        Returns:
+            None
+
+        """
+        os.makedirs(store_dir, exist_ok=True)
+        np.save(
+            os.path.join(store_dir, "images.npy"), embedded_images.astype(np.float32)
+        )
+        np.save(
+            os.path.join(store_dir, "captions.npy"),
+            embedded_captions.astype(np.float32),
+        )
+        EmbeddingStore.write_lines(
+            os.path.join(store_dir, "image_paths.txt"), image_paths
+        )
+        EmbeddingStore.write_lines(os.path.join(store_dir, "captions.txt"), captions)
+        if categories is not None:
+            assert len(categories) == len(image_paths)
+            EmbeddingStore.write_lines(
+                os.path.join(store_dir, "categories.txt"), categories
+            )
+
+    def get_unique_images(self) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """Groups the rows of the store by image, since every image is repeated once
+        per caption.
+
+        Returns:
+            The unique image paths in order of appearance, the first row of every
+            unique image and the index of the unique image of every row.
+
+        """
+        path_to_index: Dict[str, int] = {}
+        first_rows = []
+        groups = np.zeros(len(self.image_paths), dtype=np.int64)
+        for row, image_path in enumerate(self.image_paths):
+            if image_path not in path_to_index:
+                path_to_index[image_path] = len(first_rows)
+                first_rows.append(row)
+            groups[row] = path_to_index[image_path]
+
+        return list(path_to_index.keys()), np.array(first_rows, dtype=np.int64), groups
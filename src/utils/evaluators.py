@@ -1,13 +1,23 @@
 import sys
+import time
 import logging
 import numpy as np
+from typing import Dict, List, Tuple
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
 class Evaluator:
-    def __init__(self, num_samples: int = 0, num_features: int = 0):
+    def __init__(
+        self,
+        num_samples: int = 0,
+        num_features: int = 0,
+        image_offsets: np.ndarray = None,
+    ):
+        # Where the rows of every image begin, see get_image_offsets in datasets.py.
+        # By default every image has 5 captions.
+        self.image_offsets = image_offsets
         self.loss = 0.0
         self.best_loss = sys.maxsize
         self.best_image2text_recall_at_k = -1.0
@@ -19,10 +29,13 @@ class Evaluator:
         self.num_features = num_features
         self.embedded_images = np.zeros((self.num_samples, self.num_features))
         self.embedded_captions = np.zeros((self.num_samples, self.num_features))
+        # The ranks of the current embeddings, per direction
+        self.cached_ranks: Dict[str, np.ndarray] = {}
 
     def reset_all_vars(self) -> None:
         self.loss = 0
         self.index_update = 0
+        self.cached_ranks = {}
         self.embedded_images = np.zeros((self.num_samples, self.num_features))
         self.embedded_captions = np.zeros((self.num_samples, self.num_features))
         self.cur_text2image_recall_at_k = -1.0
@@ -35,6 +48,7 @@ class Evaluator:
         self, embedded_images: np.ndarray, embedded_captions: np.ndarray
     ) -> None:
         num_samples = embedded_images.shape[0]
+        self.cached_ranks = {}
         self.embedded_images[
             self.index_update : self.index_update + num_samples, :
         ] = embedded_images
@@ -80,21 +94,7 @@ class Evaluator:
             The recall at K.
 
         """
-        num_images = self.embedded_images.shape[0] // 5
-        ranks = np.zeros(num_images)
-        for index in range(num_images):
-            # Get query image
-            query_image = self.embedded_images[5 * index]
-            # Similarities
-            similarities = np.dot(query_image, self.embedded_captions.T).flatten()
-            indices = np.argsort(similarities)[::-1]
-            # Score
-            rank = sys.maxsize
-            for i in range(5 * index, 5 * index + 5, 1):
-                tmp = np.where(indices == i)[0][0]
-                if tmp < rank:
-                    rank = tmp
-            ranks[index] = rank
+        ranks = self.get_ranks("image2text")
 
         return len(np.where(ranks < k)[0]) / len(ranks)
 
@@ -109,16 +109,436 @@ class Evaluator:
             The recall at K.
 
         """
-        num_captions = self.embedded_captions.shape[0]
-        ranks = np.zeros(num_captions)
-        for index in range(num_captions):
-            # Get query captions
-            query_captions = self.embedded_captions[5 * index : 5 * index + 5]
-            # Similarities
-            similarities = np.dot(query_captions, self.embedded_images[0::5].T)
-            inds = np.zeros(similarities.shape)
-            for i in range(len(inds)):
-                inds[i] = np.argsort(similarities[i])[::-1]
-                ranks[5 * index + i] = np.where(inds[i] == index)[0][0]
+        ranks = self.get_ranks("text2image")
 
         return len(np.where(ranks < k)[0]) / len(ranks)
+
+    def get_ranks(self, direction: str) -> np.ndarray:
+        """Returns the ranks of every query, computed once per embeddings update.
+
+        Args:
+            direction: Either image2text or text2image.
+
+        Returns:
+            The ranks.
+
+        """
+        if direction not in self.cached_ranks:
+            if direction == "image2text":
+                rank_function = self.image2text_ranks
+            elif direction == "text2image":
+                rank_function = self.text2image_ranks
+            else:
+                raise ValueError("Wrong direction!")
+            self.cached_ranks[direction] = rank_function(
+                self.embedded_images, self.embedded_captions, self.image_offsets
+            )
+
+        return self.cached_ranks[direction]
+
+    def save_ranks(self, ranks_path: str) -> None:
+        with open(ranks_path, "wb") as file:
+            np.savez(
+                file,
+                image2text=self.get_ranks("image2text"),
+                text2image=self.get_ranks("text2image"),
+            )
+
+    @staticmethod
+    def load_ranks(ranks_path: str) -> Dict[str, np.ndarray]:
+        with np.load(ranks_path) as ranks_file:
+            return {direction: ranks_file[direction] for direction in ranks_file.files}
+
+    @staticmethod
+    def bootstrap_recall_at_k(
+        ranks: np.ndarray,
+        k: int,
+        num_resamples: int,
+        confidence: float,
+        seed: int = 42,
+    ) -> Tuple[float, float, float]:
+        """Computes a percentile bootstrap confidence interval of the recall at K by
+        resampling the queries. Since the recall only depends on how many resampled
+        queries are hits, resampling N queries with replacement is drawing the number
+        of hits from a binomial distribution, so every resample costs O(1).
+
+        Args:
+            ranks: The rank of every query.
+            k: Recall at K (this is K).
+            num_resamples: The number of bootstrap resamples.
+            confidence: The confidence level of the interval, e.g. 0.95.
+            seed: The random seed.
+
+        Returns:
+            The recall at K and the bounds of its confidence interval.
+
+        """
+        num_queries = len(ranks)
+        recall = len(np.where(ranks < k)[0]) / num_queries
+        random_state = np.random.RandomState(seed)
+        recalls = random_state.binomial(num_queries, recall, num_resamples)
+        recalls = recalls / num_queries
+        alpha = (1 - confidence) / 2
+        low, high = np.quantile(recalls, [alpha, 1 - alpha])
+
+        return recall, float(low), float(high)
+
+    @staticmethod
+    def paired_bootstrap_test(
+        ranks_a: np.ndarray,
+        ranks_b: np.ndarray,
+        k: int,
+        num_resamples: int,
+        confidence: float,
+        seed: int = 42,
+    ) -> Tuple[float, float, float, float]:
+        """Compares the recall at K of two models on the same queries by resampling
+        the queries jointly. A resample only depends on how many queries fall in each
+        cell of the 2x2 table of hits of the two models, which is drawn from a
+        multinomial distribution.
+
+        Args:
+            ranks_a: The rank of every query with the first model.
+            ranks_b: The rank of every query with the second model.
+            k: Recall at K (this is K).
+            num_resamples: The number of bootstrap resamples.
+            confidence: The confidence level of the interval, e.g. 0.95.
+            seed: The random seed.
+
+        Returns:
+            The difference of the recalls (second minus first), the bounds of its
+            confidence interval and the two-sided p-value of no difference.
+
+        """
+        assert len(ranks_a) == len(ranks_b)
+        num_queries = len(ranks_a)
+        hits_a, hits_b = ranks_a < k, ranks_b < k
+        # Only the queries that one model hits and the other misses matter
+        cells = np.array(
+            [
+                np.sum(~hits_a & hits_b),
+                np.sum(hits_a & ~hits_b),
+                np.sum(hits_a == hits_b),
+            ]
+        )
+        difference = (cells[0] - cells[1]) / num_queries
+        random_state = np.random.RandomState(seed)
+        counts = random_state.multinomial(
+            num_queries, cells / num_queries, num_resamples
+        )
+        differences = (counts[:, 0] - counts[:, 1]) / num_queries
+        alpha = (1 - confidence) / 2
+        low, high = np.quantile(differences, [alpha, 1 - alpha])
+        p_value = min(
+            1.0,
+            2 * min(np.mean(differences <= 0), np.mean(differences >= 0)),
+        )
+
+        return float(difference), float(low), float(high), float(p_value)
+
+    @staticmethod
+    def ranks(
+        queries: np.ndarray,
+        gallery: np.ndarray,
+        query_groups: np.ndarray,
+        gallery_groups: np.ndarray,
+        block_size: int = 1024,
+    ) -> np.ndarray:
+        """Ranks the whole gallery for each query. The rank of a query is the position
+        of the first gallery item that belongs to the same group as the query, i.e.
+        the number of gallery items that score higher than the best item of the group.
+
+        Args:
+            queries: The embeddings of the queries.
+            gallery: The embeddings of the gallery.
+            query_groups: The group of each query.
+            gallery_groups: The group of each gallery item.
+            block_size: How many queries to process at once, which bounds the memory
+            to block_size by the size of the gallery.
+
+        Returns:
+            The ranks.
+
+        """
+        ranks = np.zeros(queries.shape[0], dtype=np.int64)
+        for begin in range(0, queries.shape[0], block_size):
+            end = begin + block_size
+            similarities = np.dot(queries[begin:end], gallery.T)
+            matches = gallery_groups[np.newaxis, :] == query_groups[begin:end, None]
+            best = np.where(matches, similarities, -np.inf).max(axis=1)
+            ranks[begin:end] = (similarities > best[:, np.newaxis]).sum(axis=1)
+
+        return ranks
+
+    @staticmethod
+    def get_offsets_and_groups(
+        image_offsets: np.ndarray, num_rows: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the image offsets, 5 rows per image if they are None, and the image
+        of every row.
+
+        Args:
+            image_offsets: Where the rows of every image begin.
+            num_rows: The number of rows.
+
+        Returns:
+            The image offsets and the groups.
+
+        """
+        if image_offsets is None:
+            image_offsets = np.arange(0, num_rows + 1, 5)
+        groups = np.repeat(np.arange(len(image_offsets) - 1), np.diff(image_offsets))
+
+        return image_offsets, groups
+
+    @staticmethod
+    def image2text_ranks(
+        embedded_images: np.ndarray,
+        embedded_captions: np.ndarray,
+        image_offsets: np.ndarray = None,
+    ) -> np.ndarray:
+        """Ranks the captions for each image, where every image is repeated once per
+        each of its captions.
+
+        Args:
+            embedded_images: The embedded images.
+            embedded_captions: The embedded captions.
+            image_offsets: Where the rows of every image begin, 5 rows per image if
+            None.
+
+        Returns:
+            The rank of the first matching caption of every image.
+
+        """
+        image_offsets, groups = Evaluator.get_offsets_and_groups(
+            image_offsets, embedded_captions.shape[0]
+        )
+        return Evaluator.ranks(
+            embedded_images[image_offsets[:-1]],
+            embedded_captions,
+            np.arange(len(image_offsets) - 1),
+            groups,
+        )
+
+    @staticmethod
+    def text2image_ranks(
+        embedded_images: np.ndarray,
+        embedded_captions: np.ndarray,
+        image_offsets: np.ndarray = None,
+    ) -> np.ndarray:
+        """Ranks the images for each caption, where every image is repeated once per
+        each of its captions.
+
+        Args:
+            embedded_images: The embedded images.
+            embedded_captions: The embedded captions.
+            image_offsets: Where the rows of every image begin, 5 rows per image if
+            None.
+
+        Returns:
+            The rank of the matching image of every caption.
+
+        """
+        image_offsets, groups = Evaluator.get_offsets_and_groups(
+            image_offsets, embedded_captions.shape[0]
+        )
+        return Evaluator.ranks(
+            embedded_captions,
+            embedded_images[image_offsets[:-1]],
+            groups,
+            np.arange(len(image_offsets) - 1),
+        )
+
+    def folds_recall_at_k(
+        self, ks: List[int], fold_size: int
+    ) -> Dict[str, Dict[int, List[float]]]:
+        """Computes the recalls at K on folds of consecutive images, e.g. the five 1K
+        folds of the COCO 5K test set, from the embeddings of a single pass over the
+        whole set. The ranks are computed once per fold.
+
+        Args:
+            ks: The K values of the recall at K.
+            fold_size: The number of images in a fold.
+
+        Returns:
+            For image2text and text2image, the recall at every K on every fold.
+
+        """
+        image_offsets, _ = self.get_offsets_and_groups(
+            self.image_offsets, self.embedded_captions.shape[0]
+        )
+        recalls: Dict[str, Dict[int, List[float]]] = {
+            "image2text": {k: [] for k in ks},
+            "text2image": {k: [] for k in ks},
+        }
+        for first_image in range(0, len(image_offsets) - 1, fold_size):
+            fold_offsets = image_offsets[first_image : first_image + fold_size + 1]
+            begin, end = fold_offsets[0], fold_offsets[-1]
+            embedded_images = self.embedded_images[begin:end]
+            embedded_captions = self.embedded_captions[begin:end]
+            fold_ranks = {
+                "image2text": self.image2text_ranks(
+                    embedded_images, embedded_captions, fold_offsets - begin
+                ),
+                "text2image": self.text2image_ranks(
+                    embedded_images, embedded_captions, fold_offsets - begin
+                ),
+            }
+            for direction, ranks in fold_ranks.items():
+                for k in ks:
+                    recalls[direction][k].append(
+                        len(np.where(ranks < k)[0]) / len(ranks)
+                    )
+
+        return recalls
+
+    @staticmethod
+    def pool_hops(embeddings: np.ndarray, attn_hops: int) -> np.ndarray:
+        """Averages the attention hops of the embeddings into compact embeddings, the
+        same way as MultiHopAttentionModel.hop_pooling_graph.
+
+        Args:
+            embeddings: The embeddings with shape [N, attn_hops * H].
+            attn_hops: The number of attention hops.
+
+        Returns:
+            The L2 normalized compact embeddings with shape [N, H].
+
+        """
+        pooled = embeddings.reshape(embeddings.shape[0], attn_hops, -1).mean(axis=1)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+
+        return pooled / np.maximum(norms, 1e-12)
+
+    @staticmethod
+    def two_stage_ranks(
+        queries: np.ndarray,
+        gallery: np.ndarray,
+        query_groups: np.ndarray,
+        gallery_groups: np.ndarray,
+        attn_hops: int,
+        num_candidates: int,
+        block_size: int = 64,
+    ) -> Tuple[np.ndarray, float]:
+        """Ranks the gallery for each query in two stages:
+
+        1. The top num_candidates gallery items are retrieved with the compact
+        embeddings.
+        2. The candidates are re-ranked with the full embeddings.
+
+        The rank of a query is the position of the first gallery item that belongs to
+        the same group as the query, or sys.maxsize if no such item is a candidate.
+
+        Args:
+            queries: The full embeddings of the queries.
+            gallery: The full embeddings of the gallery.
+            query_groups: The group of each query.
+            gallery_groups: The group of each gallery item.
+            attn_hops: The number of attention hops.
+            num_candidates: How many candidates to re-rank.
+            block_size: How many queries to process at once.
+
+        Returns:
+            The ranks and the time in milliseconds spent per query.
+
+        """
+        num_candidates = min(num_candidates, gallery.shape[0])
+        compact_queries = Evaluator.pool_hops(queries, attn_hops)
+        compact_gallery = Evaluator.pool_hops(gallery, attn_hops)
+        ranks = np.full(queries.shape[0], sys.maxsize, dtype=np.int64)
+        start = time.perf_counter()
+        for begin in range(0, queries.shape[0], block_size):
+            end = begin + block_size
+            # First stage: [B, G] compact similarities
+            similarities = np.dot(compact_queries[begin:end], compact_gallery.T)
+            candidates = np.argpartition(-similarities, num_candidates - 1, axis=1)[
+                :, :num_candidates
+            ]
+            # Second stage: [B, N] full similarities of the candidates only
+            similarities = np.einsum(
+                "bd,bnd->bn", queries[begin:end], gallery[candidates]
+            )
+            order = np.argsort(-similarities, axis=1)
+            ranked = np.take_along_axis(candidates, order, axis=1)
+            hits = gallery_groups[ranked] == query_groups[begin:end, np.newaxis]
+            found = hits.any(axis=1)
+            ranks[begin:end][found] = hits.argmax(axis=1)[found]
+        elapsed = (time.perf_counter() - start) * 1000 / queries.shape[0]
+
+        return ranks, elapsed
+
+    def image2text_two_stage_recall_at_k(
+        self, k: int, num_candidates: int, attn_hops: int
+    ) -> Tuple[float, float]:
+        """Computes the recall at K when doing two-stage image to text retrieval.
+
+        Args:
+            k: Recall at K (this is K).
+            num_candidates: How many candidates to re-rank.
+            attn_hops: The number of attention hops.
+
+        Returns:
+            The recall at K and the time in milliseconds spent per query.
+
+        """
+        image_offsets, groups = self.get_offsets_and_groups(
+            self.image_offsets, self.embedded_captions.shape[0]
+        )
+        ranks, elapsed = self.two_stage_ranks(
+            self.embedded_images[image_offsets[:-1]],
+            self.embedded_captions,
+            np.arange(len(image_offsets) - 1),
+            groups,
+            attn_hops,
+            num_candidates,
+        )
+
+        return len(np.where(ranks < k)[0]) / len(ranks), elapsed
+
+    def text2image_two_stage_recall_at_k(
+        self, k: int, num_candidates: int, attn_hops: int
+    ) -> Tuple[float, float]:
+        """Computes the recall at K when doing two-stage text to image retrieval.
+
+        Args:
+            k: Recall at K (this is K).
+            num_candidates: How many candidates to re-rank.
+            attn_hops: The number of attention hops.
+
+        Returns:
+            The recall at K and the time in milliseconds spent per query.
+
+        """
+        image_offsets, groups = self.get_offsets_and_groups(
+            self.image_offsets, self.embedded_captions.shape[0]
+        )
+        ranks, elapsed = self.two_stage_ranks(
+            self.embedded_captions,
+            self.embedded_images[image_offsets[:-1]],
+            groups,
+            np.arange(len(image_offsets) - 1),
+            attn_hops,
+            num_candidates,
+        )
+
+        return len(np.where(ranks < k)[0]) / len(ranks), elapsed
+
+    @staticmethod
+    def recall_at_k_from_retrieved(
+        retrieved_groups: np.ndarray, query_groups: np.ndarray, k: int
+    ) -> float:
+        """Computes the recall at K of results retrieved by an index.
+
+        Args:
+            retrieved_groups: The group of each retrieved item with shape [Q, N],
+            sorted by decreasing score.
+            query_groups: The group of each query.
+            k: Recall at K (this is K).
+
+        Returns:
+            The recall at K.
+
+        """
+        hits = retrieved_groups[:, :k] == query_groups[:, np.newaxis]
+
+        return len(np.where(hits.any(axis=1))[0]) / len(query_groups)
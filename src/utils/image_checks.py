@@ -0,0 +1,101 @@
+import io
+import logging
+import multiprocessing
+from typing import Dict, List, Tuple
+
+from PIL import Image
+
+from utils.archives import get_archive_paths, open_archives, read_image
+from utils.constants import jpeg_magic
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def check_image(image_path: str, min_size: int = 0) -> str:
+    """Checks that an image can be read by the loaders: it exists, it is a JPEG as
+    tf.image.decode_jpeg expects and it decodes. Optionally, both of its sides must
+    be at least min_size long, which the loaders do not need because they resize
+    the smallest side of every image to SMALLEST_SIDE before cropping it.
+
+    Args:
+        image_path: The image, also inside an archive, see read_image.
+        min_size: The minimum length of both sides, 0 to not check it.
+
+    Returns:
+        Why the image is broken, or an empty string if it is fine.
+
+    """
+    try:
+        image_bytes = read_image(image_path)
+    except OSError:
+        return "missing"
+    if not image_bytes.startswith(jpeg_magic):
+        return "not a jpeg"
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            width, height = image.size
+            # Decoding at the smallest scale still reads all the entropy coded data
+            image.draft("RGB", (1, 1))
+            image.load()
+    except Exception as exception:
+        return f"not decodable: {exception}"
+    if min_size > 0 and min(width, height) < min_size:
+        return f"too small: {width}x{height}"
+
+    return ""
+
+
+def check_image_task(task: Tuple[str, int]) -> Tuple[str, str]:
+    image_path, min_size = task
+
+    return image_path, check_image(image_path, min_size)
+
+
+def check_images(
+    image_paths: List[str],
+    min_size: int,
+    num_workers: int,
+    chunk_size: int = 64,
+    index_dir: str = None,
+) -> Dict[str, str]:
+    """Checks images in a pool of worker processes, see check_image.
+
+    Args:
+        image_paths: The images.
+        min_size: The minimum length of both sides, 0 to not check it.
+        num_workers: The number of worker processes.
+        chunk_size: How many images a worker checks per task.
+        index_dir: Where the indexes of the archives are kept, see get_index_path.
+
+    Returns:
+        Why every broken image is broken.
+
+    """
+    problems = {}
+    # Indexed once here, so that the workers only load the indexes
+    archive_paths = get_archive_paths(image_paths)
+    open_archives(archive_paths, index_dir)
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(
+        num_workers, initializer=open_archives, initargs=(archive_paths, index_dir)
+    ) as pool:
+        results = pool.imap_unordered(
+            check_image_task,
+            [(image_path, min_size) for image_path in image_paths],
+            chunksize=chunk_size,
+        )
+        for num_done, (image_path, problem) in enumerate(results, 1):
+            if problem:
+                problems[image_path] = problem
+            if num_done % 10000 == 0:
+                logger.info(f"{num_done}/{len(image_paths)} images checked...")
+
+    return problems
+
+
+def write_quarantine(quarantine_path: str, problems: Dict[str, str]) -> None:
+    # One broken image per line, with why it is broken after a tab
+    with open(quarantine_path, "w") as file:
+        for image_path in sorted(problems.keys()):
+            file.write(f"{image_path}\t{problems[image_path]}\n")
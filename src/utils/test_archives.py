@@ -0,0 +1,118 @@
+import os
+import tarfile
+import zipfile
+import pytest
+from utils.archives import (
+    ArchiveIndex,
+    get_archive_paths,
+    get_index_path,
+    read_image,
+    read_image_bytes,
+    resolve_images_path,
+    split_member_path,
+)
+from utils.datasets import FlickrDataset
+
+
+def fail(_):
+    raise AssertionError("The archive should not be indexed again!")
+
+
+@pytest.fixture
+def images_path():
+    return "data/testing_assets/flickr_images"
+
+
+@pytest.fixture
+def image_names(images_path):
+    return sorted(os.listdir(images_path))
+
+
+@pytest.fixture(params=["tar", "zip_stored", "zip_deflated"])
+def archive_path(request, images_path, image_names, tmp_path):
+    if request.param == "tar":
+        archive_path = str(tmp_path / "images.tar")
+        with tarfile.open(archive_path, "w") as archive:
+            archive.add(images_path, arcname="./flickr_images")
+    else:
+        archive_path = str(tmp_path / "images.zip")
+        compression = (
+            zipfile.ZIP_STORED
+            if request.param == "zip_stored"
+            else zipfile.ZIP_DEFLATED
+        )
+        with zipfile.ZipFile(archive_path, "w", compression) as archive:
+            for image_name in image_names:
+                archive.write(
+                    os.path.join(images_path, image_name),
+                    "flickr_images/" + image_name,
+                )
+
+    return archive_path
+
+
+def test_split_member_path():
+    assert split_member_path("a.tar::./images/1.jpg") == ("a.tar", "images/1.jpg")
+    assert split_member_path("a.tar::/1.jpg") == ("a.tar", "1.jpg")
+
+
+def test_archive_index(archive_path, images_path, image_names, monkeypatch):
+    index = ArchiveIndex(archive_path)
+    assert sorted(index.names) == ["flickr_images/" + name for name in image_names]
+    assert os.path.isfile(archive_path + ".index.npz")
+    for image_name in image_names:
+        with open(os.path.join(images_path, image_name), "rb") as file:
+            assert index.read("flickr_images/" + image_name) == file.read()
+    with pytest.raises(FileNotFoundError):
+        index.read("flickr_images/missing.jpg")
+    # The second time the index is loaded instead of built
+    monkeypatch.setattr(ArchiveIndex, "build", fail)
+    assert ArchiveIndex(archive_path).names == index.names
+
+
+def test_read_only_storage(archive_path, images_path, image_names, tmp_path):
+    # The index cannot be written in a missing directory, like on read-only storage
+    index_path = str(tmp_path / "missing" / "images.index.npz")
+    index = ArchiveIndex(archive_path, index_path)
+    assert not os.path.exists(index_path)
+    with open(os.path.join(images_path, image_names[0]), "rb") as file:
+        assert index.read("flickr_images/" + image_names[0]) == file.read()
+    index.close()
+    assert index.file_descriptor is None
+
+
+def test_index_dir(archive_path, image_names, tmp_path, monkeypatch):
+    index_dir = str(tmp_path / "indexes")
+    index_path = get_index_path(archive_path, index_dir)
+    assert os.path.dirname(index_path) == index_dir
+    # An archive with the same name in another directory has another index
+    other_path = str(tmp_path / "other" / os.path.basename(archive_path))
+    assert get_index_path(other_path, index_dir) != index_path
+    index = ArchiveIndex(archive_path, index_path)
+    assert os.path.isfile(index_path)
+    # Another process loads the index from the index directory
+    monkeypatch.setattr(ArchiveIndex, "build", fail)
+    assert ArchiveIndex(archive_path, index_path).names == index.names
+    member_path = archive_path + "::flickr_images/" + image_names[0]
+    assert get_archive_paths([member_path, "images/1.jpg"]) == [archive_path]
+
+
+def test_read_image(archive_path, images_path, image_names):
+    image_path = os.path.join(images_path, image_names[0])
+    member_path = os.path.join(
+        resolve_images_path(archive_path + "::flickr_images"), image_names[0]
+    )
+    assert read_image(member_path) == read_image(image_path)
+    assert read_image_bytes(member_path.encode()) == read_image(image_path)
+    assert resolve_images_path(images_path) == images_path
+
+
+def test_flickr_dataset_in_archive(archive_path, images_path):
+    texts_path = "data/testing_assets/flickr_tokens.txt"
+    train_path = "data/testing_assets/flickr_train.txt"
+    image_paths, captions = FlickrDataset(images_path, texts_path).get_data(train_path)
+    archive_dataset = FlickrDataset(archive_path + "::flickr_images", texts_path)
+    archive_paths, archive_captions = archive_dataset.get_data(train_path)
+    assert archive_captions == captions
+    for image_path, archive_image_path in zip(image_paths, archive_paths):
+        assert read_image(archive_image_path) == read_image(image_path)
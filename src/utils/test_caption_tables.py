@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+from utils.caption_tables import CaptionTable
+from utils.datasets import (
+    FlickrDataset,
+    PascalSentencesDataset,
+    TrainCocoDataset,
+    ValCocoDataset,
+    get_image_offsets,
+)
+
+
+@pytest.fixture
+def flickr_images_path():
+    return "data/testing_assets/flickr_images/"
+
+
+@pytest.fixture
+def flickr_texts_path():
+    return "data/testing_assets/flickr_tokens.txt"
+
+
+@pytest.fixture
+def flickr_train_path():
+    return "data/testing_assets/flickr_train.txt"
+
+
+@pytest.fixture
+def pascal_images_path():
+    return "data/testing_assets/pascal_images_texts/images"
+
+
+@pytest.fixture
+def pascal_texts_path():
+    return "data/testing_assets/pascal_images_texts/texts"
+
+
+@pytest.fixture
+def coco_images_path():
+    return "images/"
+
+
+@pytest.fixture
+def coco_json_path():
+    return "data/testing_assets/coco_json_file_test.json"
+
+
+@pytest.fixture
+def image_paths():
+    return ["a.jpg", "a.jpg", "b.jpg", "c.jpg", "c.jpg", "c.jpg"]
+
+
+@pytest.fixture
+def captions():
+    return ["first", "second", "café au lait", "", "fifth", "sixth"]
+
+
+def test_caption_table_from_lists(image_paths, captions):
+    table = CaptionTable.from_lists(image_paths, captions)
+    assert table.image_paths == ["a.jpg", "b.jpg", "c.jpg"]
+    assert table.image_indices.dtype == np.int32
+    assert len(table) == 6
+    assert table.to_lists() == (image_paths, captions)
+    assert table.get_image_paths() == image_paths
+    assert table.get_captions() == captions
+    assert table.get_caption(2) == captions[2]
+    np.testing.assert_equal(table.get_image_offsets(), get_image_offsets(image_paths))
+
+
+def test_caption_table_from_groups(image_paths, captions):
+    table = CaptionTable.from_groups(
+        ["a.jpg", "b.jpg", "c.jpg"], [captions[:2], captions[2:3], captions[3:]]
+    )
+    assert table.to_lists() == (image_paths, captions)
+    assert CaptionTable.from_groups([], []).to_lists() == ([], [])
+    np.testing.assert_equal(CaptionTable.from_groups([], []).get_image_offsets(), [0])
+
+
+def test_caption_table_take(image_paths, captions):
+    table = CaptionTable.from_lists(image_paths, captions)
+    permutation = np.random.RandomState(42).permutation(len(table))
+    shuffled = table.take(permutation)
+    assert shuffled.caption_buffer is table.caption_buffer
+    assert list(shuffled.get_image_paths()) == [image_paths[i] for i in permutation]
+    assert list(shuffled.get_captions()) == [captions[i] for i in permutation]
+    assert table.get_captions()[1:4] == captions[1:4]
+    assert table.get_image_paths()[::2] == image_paths[::2]
+
+
+def test_dataset_tables(
+    flickr_images_path,
+    flickr_texts_path,
+    flickr_train_path,
+    pascal_images_path,
+    pascal_texts_path,
+    coco_images_path,
+    coco_json_path,
+):
+    dataset = FlickrDataset(flickr_images_path, flickr_texts_path)
+    table = dataset.get_table(flickr_train_path)
+    assert table.to_lists() == dataset.get_data(flickr_train_path)
+    assert table.get_nbytes() < sum(
+        len(path) + len(caption)
+        for path, caption in zip(*dataset.get_data(flickr_train_path))
+    )
+    dataset = PascalSentencesDataset(pascal_images_path, pascal_texts_path)
+    for data_type in ["train", "val", "test"]:
+        assert dataset.get_table(data_type).to_lists() == (
+            dataset.get_data_from_indices(dataset.split_indices[data_type])
+        )
+    dataset = TrainCocoDataset(coco_images_path, coco_json_path)
+    assert dataset.get_table().to_lists() == dataset.get_data()
+    dataset = ValCocoDataset(coco_images_path, coco_json_path, 2)
+    assert dataset.get_table().to_lists() == dataset.get_data()
@@ -0,0 +1,68 @@
+import os
+import shutil
+import pytest
+from utils.datasets import FlickrDataset
+from utils.dataset_caches import FlickrCache
+
+
+@pytest.fixture
+def flickr_texts_path(tmp_path):
+    texts_path = str(tmp_path / "flickr_tokens.txt")
+    shutil.copy("data/testing_assets/flickr_tokens.txt", texts_path)
+
+    return texts_path
+
+
+@pytest.fixture
+def flickr_train_path(tmp_path):
+    train_path = str(tmp_path / "flickr_train.txt")
+    shutil.copy("data/testing_assets/flickr_train.txt", train_path)
+
+    return train_path
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "flickr_cache.npz")
+
+
+def fail(_):
+    raise AssertionError("The file should not be parsed again!")
+
+
+def test_flickr_cache_matches_parsing(flickr_texts_path, flickr_train_path, cache_path):
+    dataset = FlickrDataset("images", flickr_texts_path)
+    cached_dataset = FlickrDataset("images", flickr_texts_path, cache_path)
+    assert os.path.isfile(cache_path)
+    assert cached_dataset.img_path_caption == dataset.img_path_caption
+    assert cached_dataset.get_data(flickr_train_path) == dataset.get_data(
+        flickr_train_path
+    )
+    # The second time both the captions and the split come from the cache
+    cache = FlickrCache(cache_path, flickr_texts_path)
+    assert cache.get_captions(fail) == dataset.img_path_caption
+    image_names = cache.get_split(flickr_train_path, fail)
+    assert image_names == FlickrDataset.read_image_names(flickr_train_path)
+
+
+def test_flickr_cache_invalidation(flickr_texts_path, flickr_train_path, cache_path):
+    FlickrDataset("images", flickr_texts_path, cache_path).get_data(flickr_train_path)
+    # Touching the files without changing them keeps the cache
+    stat = os.stat(flickr_texts_path)
+    os.utime(flickr_texts_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    os.utime(flickr_train_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    cache = FlickrCache(cache_path, flickr_texts_path)
+    cache.get_captions(fail)
+    cache.get_split(flickr_train_path, fail)
+    # Changing the content with the same size does not
+    with open(flickr_texts_path) as file:
+        text = file.read()
+    with open(flickr_texts_path, "w") as file:
+        file.write(text.replace("dog", "cat"))
+    os.utime(flickr_texts_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2 * 10**9))
+    with pytest.raises(AssertionError):
+        FlickrCache(cache_path, flickr_texts_path).get_captions(fail)
+    dataset = FlickrDataset("images", flickr_texts_path, cache_path)
+    assert dataset.img_path_caption == FlickrDataset.parse_captions_filenames(
+        flickr_texts_path
+    )
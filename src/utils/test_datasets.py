@@ -1,10 +1,17 @@
+import os
 import pytest
 from utils.datasets import (
     BaseCocoDataset,
     TrainCocoDataset,
+    ValCocoDataset,
     preprocess_caption,
+    preprocess_captions,
     FlickrDataset,
     PascalSentencesDataset,
+    get_image_offsets,
+    read_image_ids,
+    read_quarantine,
+    stream_json_arrays,
 )
 
 
@@ -187,3 +194,275 @@ def test_pascal_parse_captions_filenames(pascal_images_path, pascal_texts_path):
     assert count_cat == 3
     assert count_files == 9
     assert count_sentences == 45
+
+
+def test_pascal_get_categories(pascal_images_path, pascal_texts_path):
+    dataset = PascalSentencesDataset(pascal_images_path, pascal_texts_path)
+    image_paths, _ = dataset.get_train_data()
+    categories = dataset.get_categories_from_indices(dataset.split_indices["train"])
+    assert len(categories) == len(image_paths) == 45
+    for image_path, category in zip(image_paths, categories):
+        assert os.path.basename(os.path.dirname(image_path)) == category
+
+
+def test_coco_val_size(coco_images_path, coco_json_path):
+    image_paths, captions = ValCocoDataset(
+        coco_images_path, coco_json_path, 2
+    ).get_data()
+    assert len(set(image_paths)) == 2
+    assert len(captions) == 10
+
+
+def test_coco_val_image_ids(coco_images_path, coco_json_path, tmp_path):
+    dataset = ValCocoDataset(coco_images_path, coco_json_path)
+    pair_ids = dataset.get_captioned_ids()
+    # The range after the offset does not overlap the first images
+    assert ValCocoDataset(
+        coco_images_path, coco_json_path, 1, offset=1
+    ).get_pair_ids() == [pair_ids[1]]
+    ids_path = str(tmp_path / "ids.txt")
+    with open(ids_path, "w") as file:
+        file.write(f"{pair_ids[2]}\n{pair_ids[0]}\n123456789\n")
+    assert read_image_ids(ids_path) == [pair_ids[2], pair_ids[0], 123456789]
+    assert ValCocoDataset(
+        coco_images_path, coco_json_path, image_ids_path=ids_path
+    ).get_pair_ids() == [pair_ids[2], pair_ids[0]]
+
+
+def test_get_image_offsets():
+    image_paths = ["a.jpg"] * 5 + ["b.jpg"] * 7 + ["c.jpg"] * 6
+    assert get_image_offsets(image_paths).tolist() == [0, 5, 12, 18]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1 << 20])
+def test_stream_json_arrays(coco_json_path, chunk_size):
+    json_file = BaseCocoDataset.read_json(coco_json_path)
+    streamed = list(
+        stream_json_arrays(coco_json_path, ["images", "annotations"], chunk_size)
+    )
+    assert [data for key, data in streamed if key == "images"] == json_file["images"]
+    assert [data for key, data in streamed if key == "annotations"] == json_file[
+        "annotations"
+    ]
+
+
+def test_stream_json_arrays_values(tmp_path):
+    json_path = str(tmp_path / "test.json")
+    with open(json_path, "w") as file:
+        file.write('{"a": 12345, "b": [], "c" : [1, 22, {"d": [3]}] ,"b2": [4]}')
+    for chunk_size in [1, 2, 3, 100]:
+        streamed = list(stream_json_arrays(json_path, ["b", "c"], chunk_size))
+        assert streamed == [("c", 1), ("c", 22), ("c", {"d": [3]})]
+    with open(json_path, "w") as file:
+        file.write('{"b": [1, 2}')
+    with pytest.raises(ValueError):
+        list(stream_json_arrays(json_path, ["b"], 3))
+
+
+def test_coco_parse_json_stream(coco_json_path, coco_images_path):
+    json_file = BaseCocoDataset.read_json(coco_json_path)
+    id_to_filename, id_to_captions = BaseCocoDataset.parse_json_stream(
+        coco_json_path, coco_images_path
+    )
+    assert id_to_filename == BaseCocoDataset.parse_image_paths(
+        json_file, coco_images_path
+    )
+    assert id_to_captions == BaseCocoDataset.parse_captions(json_file)
+    assert list(id_to_captions.keys()) == list(
+        BaseCocoDataset.parse_captions(json_file).keys()
+    )
+
+
+@pytest.fixture
+def tricky_captions():
+    return [
+        "A man riding a wave on top of a surfboard.",
+        "  Two\tdogs\n play   in the SNOW!!  ",
+        "",
+        "   ",
+        "Café ΣΟΦΟΣ İstanbul \u212a\u00df straße",
+        "child's kite (blue) 3 4",
+        "null\x00separator",
+        "ΌΣ.",
+        "'' ' a '",
+    ]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 4, 100])
+def test_preprocess_captions(tricky_captions, chunk_size):
+    expected = [preprocess_caption(caption) for caption in tricky_captions]
+    assert preprocess_captions(tricky_captions, 1, chunk_size) == expected
+    # Without the caption holding the separator
+    assert preprocess_captions(tricky_captions[:6], 1, chunk_size) == expected[:6]
+
+
+def test_preprocess_captions_workers(tricky_captions):
+    captions = tricky_captions * 10
+    assert preprocess_captions(captions, 2, 7) == [
+        preprocess_caption(caption) for caption in captions
+    ]
+    assert preprocess_captions([], 2) == []
+
+
+def test_pascal_split_indices(pascal_images_path, pascal_texts_path):
+    dataset = PascalSentencesDataset(pascal_images_path, pascal_texts_path)
+    data_getters = {
+        "train": dataset.get_train_data,
+        "val": dataset.get_val_data,
+        "test": dataset.get_test_data,
+    }
+    for data_type, get_data in data_getters.items():
+        split_indices = dataset.split_indices[data_type]
+        # Every image of the split is in it by its index within its category
+        for image_index in split_indices:
+            assert PascalSentencesDataset.in_split(
+                dataset.category_indices[image_index], data_type
+            )
+        image_paths, captions = get_data()
+        assert image_paths == [
+            dataset.image_paths[image_index]
+            for image_index in split_indices
+            for _ in dataset.image_captions[image_index]
+        ]
+        assert len(captions) == len(image_paths)
+        categories = dataset.get_categories_from_indices(split_indices)
+        assert categories == [
+            os.path.basename(os.path.dirname(image_path)) for image_path in image_paths
+        ]
+    # Every image is in exactly one split
+    assert sorted(
+        image_index
+        for split_indices in dataset.split_indices.values()
+        for image_index in split_indices
+    ) == list(range(9))
+
+
+def test_pascal_fold_indices(pascal_images_path, pascal_texts_path):
+    dataset = PascalSentencesDataset(pascal_images_path, pascal_texts_path)
+    held_out = []
+    for fold in range(3):
+        train_indices, fold_indices = dataset.get_fold_indices(3, fold)
+        assert len(set(train_indices) & set(fold_indices)) == 0
+        assert len(train_indices) + len(fold_indices) == 9
+        # Every category has 3 images, one per fold
+        assert sorted(dataset.image_categories[i] for i in fold_indices) == sorted(
+            dataset.category_image_path_captions.keys()
+        )
+        held_out.extend(fold_indices)
+    assert sorted(held_out) == list(range(9))
+    (train_paths, _), (fold_paths, _) = dataset.get_fold_data(3, 0)
+    assert len(set(train_paths) & set(fold_paths)) == 0
+    with pytest.raises(ValueError):
+        dataset.get_fold_indices(3, 3)
+
+
+def test_pascal_pack_texts(pascal_images_path, pascal_texts_path, tmp_path):
+    packed_path = str(tmp_path / "texts.json")
+    PascalSentencesDataset.pack_texts(pascal_texts_path, packed_path, 4)
+    category_image_path_captions = PascalSentencesDataset.parse_captions_filenames(
+        pascal_texts_path, pascal_images_path, 1
+    )
+    assert (
+        PascalSentencesDataset.parse_captions_filenames(packed_path, pascal_images_path)
+        == category_image_path_captions
+    )
+    dataset = PascalSentencesDataset(pascal_images_path, packed_path)
+    assert list(dataset.category_image_path_captions.keys()) == list(
+        category_image_path_captions.keys()
+    )
+
+
+def test_quarantine(
+    coco_images_path,
+    coco_json_path,
+    flickr_images_path,
+    flickr_texts_path,
+    flickr_train_path,
+    pascal_images_path,
+    pascal_texts_path,
+    tmp_path,
+):
+    assert read_quarantine(None) == set()
+    pascal = PascalSentencesDataset(pascal_images_path, pascal_texts_path)
+    flickr = FlickrDataset(flickr_images_path, flickr_texts_path)
+    flickr_paths, _ = flickr.get_data(flickr_train_path)
+    coco = TrainCocoDataset(coco_images_path, coco_json_path)
+    pair_ids = coco.get_pair_ids()
+    quarantined = [
+        coco.id_to_filename[pair_ids[1]],
+        flickr_paths[0],
+        pascal.image_paths[pascal.split_indices["train"][0]],
+    ]
+    quarantine_path = str(tmp_path / "quarantine.txt")
+    with open(quarantine_path, "w") as file:
+        file.write("".join(f"{path}\tnot a jpeg\n" for path in quarantined))
+    assert read_quarantine(quarantine_path) == set(quarantined)
+
+    coco = TrainCocoDataset(coco_images_path, coco_json_path, quarantine_path)
+    assert quarantined[0] not in coco.get_data()[0]
+    assert coco.get_pair_ids() == [pair_ids[0], pair_ids[2]]
+    flickr = FlickrDataset(flickr_images_path, flickr_texts_path, None, quarantine_path)
+    assert flickr.get_data(flickr_train_path)[0] == [
+        path for path in flickr_paths if path != quarantined[1]
+    ]
+    # The other images stay in the same split and fold
+    quarantined_pascal = PascalSentencesDataset(
+        pascal_images_path, pascal_texts_path, quarantine_path
+    )
+    assert list(quarantined_pascal.split_indices["train"]) == list(
+        pascal.split_indices["train"][1:]
+    )
+    for data_type in ["val", "test"]:
+        assert list(quarantined_pascal.split_indices[data_type]) == list(
+            pascal.split_indices[data_type]
+        )
+    train_indices, fold_indices = quarantined_pascal.get_fold_indices(3, 0)
+    assert len(train_indices) + len(fold_indices) == 8
+
+
+def test_shards(
+    coco_images_path,
+    coco_json_path,
+    flickr_images_path,
+    flickr_texts_path,
+    flickr_train_path,
+    pascal_images_path,
+    pascal_texts_path,
+):
+    num_shards = 2
+    get_data_functions = [
+        lambda **shard: TrainCocoDataset(
+            coco_images_path, coco_json_path, **shard
+        ).get_data(),
+        lambda **shard: FlickrDataset(
+            flickr_images_path, flickr_texts_path, **shard
+        ).get_data(flickr_train_path),
+        lambda **shard: PascalSentencesDataset(
+            pascal_images_path, pascal_texts_path, **shard
+        ).get_train_data(),
+    ]
+    for get_data in get_data_functions:
+        image_paths, captions = get_data()
+        shards = [
+            get_data(shard_index=shard_index, num_shards=num_shards)
+            for shard_index in range(num_shards)
+        ]
+        assert get_data(shard_index=1, num_shards=num_shards) == shards[1]
+        # Every image is in exactly one shard, together with all of its captions
+        shard_images = [set(shard_paths) for shard_paths, _ in shards]
+        assert len(shard_images[0] & shard_images[1]) == 0
+        assert sorted(
+            pair
+            for shard_paths, shard_captions in shards
+            for pair in zip(shard_paths, shard_captions)
+        ) == sorted(zip(image_paths, captions))
+        assert abs(len(shard_images[0]) - len(shard_images[1])) <= 1
+    with pytest.raises(ValueError):
+        FlickrDataset(
+            flickr_images_path, flickr_texts_path, shard_index=2, num_shards=2
+        )
+    dataset = PascalSentencesDataset(
+        pascal_images_path, pascal_texts_path, shard_index=0, num_shards=3
+    )
+    train_indices, fold_indices = dataset.get_fold_indices(3, 0)
+    assert len(train_indices) + len(fold_indices) == 3
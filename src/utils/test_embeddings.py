@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from utils.embeddings import EmbeddingStore
+
+
+@pytest.fixture
+def image_paths():
+    return ["img1.jpg", "img1.jpg", "img2.jpg", "img2.jpg"]
+
+
+@pytest.fixture
+def captions():
+    return ["a dog", "a brown dog", "a cat", "a sleeping cat"]
+
+
+@pytest.fixture
+def embedded_images():
+    np.random.seed(42)
+    return np.random.rand(4, 6)
+
+
+@pytest.fixture
+def embedded_captions():
+    np.random.seed(40)
+    return np.random.rand(4, 6)
+
+
+def test_save_and_load(
+    image_paths, captions, embedded_images, embedded_captions, tmp_path
+):
+    store_dir = str(tmp_path / "store")
+    EmbeddingStore.save(
+        store_dir, image_paths, captions, embedded_images, embedded_captions
+    )
+    store = EmbeddingStore(store_dir)
+    assert store.image_paths == image_paths
+    assert store.captions == captions
+    assert store.dim == 6
+    assert store.embedded_images.dtype == np.float32
+    np.testing.assert_almost_equal(store.embedded_images, embedded_images, decimal=6)
+    np.testing.assert_almost_equal(
+        store.embedded_captions, embedded_captions, decimal=6
+    )
+
+
+def test_get_unique_images(
+    image_paths, captions, embedded_images, embedded_captions, tmp_path
+):
+    store_dir = str(tmp_path / "store")
+    EmbeddingStore.save(
+        store_dir, image_paths, captions, embedded_images, embedded_captions
+    )
+    unique_paths, first_rows, groups = EmbeddingStore(store_dir).get_unique_images()
+    assert unique_paths == ["img1.jpg", "img2.jpg"]
+    np.testing.assert_equal(first_rows, [0, 2])
+    np.testing.assert_equal(groups, [0, 0, 1, 1])
+
+
+def test_save_and_load_categories(
+    image_paths, captions, embedded_images, embedded_captions, tmp_path
+):
+    store_dir = str(tmp_path / "store")
+    EmbeddingStore.save(
+        store_dir, image_paths, captions, embedded_images, embedded_captions
+    )
+    assert EmbeddingStore(store_dir).categories is None
+    categories = ["dog", "dog", "cat", "cat"]
+    EmbeddingStore.save(
+        store_dir, image_paths, captions, embedded_images, embedded_captions, categories
+    )
+    assert EmbeddingStore(store_dir).categories == categories
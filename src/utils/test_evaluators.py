@@ -58,3 +58,145 @@ def test_embedded_update(embedded_captions, embedded_images, num_samples, num_fe
 def test_recall_at_k():
     # TODO: Good test about recall at K
     pass
+
+
+def test_pool_hops(embedded_images):
+    pooled = Evaluator.pool_hops(embedded_images, 3)
+    assert pooled.shape == (50, 2)
+    np.testing.assert_almost_equal(np.linalg.norm(pooled, axis=1), np.ones(50))
+
+
+def test_two_stage_recall_with_all_candidates_is_exact(
+    embedded_captions, embedded_images, num_samples, num_features
+):
+    evaluator = Evaluator(num_samples, num_features)
+    evaluator.update_embeddings(embedded_images, embedded_captions)
+    for k in [1, 5, 10]:
+        recall, _ = evaluator.image2text_two_stage_recall_at_k(k, num_samples, 2)
+        assert recall == evaluator.image2text_recall_at_k(k)
+        recall, _ = evaluator.text2image_two_stage_recall_at_k(k, num_samples, 2)
+        assert recall == evaluator.text2image_recall_at_k(k)
+
+
+def test_two_stage_recall_is_bounded_by_candidates(
+    embedded_captions, embedded_images, num_samples, num_features
+):
+    evaluator = Evaluator(num_samples, num_features)
+    evaluator.update_embeddings(embedded_images, embedded_captions)
+    recall_at_1, _ = evaluator.text2image_two_stage_recall_at_k(1, 1, 2)
+    recall_at_5, _ = evaluator.text2image_two_stage_recall_at_k(5, 1, 2)
+    assert recall_at_1 == recall_at_5
+
+
+def test_ranks_match_argsort(embedded_captions, embedded_images):
+    image2text_ranks = Evaluator.image2text_ranks(embedded_images, embedded_captions)
+    for index, rank in enumerate(image2text_ranks):
+        order = np.argsort(-np.dot(embedded_images[5 * index], embedded_captions.T))
+        assert rank == min(np.where(order // 5 == index)[0])
+    text2image_ranks = Evaluator.text2image_ranks(embedded_images, embedded_captions)
+    for index, rank in enumerate(text2image_ranks):
+        order = np.argsort(-np.dot(embedded_captions[index], embedded_images[0::5].T))
+        assert rank == np.where(order == index // 5)[0][0]
+
+
+def test_folds_recall_at_k(embedded_captions, embedded_images, num_samples):
+    evaluator = Evaluator(num_samples, 6)
+    evaluator.update_embeddings(embedded_images, embedded_captions)
+    recalls = evaluator.folds_recall_at_k([1, 5], 5)
+    assert len(recalls["image2text"][1]) == 2
+    fold = Evaluator(25, 6)
+    fold.update_embeddings(embedded_images[25:], embedded_captions[25:])
+    assert recalls["image2text"][5][1] == fold.image2text_recall_at_k(5)
+    assert recalls["text2image"][1][1] == fold.text2image_recall_at_k(1)
+    # A single fold with all the images is the full set
+    recalls = evaluator.folds_recall_at_k([5], 10)
+    assert recalls["text2image"][5] == [evaluator.text2image_recall_at_k(5)]
+
+
+def test_ranks_with_variable_captions_per_image(embedded_captions, embedded_images):
+    # 12 images with 3 to 6 captions each
+    image_offsets = np.array([0, 3, 9, 13, 18, 21, 27, 30, 35, 41, 44, 47, 50])
+    embedded_images = np.repeat(
+        embedded_images[image_offsets[:-1]], np.diff(image_offsets), axis=0
+    )
+    image2text_ranks = Evaluator.image2text_ranks(
+        embedded_images, embedded_captions, image_offsets
+    )
+    text2image_ranks = Evaluator.text2image_ranks(
+        embedded_images, embedded_captions, image_offsets
+    )
+    groups = np.repeat(np.arange(12), np.diff(image_offsets))
+    for index, rank in enumerate(image2text_ranks):
+        similarities = np.dot(
+            embedded_images[image_offsets[index]], embedded_captions.T
+        )
+        order = np.argsort(-similarities)
+        assert rank == min(np.where(groups[order] == index)[0])
+    for index, rank in enumerate(text2image_ranks):
+        similarities = np.dot(
+            embedded_captions[index], embedded_images[image_offsets[:-1]].T
+        )
+        assert rank == np.where(np.argsort(-similarities) == groups[index])[0][0]
+    evaluator = Evaluator(50, 6, image_offsets)
+    evaluator.update_embeddings(embedded_images, embedded_captions)
+    recalls = evaluator.folds_recall_at_k([5], 6)
+    fold = Evaluator(23, 6, image_offsets[6:] - 27)
+    fold.update_embeddings(embedded_images[27:], embedded_captions[27:])
+    assert recalls["text2image"][5][1] == fold.text2image_recall_at_k(5)
+
+
+def test_ranks_are_cached_until_update(
+    embedded_captions, embedded_images, num_samples, num_features
+):
+    evaluator = Evaluator(num_samples, num_features)
+    evaluator.update_embeddings(embedded_images, embedded_captions)
+    ranks = evaluator.get_ranks("text2image")
+    assert evaluator.get_ranks("text2image") is ranks
+    evaluator.reset_all_vars()
+    evaluator.update_embeddings(embedded_captions, embedded_images)
+    assert evaluator.get_ranks("text2image") is not ranks
+
+
+def test_save_and_load_ranks(
+    embedded_captions, embedded_images, num_samples, num_features, tmp_path
+):
+    evaluator = Evaluator(num_samples, num_features)
+    evaluator.update_embeddings(embedded_images, embedded_captions)
+    ranks_path = str(tmp_path / "ranks.npz")
+    evaluator.save_ranks(ranks_path)
+    ranks = Evaluator.load_ranks(ranks_path)
+    np.testing.assert_equal(ranks["image2text"], evaluator.get_ranks("image2text"))
+
+
+def test_bootstrap_recall_at_k():
+    np.random.seed(42)
+    ranks = np.random.randint(0, 20, 1000)
+    recall, low, high = Evaluator.bootstrap_recall_at_k(ranks, 5, 10000, 0.95)
+    assert recall == np.mean(ranks < 5)
+    assert low < recall < high
+    # Close to the normal approximation of the binomial
+    std = np.sqrt(recall * (1 - recall) / 1000)
+    assert abs((high - low) - 2 * 1.96 * std) < 0.01
+    # Agrees with resampling the queries
+    resampled = np.random.randint(0, 1000, (2000, 1000))
+    recalls = np.mean(ranks[resampled] < 5, axis=1)
+    assert abs(np.quantile(recalls, 0.025) - low) < 0.01
+
+
+def test_paired_bootstrap_test():
+    np.random.seed(42)
+    ranks_a = np.random.randint(0, 20, 1000)
+    ranks_b = ranks_a.copy()
+    difference, low, high, p_value = Evaluator.paired_bootstrap_test(
+        ranks_a, ranks_b, 5, 10000, 0.95
+    )
+    assert difference == low == high == 0.0
+    assert p_value == 1.0
+    # The second model hits 100 more queries
+    ranks_b[np.where(ranks_a >= 5)[0][:100]] = 0
+    difference, low, high, p_value = Evaluator.paired_bootstrap_test(
+        ranks_a, ranks_b, 5, 10000, 0.95
+    )
+    assert difference == 0.1
+    assert 0 < low < difference < high
+    assert p_value < 0.001
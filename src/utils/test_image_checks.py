@@ -0,0 +1,38 @@
+import os
+import pytest
+
+pytest.importorskip("PIL")
+
+from utils.image_checks import check_image, check_images, write_quarantine  # noqa
+from utils.datasets import read_quarantine  # noqa
+
+
+@pytest.fixture
+def image_path():
+    return "data/testing_assets/flickr_images/1000268201_693b08cb0e.jpg"
+
+
+def test_check_image(image_path, tmp_path):
+    assert check_image(image_path, 224) == ""
+    assert check_image(str(tmp_path / "missing.jpg"), 224) == "missing"
+    png_path = str(tmp_path / "image.png")
+    with open(png_path, "wb") as file:
+        file.write(b"\x89PNG\r\n\x1a\n")
+    assert check_image(png_path, 224) == "not a jpeg"
+    truncated_path = str(tmp_path / "truncated.jpg")
+    with open(image_path, "rb") as source, open(truncated_path, "wb") as file:
+        file.write(source.read(200))
+    assert check_image(truncated_path, 224).startswith("not decodable")
+    assert check_image(image_path, 100000).startswith("too small")
+    # Without a minimum size, any size is fine
+    assert check_image(image_path) == ""
+
+
+def test_check_images(image_path, tmp_path):
+    missing_path = str(tmp_path / "missing.jpg")
+    problems = check_images([image_path, missing_path, image_path], 224, 2, 1)
+    assert problems == {missing_path: "missing"}
+    quarantine_path = str(tmp_path / "quarantine.txt")
+    write_quarantine(quarantine_path, problems)
+    assert read_quarantine(quarantine_path) == {missing_path}
+    assert os.path.isfile(quarantine_path)
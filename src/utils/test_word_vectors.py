@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from utils.word_vectors import WordVectors, unknown_word
+
+
+@pytest.fixture
+def captions():
+    return ["a dog runs", "a cat sleeps", "a dog sleeps"]
+
+
+@pytest.fixture
+def glove_path(tmp_path):
+    path = tmp_path / "glove.txt"
+    path.write_text("dog 1.0 2.0 3.0\nsleeps 4.0 5.0 6.0\nhouse 7.0 8.0 9.0\n")
+    return str(path)
+
+
+def test_build_vocabulary(captions):
+    vocabulary = WordVectors.build_vocabulary(captions)
+    assert vocabulary == [unknown_word, "a", "dog", "sleeps", "cat", "runs"]
+
+
+def test_build_vocabulary_min_count(captions):
+    vocabulary = WordVectors.build_vocabulary(captions, min_count=2)
+    assert vocabulary == [unknown_word, "a", "dog", "sleeps"]
+
+
+def test_build_and_lookup(captions, glove_path, tmp_path):
+    word_vectors_dir = str(tmp_path / "word_vectors")
+    WordVectors.build(glove_path, captions, word_vectors_dir)
+    word_vectors = WordVectors(word_vectors_dir)
+    assert isinstance(word_vectors.vectors, np.memmap)
+    assert word_vectors.dim == 3
+    with open(word_vectors.vocabulary_path) as file:
+        vocabulary = file.read().split()
+    word_ids = np.array([[vocabulary.index("dog"), vocabulary.index("cat"), 0]])
+    vectors = word_vectors.lookup(word_ids)
+    assert vectors.shape == (1, 3, 3)
+    assert vectors.dtype == np.float32
+    np.testing.assert_equal(vectors[0, 0], [1.0, 2.0, 3.0])
+    np.testing.assert_equal(vectors[0, 1], [0.0, 0.0, 0.0])
+    np.testing.assert_equal(vectors[0, 2], [0.0, 0.0, 0.0])
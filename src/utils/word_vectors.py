@@ -0,0 +1,117 @@
+import os
+import logging
+from collections import Counter
+from typing import List
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+unknown_word = "<unk>"
+
+
+class WordVectors:
+    # Pretrained word vectors stored as a memory mapped matrix
+    def __init__(self, word_vectors_dir: str):
+        """Opens the word vectors created by WordVectors.build.
+
+        The matrix is memory mapped, so nothing is read from the disk until a word is
+        looked up and all processes using the same file share the page cache.
+
+        Args:
+            word_vectors_dir: Directory with the vectors.npy and vocabulary.txt files.
+        """
+        self.vocabulary_path = self.get_vocabulary_path(word_vectors_dir)
+        self.vectors = np.load(self.get_vectors_path(word_vectors_dir), mmap_mode="r")
+        self.dim = self.vectors.shape[1]
+        logger.info("Object variables set...")
+
+    @staticmethod
+    def get_vectors_path(word_vectors_dir: str) -> str:
+        return os.path.join(word_vectors_dir, "vectors.npy")
+
+    @staticmethod
+    def get_vocabulary_path(word_vectors_dir: str) -> str:
+        return os.path.join(word_vectors_dir, "vocabulary.txt")
+
+    @staticmethod
+    def build_vocabulary(captions: List[str], min_count: int = 1) -> List[str]:
+        """Builds the vocabulary of the captions, where the first word is reserved for
+        the unknown words and the rest are sorted by frequency.
+
+        Args:
+            captions: Pre-processed captions where the words are separated by space.
+            min_count: The minimum times a word has to appear to be included.
+
+        Returns:
+            The vocabulary.
+
+        """
+        counter: Counter = Counter()
+        for caption in captions:
+            counter.update(caption.split())
+        words = sorted(
+            (word for word, count in counter.items() if count >= min_count),
+            key=lambda word: (-counter[word], word),
+        )
+
+        return [unknown_word] + words
+
+    @staticmethod
+    def build(
+        glove_path: str, captions: List[str], word_vectors_dir: str, min_count: int = 1
+    ) -> None:
+        """Builds the vocabulary from the captions and writes the pretrained vectors
+        of its words as a matrix that can be memory mapped. The words which do not
+        have a pretrained vector, as well as the unknown word, are zeros.
+
+        Args:
+            glove_path: Path to word vectors in the GloVe text format.
+            captions: Pre-processed captions where the words are separated by space.
+            word_vectors_dir: Where to write the vectors.npy and vocabulary.txt files.
+            min_count: The minimum times a word has to appear to be included.
+
+        Returns:
+            None
+
+        """
+        vocabulary = WordVectors.build_vocabulary(captions, min_count)
+        word_to_id = {word: index for index, word in enumerate(vocabulary)}
+        os.makedirs(word_vectors_dir, exist_ok=True)
+        vectors = None
+        found = 0
+        with open(glove_path, "r", encoding="utf-8") as file:
+            for line in file:
+                word, _, values = line.rstrip().partition(" ")
+                if vectors is None:
+                    vectors = np.lib.format.open_memmap(
+                        WordVectors.get_vectors_path(word_vectors_dir),
+                        mode="w+",
+                        dtype=np.float32,
+                        shape=(len(vocabulary), len(values.split())),
+                    )
+                if word in word_to_id and word != unknown_word:
+                    vectors[word_to_id[word]] = np.array(
+                        values.split(), dtype=np.float32
+                    )
+                    found += 1
+        if vectors is None:
+            raise ValueError(f"No word vectors found in {glove_path}")
+        vectors.flush()
+        with open(WordVectors.get_vocabulary_path(word_vectors_dir), "w") as file:
+            for word in vocabulary:
+                file.write(word + "\n")
+        logger.info(f"Found pretrained vectors for {found}/{len(vocabulary) - 1} words")
+
+    def lookup(self, word_ids: np.ndarray) -> np.ndarray:
+        """Gathers the vectors of the words.
+
+        Args:
+            word_ids: The word ids of any shape.
+
+        Returns:
+            The vectors with shape word_ids.shape + (dim,).
+
+        """
+        return np.asarray(self.vectors[word_ids], dtype=np.float32)
@@ -0,0 +1,159 @@
+import argparse
+import logging
+import os
+import time
+from collections import Counter
+from typing import List
+
+from utils.archives import resolve_images_path
+from utils.datasets import FlickrDataset, PascalSentencesDataset, TrainCocoDataset
+from utils.image_checks import check_images, write_quarantine
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def get_image_paths(dataset_name: str, images_path: str, texts_path: str) -> List[str]:
+    # All the images of a dataset with captions, whatever their split
+    if dataset_name == "flickr":
+        dataset = FlickrDataset(images_path, texts_path)
+        return [
+            os.path.join(dataset.images_path, image_name)
+            for image_name in dataset.img_path_caption.keys()
+        ]
+    if dataset_name == "pascal":
+        return PascalSentencesDataset(images_path, texts_path).image_paths
+    if dataset_name == "coco":
+        return list(TrainCocoDataset(images_path, texts_path).id_to_filename.values())
+    raise ValueError("Wrong dataset name!")
+
+
+def validate(
+    dataset_name: str,
+    images_path: str,
+    texts_path: str,
+    quarantine_path: str,
+    min_size: int,
+    num_workers: int,
+    chunk_size: int,
+    archive_index_dir: str = None,
+) -> None:
+    """Checks every image of a dataset before training, so that a missing, truncated
+    or tiny image is found in minutes instead of failing a training run, and writes
+    the broken images to a quarantine list that the datasets leave out.
+
+    Args:
+        dataset_name: Which dataset, flickr, pascal or coco.
+        images_path: Path where all images are.
+        texts_path: The captions, i.e. the Flickr token file, the Pascal sentence
+        directory or the COCO json file.
+        quarantine_path: Where to write the quarantine list.
+        min_size: The minimum length of both sides of an image, 0 to not check it.
+        num_workers: The number of worker processes.
+        chunk_size: How many images a worker checks per task.
+        archive_index_dir: A writable directory for the index of an archive on
+        read-only storage, so that it is built once and loaded by every worker.
+
+    Returns:
+        None
+
+    """
+    # Indexing the archive here, the datasets and the workers find it already open
+    resolve_images_path(images_path, archive_index_dir)
+    image_paths = get_image_paths(dataset_name, images_path, texts_path)
+    logger.info(f"Checking {len(image_paths)} images with {num_workers} workers...")
+    start = time.perf_counter()
+    problems = check_images(
+        image_paths, min_size, num_workers, chunk_size, archive_index_dir
+    )
+    logger.info(f"Checked in {time.perf_counter() - start:.1f} s")
+    reasons = Counter(problem.split(":")[0] for problem in problems.values())
+    for reason, count in reasons.most_common():
+        logger.info(f"{count} images {reason}")
+    write_quarantine(quarantine_path, problems)
+    logger.info(f"{len(problems)} images quarantined in {quarantine_path}")
+
+
+def main():
+    # Without the main sentinel, the code would be executed even if the script were
+    # imported as a module.
+    args = parse_args()
+    validate(
+        args.dataset_name,
+        args.images_path,
+        args.texts_path,
+        args.quarantine_path,
+        args.min_size,
+        args.num_workers,
+        args.chunk_size,
+        args.archive_index_dir,
+    )
+
+
+def parse_args():
+    """Parse command line arguments.
+
+    Returns:
+        Arguments
+
+    """
+    parser = argparse.ArgumentParser(
+        description="Checks the images of a dataset and quarantines the broken ones."
+    )
+    parser.add_argument(
+        "--dataset_name",
+        type=str,
+        default="flickr",
+        choices=["flickr", "pascal", "coco"],
+        help="Which dataset to check.",
+    )
+    parser.add_argument(
+        "--images_path",
+        type=str,
+        default="data/Flickr8k_dataset/Flickr8k_Dataset",
+        help="Path where all images are.",
+    )
+    parser.add_argument(
+        "--texts_path",
+        type=str,
+        default="data/Flickr8k_dataset/Flickr8k_text/Flickr8k.token.txt",
+        help="The Flickr token file, the Pascal sentence dir or the COCO json file.",
+    )
+    parser.add_argument(
+        "--quarantine_path",
+        type=str,
+        default="data/quarantine.txt",
+        help="Where to write the broken images.",
+    )
+    parser.add_argument(
+        "--min_size",
+        type=int,
+        default=0,
+        help="The minimum length of both sides of an image, 0 to not check it. The "
+        "loaders resize every image before cropping it, so any size works.",
+    )
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=os.cpu_count(),
+        help="The number of worker processes.",
+    )
+    parser.add_argument(
+        "--chunk_size",
+        type=int,
+        default=64,
+        help="How many images a worker checks per task.",
+    )
+    parser.add_argument(
+        "--archive_index_dir",
+        type=str,
+        default=None,
+        help="Where to keep the index of an archive on read-only storage, by default "
+        "next to the archive.",
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
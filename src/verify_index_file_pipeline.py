@@ -0,0 +1,70 @@
+import argparse
+import logging
+import sys
+
+from retrieval.index_file import IndexFile
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def verify(index_path: str, check_data: bool) -> bool:
+    """Checks that an index file is consistent and logs what it holds.
+
+    Args:
+        index_path: The index file.
+        check_data: Whether to also check the checksums of the embeddings and of the
+        table, which reads the whole file.
+
+    Returns:
+        Whether the index file is valid.
+
+    """
+    problems = IndexFile.verify(index_path, check_data)
+    for problem in problems:
+        logger.error(problem)
+    if problems:
+        return False
+    index = IndexFile(index_path)
+    logger.info(
+        f"{index_path} is valid: {index.count} embeddings of dim {index.dim} "
+        f"({index.dtype}), model {index.model_id or 'unknown'}, quantizer "
+        f"{index.quantizer_name or 'none'}"
+    )
+
+    return True
+
+
+def main():
+    # Without the main sentinel, the code would be executed even if the script were
+    # imported as a module.
+    args = parse_args()
+    if not verify(args.index_path, not args.skip_data):
+        sys.exit(1)
+
+
+def parse_args():
+    """Parse command line arguments.
+
+    Returns:
+        Arguments
+
+    """
+    parser = argparse.ArgumentParser(description="Verifies an index file.")
+    parser.add_argument(
+        "--index_path",
+        type=str,
+        default="models/image_index.bin",
+        help="Where the index file is.",
+    )
+    parser.add_argument(
+        "--skip_data",
+        action="store_true",
+        help="Only check the structure, not the checksums of the data.",
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()